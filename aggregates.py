@@ -0,0 +1,243 @@
+"""
+aggregates.py
+-------------
+This file computes sentiment statistics per year, month or subreddit in SQL, straight from the
+per-comment scores in the `comment_sentiment` table.
+
+Includes:
+- refresh_stats: Recomputes the statistics in the `sentiment_stats` table. Only the buckets holding
+                 comments scored, rescored or removed since the last refresh are recomputed, and
+                 only the comment scores of those buckets are read. The triggers added by
+                 migrations 4, 10 and 11 in setup.py keep track of them, including the buckets
+                 of deleted posts and articles.
+- get_stats: Returns one BucketStats row per bucket of a grain, for the plotting scripts.
+
+Each bucket holds the total, count, Negative/Neutral/Positive histogram, mean, minimum and
+maximum of its comment scores, plus its most divided article: the one with the largest spread
+between its most positive and most negative comment.
+
+Usage:
+- Refresh and print the statistics: `python aggregates.py --grain year`
+- Recompute every bucket from scratch: `python aggregates.py --full`
+
+Details:
+- Articles stored before publication dates were kept fall back to the year inferred from their
+  position, the same way dump_to_csv.py does. They have no month, and posts stored before
+  subreddits were kept have no subreddit, so those are left out of the month and subreddit grains.
+- A submission found for several articles is stored once and linked to from the others
+  (dedup.py). Its comment scores count for every article it was found for. A comment that nearly
+  repeats another one is linked to it and has no score of its own, so the opinion is counted
+  once, where it was first seen.
+- Fallback years are stored in `sentiment_stats_years` at each refresh. When adding or deleting
+  articles moves one to another year, both years are recomputed.
+"""
+
+import argparse
+from collections import namedtuple
+from db import open_db, DEFAULT_DB
+
+# Bucket expression of each grain, over the `posts` rows below
+GRAINS = {
+    "year": "CAST(year AS TEXT)",
+    "month": "substr(pub_date, 1, 7)",
+    "subreddit": "subreddit",
+}
+
+# The year each article without a publication date falls back to, from its position in export
+# order, the way get_year() in dump_to_csv.py does
+FALLBACK_YEARS = """
+    SELECT article_id,
+           CASE
+               WHEN position < 25 THEN 2019
+               WHEN position < 50 THEN 2020
+               WHEN position < 75 THEN 2021
+               ELSE 2022
+           END
+    FROM (
+        SELECT article_id, pub_date,
+               ROW_NUMBER() OVER (ORDER BY article_id) - 1 AS position
+        FROM news
+    )
+    WHERE pub_date IS NULL
+"""
+
+# Every post with the article fields it can be grouped by. A linked submission has no scores of
+# its own and counts those of the first copy (`post_id`), as in dump_to_csv.py. Fallback years
+# are read from `sentiment_stats_years`, which refresh_stats keeps up to date
+POSTS = """
+    posts AS (
+        SELECT COALESCE(r.duplicate_of, r.id) AS post_id, n.article_id, n.pub_date, r.subreddit,
+               COALESCE(CAST(substr(n.pub_date, 1, 4) AS INTEGER), y.year) AS year
+        FROM reddit_posts r
+        JOIN news n ON n.article_id = r.article_id
+        LEFT JOIN sentiment_stats_years y ON y.article_id = n.article_id
+    )
+"""
+
+COLUMNS = [
+    "total",
+    "count",
+    "negative",
+    "neutral",
+    "positive",
+    "min_polarity",
+    "max_polarity",
+    "max_spread",
+    "max_spread_article_id",
+]
+
+BucketStats = namedtuple("BucketStats", ["bucket", *COLUMNS, "mean"])
+
+
+def _refresh_years(connection):
+    """Store the current fallback years, marking the years of articles that moved as dirty."""
+    connection.execute("DELETE FROM temp.fallback_years")
+    connection.execute(f"INSERT INTO temp.fallback_years {FALLBACK_YEARS}")
+    connection.execute(
+        """
+        INSERT OR IGNORE INTO sentiment_stats_dirty_buckets (grain, bucket)
+        SELECT 'year', CAST(year AS TEXT) FROM (
+            SELECT f.year FROM temp.fallback_years f
+            LEFT JOIN sentiment_stats_years y ON y.article_id = f.article_id
+            WHERE y.year IS NOT f.year
+            UNION
+            SELECT y.year FROM sentiment_stats_years y
+            LEFT JOIN temp.fallback_years f ON f.article_id = y.article_id
+            WHERE f.year IS NOT y.year
+        )
+    """
+    )
+    connection.execute("DELETE FROM sentiment_stats_years")
+    connection.execute("INSERT INTO sentiment_stats_years SELECT * FROM temp.fallback_years")
+
+
+def _dirty_buckets(connection, grain):
+    """Insert the buckets of `grain` to recompute into a temp table: those of the posts in
+    `sentiment_stats_dirty`, and those recorded when rows were deleted."""
+    bucket = GRAINS[grain]
+    connection.execute(
+        f"""
+        INSERT INTO temp.dirty_buckets
+        WITH {POSTS}
+        SELECT {bucket} FROM posts
+        WHERE post_id IN (SELECT post_id FROM sentiment_stats_dirty) AND {bucket} IS NOT NULL
+        UNION
+        SELECT bucket FROM sentiment_stats_dirty_buckets WHERE grain = ?
+    """,
+        (grain,),
+    )
+
+
+def _bucket_posts(connection, grain, incremental):
+    """Insert (post_id, article_id, bucket) of the posts to aggregate into a temp table, limited
+    to the dirty buckets if `incremental`, so only their comment scores are read."""
+    bucket = GRAINS[grain]
+    only_dirty = f"AND {bucket} IN (SELECT bucket FROM temp.dirty_buckets)" if incremental else ""
+    connection.execute(
+        f"""
+        INSERT INTO temp.bucket_posts
+        WITH {POSTS}
+        SELECT post_id, article_id, {bucket} FROM posts
+        WHERE {bucket} IS NOT NULL {only_dirty}
+    """
+    )
+
+
+def _compute(connection, grain):
+    """Insert freshly computed rows for `grain`, for the posts in temp.bucket_posts."""
+    connection.execute(
+        f"""
+        INSERT INTO sentiment_stats (grain, bucket, {", ".join(COLUMNS)})
+        WITH scored AS (
+            SELECT p.bucket, p.article_id, cs.polarity
+            FROM temp.bucket_posts p
+            JOIN comment_sentiment cs ON cs.post_id = p.post_id
+        ),
+        spreads AS (
+            SELECT bucket, article_id, MAX(polarity) - MIN(polarity) AS spread,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY bucket
+                       ORDER BY MAX(polarity) - MIN(polarity) DESC, article_id
+                   ) AS rank
+            FROM scored
+            GROUP BY bucket, article_id
+        )
+        SELECT ?, f.bucket,
+               SUM(f.polarity), COUNT(*),
+               SUM(f.polarity < 0), SUM(f.polarity = 0), SUM(f.polarity > 0),
+               MIN(f.polarity), MAX(f.polarity),
+               s.spread, s.article_id
+        FROM scored f
+        JOIN spreads s ON s.bucket = f.bucket AND s.rank = 1
+        GROUP BY f.bucket
+    """,
+        (grain,),
+    )
+
+
+def refresh_stats(connection, grains=tuple(GRAINS), full=False):
+    """Bring `sentiment_stats` up to date. Returns the number of buckets recomputed."""
+    refreshed = 0
+    with connection:  # The statistics and the dirty lists change together, or not at all
+        connection.execute("CREATE TEMP TABLE IF NOT EXISTS fallback_years (article_id, year)")
+        connection.execute("CREATE TEMP TABLE IF NOT EXISTS dirty_buckets (bucket TEXT)")
+        connection.execute(
+            """
+            CREATE TEMP TABLE IF NOT EXISTS bucket_posts (
+                post_id INTEGER, article_id INTEGER, bucket TEXT
+            )
+        """
+        )
+        _refresh_years(connection)
+        for grain in grains:
+            connection.execute("DELETE FROM temp.bucket_posts")
+            if full:
+                connection.execute("DELETE FROM sentiment_stats WHERE grain = ?", (grain,))
+            else:
+                connection.execute("DELETE FROM temp.dirty_buckets")
+                _dirty_buckets(connection, grain)
+                # Buckets whose comments all disappeared are dropped here and not recomputed
+                connection.execute(
+                    """
+                    DELETE FROM sentiment_stats
+                    WHERE grain = ? AND bucket IN (SELECT bucket FROM temp.dirty_buckets)
+                """,
+                    (grain,),
+                )
+            _bucket_posts(connection, grain, incremental=not full)
+            before = connection.total_changes
+            _compute(connection, grain)
+            refreshed += connection.total_changes - before
+        connection.execute("DELETE FROM sentiment_stats_dirty")
+        connection.execute("DELETE FROM sentiment_stats_dirty_buckets")
+    return refreshed
+
+
+def get_stats(connection, grain="year"):
+    """Return the stored BucketStats of every bucket in `grain`, ordered by bucket."""
+    rows = connection.execute(
+        f"""
+        SELECT bucket, {", ".join(COLUMNS)}, total / count
+        FROM sentiment_stats WHERE grain = ? ORDER BY bucket
+    """,
+        (grain,),
+    )
+    return [BucketStats(*row) for row in rows]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument("--grain", choices=list(GRAINS), default="year")
+    parser.add_argument("--full", action="store_true")
+    args = parser.parse_args()
+
+    with open_db(args.db) as connection:
+        refreshed = refresh_stats(connection, full=args.full)
+        print(f"Recomputed {refreshed} buckets.")
+        for stats in get_stats(connection, args.grain):
+            print(
+                f"{stats.bucket}: {stats.count} comments, mean {stats.mean:.3f}, "
+                f"{stats.negative}/{stats.neutral}/{stats.positive} negative/neutral/positive, "
+                f"most divided article {stats.max_spread_article_id} ({stats.max_spread:.3f})"
+            )
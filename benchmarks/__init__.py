@@ -0,0 +1,19 @@
+"""
+benchmarks
+----------
+Offline benchmarks for the data collection pipeline. Each module runs against local fake
+API backends and a throwaway database, so no API keys or network access are needed.
+
+Usage (from the repository root):
+- `python -m benchmarks.bench_search_reddit`
+- `python -m benchmarks.bench_get_summaries`
+- `python -m benchmarks.bench_indexes`
+- `python -m benchmarks.bench_relevance`
+- `python -m benchmarks.bench_summarizers`
+- `python -m benchmarks.bench_sentiment`
+- `python -m benchmarks.bench_pipeline`
+- `python -m benchmarks.bench_dedup`
+- `python -m benchmarks.bench_imports`: Fails if an import or `cli.py --help` goes over its time budget.
+- `python -m benchmarks.suite`: Times, profiles and memory-traces every stage on a synthetic
+  database (`python -m benchmarks.synthetic`) and writes a JSON report.
+"""
@@ -0,0 +1,251 @@
+"""
+bench_dedup.py
+--------------
+Measures near-duplicate comment detection (dedup.py): how fast comments are checked against the
+LSH index, and how many planted copies it finds.
+
+A share of the generated comments are copies of earlier ones with one word changed, as when a
+comment is pasted into another thread and edited. Every other comment is new. Copies of a stored
+comment whose shingles overlap its shingles by at least dedup.THRESHOLD should be linked; one
+changed word in a short comment leaves less overlap than that. A copy of a linked copy is only
+compared with the stored comment, two edits away. New comments should never be linked.
+
+Before measuring, it checks that search_reddit.py stores every comment when one submission's
+comments repeat a stored comment and a comment queued earlier in the same batch, and that a
+crosspost of a submission whose write was dropped is stored with its comments. It exits with
+status 1 if any is lost or linked wrongly.
+
+Usage:
+- `python -m benchmarks.bench_dedup --comments 20000 --copies 0.2`
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from benchmarks.synthetic import FILLER, OPINIONS, TOPICS
+from db import connect, BulkWriter
+from dedup import Deduplicator, queue_index, shingles, THRESHOLD
+from jobs import claim, SEARCH
+from search_reddit import save_reddit_posts
+from setup import setup_database
+
+WORDS = FILLER + OPINIONS + TOPICS
+COMMENTS_PER_POST = 10
+
+
+def make_comments(rng, count, copies):
+    """Return [(body, index of the comment it copies or None)]."""
+    comments = []
+    for _ in range(count):
+        if comments and rng.random() < copies:
+            original = rng.randrange(len(comments))
+            words = comments[original][0].split()
+            words[rng.randrange(len(words))] = rng.choice(WORDS)
+            comments.append((" ".join(words), original))
+        else:
+            comments.append((" ".join(rng.choices(WORDS, k=rng.randint(12, 60))), None))
+    return comments
+
+
+def jaccard(text, other):
+    text, other = shingles(text), shingles(other)
+    return len(text & other) / len(text | other)
+
+
+STORED = "the senate vote on the spending bill was delayed again because of the holiday recess"
+REPEATED = "nobody in these comments seems to have read past the headline of the article at all"
+
+
+def check_queued_originals(path):
+    """Store comments that repeat a stored comment and a queued one, as search_reddit.py does.
+
+    Article 1 stores c1. Article 2 then finds c2, a copy of c1, and c3, a new comment, on one
+    submission, and c4, a copy of c3, on another, all in the same batch. Returns the problems
+    found, if any.
+    """
+    setup_database(db=path)
+    connection = connect(path)
+    connection.executemany(
+        "INSERT INTO news (article_id, title, url) VALUES (?, 'Title', 'url')", [(1,), (2,)]
+    )
+    connection.commit()
+    first, second = sorted(claim(connection, SEARCH, 2), key=lambda job: job.article_id)
+    deduplicator = Deduplicator(connection)
+    with BulkWriter(connection) as writer:
+        post = (1, "p1", "Title", "https://example.com/1", "news", [("c1", STORED, 1, 1)])
+        save_reddit_posts(writer, first, [post], deduplicator)
+        writer.flush()
+        posts = [
+            (2, "p2", "Title", "https://example.com/2", "news",
+             [("c2", STORED, 1, 1), ("c3", REPEATED, 1, 1)]),
+            (2, "p3", "Title", "https://example.com/3", "news", [("c4", REPEATED, 1, 1)]),
+        ]  # fmt: skip
+        save_reddit_posts(writer, second, posts, deduplicator)
+    stored = {
+        comment_id: (row_id, body, duplicate_of)
+        for comment_id, row_id, body, duplicate_of in connection.execute(
+            "SELECT comment_id, id, body, duplicate_of FROM reddit_comments"
+        )
+    }
+    connection.close()
+
+    expected = {"c1": (STORED, None), "c2": ("", "c1"), "c3": (REPEATED, None), "c4": ("", "c3")}
+    problems = []
+    for comment_id, (body, original) in expected.items():
+        if comment_id not in stored:
+            problems.append(f"{comment_id} was not stored")
+            continue
+        _, stored_body, duplicate_of = stored[comment_id]
+        original_id = stored[original][0] if original in stored else None
+        if stored_body != body or duplicate_of != original_id:
+            problems.append(f"{comment_id} should {'link to ' + original if original else 'keep its text'}")
+    return problems
+
+
+def check_dropped_first_copies(path):
+    """Save crossposts of submissions whose own writes were dropped, as search_reddit.py does.
+
+    Article 1's writer fails before flushing, then article 2 finds a crosspost of its submission.
+    Article 3 has lost its search lease, and article 4 finds a crosspost of its submission in the
+    same batch. Article 5 then finds a crosspost of article 2's, which was stored. Returns the
+    problems found, if any.
+    """
+    setup_database(db=path)
+    connection = connect(path)
+    connection.executemany(
+        "INSERT INTO news (article_id, title, url) VALUES (?, 'Title', 'url')",
+        [(article_id,) for article_id in range(1, 6)],
+    )
+    connection.commit()
+    jobs = sorted(claim(connection, SEARCH, 5), key=lambda job: job.article_id)
+    deduplicator = Deduplicator(connection)
+
+    def post(article_id, reddit_id, url):
+        comment = (f"c{reddit_id}", f"{REPEATED} {reddit_id}", 1, 1)
+        return (article_id, reddit_id, "Title", url, "news", [comment])
+
+    crosspost_of = "https://www.reddit.com/r/news/comments/{}/title/".format
+    try:
+        with BulkWriter(connection) as writer:
+            save_reddit_posts(writer, jobs[0], [post(1, "a", "https://example.com/a")], deduplicator)
+            raise RuntimeError("the writer fails before flushing")
+    except RuntimeError:
+        pass
+    with BulkWriter(connection) as writer:
+        save_reddit_posts(writer, jobs[1], [post(2, "b", crosspost_of("a"))], deduplicator)
+    with BulkWriter(connection) as writer:
+        lost_lease = jobs[2]._replace(token="taken over")
+        save_reddit_posts(writer, lost_lease, [post(3, "c", "https://example.com/c")], deduplicator)
+        save_reddit_posts(writer, jobs[3], [post(4, "d", crosspost_of("c"))], deduplicator)
+    with BulkWriter(connection) as writer:
+        save_reddit_posts(writer, jobs[4], [post(5, "e", crosspost_of("a"))], deduplicator)
+    stored = {
+        reddit_id: (duplicate_of, comments)
+        for reddit_id, duplicate_of, comments in connection.execute(
+            """
+            SELECT p.reddit_id, p.duplicate_of, COUNT(c.id) FROM reddit_posts p
+            LEFT JOIN reddit_comments c ON c.post_id = p.id GROUP BY p.id
+        """
+        )
+    }
+    first_copy = connection.execute("SELECT id FROM reddit_posts WHERE reddit_id = 'b'").fetchone()
+    connection.close()
+
+    problems = [f"{reddit_id} was stored" for reddit_id in "ac" if reddit_id in stored]
+    for reddit_id in "bd":
+        if stored.get(reddit_id) != (None, 1):
+            problems.append(f"{reddit_id} should be stored as a first copy with its comment")
+    if stored.get("e") != (first_copy and first_copy[0], 0):
+        problems.append("e should link to b, without comments of its own")
+    return problems
+
+
+def run(comments, path):
+    setup_database(db=path)
+    connection = connect(path)
+    connection.execute("INSERT INTO news (article_id, title, url) VALUES (1, 'Title', 'url')")
+    posts = range(0, len(comments), COMMENTS_PER_POST)
+    connection.executemany(
+        "INSERT INTO reddit_posts (article_id, reddit_id, fingerprint) VALUES (1, ?, ?)",
+        ((f"p{start}", f"p{start}") for start in posts),
+    )
+    connection.commit()
+
+    deduplicator = Deduplicator(connection)
+    found = {}
+    checking = 0.0
+    with BulkWriter(connection) as writer:
+        for start in posts:
+            batch = comments[start : start + COMMENTS_PER_POST]
+            began = time.perf_counter()
+            checked = deduplicator.check_comments(1, f"p{start}", [body for body, _ in batch])
+            checking += time.perf_counter() - began
+            for position, ((body, _), (original, signature, keys)) in enumerate(
+                zip(batch, checked), start=1
+            ):
+                if original is not None:
+                    found[start + position - 1] = original
+                    continue
+                writer.add(
+                    "INSERT INTO reddit_comments (post_id, position, body) "
+                    "SELECT id, ?, ? FROM reddit_posts WHERE reddit_id = ?",
+                    (position, body, f"p{start}"),
+                )
+                if signature is not None:
+                    queue_index(writer, 1, f"p{start}", position, signature, keys)
+    connection.close()
+    return found, checking
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--comments", type=int, default=20000)
+    parser.add_argument("--copies", type=float, default=0.2, help="share of comments that are copies")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    checks = {
+        "Comments repeating stored and queued comments": check_queued_originals,
+        "Crossposts of submissions whose writes were dropped": check_dropped_first_copies,
+    }
+    for description, check in checks.items():
+        with tempfile.TemporaryDirectory() as tmp:
+            problems = check(os.path.join(tmp, "news.db"))
+        if problems:
+            print(f"{description}: {'; '.join(problems)}")
+            sys.exit(1)
+        print(f"{description} are all stored and linked.")
+    print()
+
+    comments = make_comments(random.Random(args.seed), args.comments, args.copies)
+    planted = {index for index, (_, original) in enumerate(comments) if original is not None}
+    with tempfile.TemporaryDirectory() as tmp:
+        found, checking = run(comments, os.path.join(tmp, "news.db"))
+    similar = {
+        index
+        for index in planted
+        if (source := comments[index][1]) not in found
+        and jaccard(comments[index][0], comments[source][0]) >= THRESHOLD
+    }
+
+    caught = len(planted & found.keys())
+    false_links = len(found.keys() - planted)
+    print(
+        f"{'comments checked':>24}: {len(comments)} in {checking:.2f}s "
+        f"({len(comments) / checking:,.0f}/s)"
+    )
+    print(f"{'planted copies':>24}: {len(planted)}")
+    print(f"{'copies linked':>24}: {caught} ({caught / max(len(planted), 1):.1%})")
+    caught_similar = len(similar & found.keys())
+    print(
+        f"{'similar copies linked':>24}: {caught_similar} of {len(similar)} "
+        f"({caught_similar / max(len(similar), 1):.1%}, similarity to a stored comment >= {THRESHOLD})"
+    )
+    print(f"{'new comments linked':>24}: {false_links}")
+
+
+if __name__ == "__main__":
+    main()
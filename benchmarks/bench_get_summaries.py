@@ -0,0 +1,96 @@
+"""
+bench_get_summaries.py
+----------------------
+Compares one-article-per-request summarization with batched, overlapping requests against
+FakeTextAnalyticsClient, and checks every summary was stored under the right article.
+
+Usage:
+- `python -m benchmarks.bench_get_summaries --articles 100 --in-flight 4 --latency 0.5`
+"""
+
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+from benchmarks.fakes import FakeTextAnalyticsClient
+from get_summaries import summarize_comments
+from setup import setup_database
+from summarizers import AzureSummarizer, MAX_DOCUMENTS_PER_REQUEST
+
+
+def make_database(path, n_articles):
+    setup_database(db=path)
+    connection = sqlite3.connect(path)
+    connection.executemany(
+        "INSERT INTO news (article_id, title, url, is_searched) VALUES (?, ?, ?, 1)",
+        (
+            (i, f"Article {i} headline", f"https://example.com/{i}")
+            for i in range(1, n_articles + 1)
+        ),
+    )
+    connection.executemany(
+        "INSERT INTO reddit_posts (id, article_id, reddit_title, reddit_url) VALUES (?, ?, ?, ?)",
+        (
+            (i, i, f"Thread {i}", f"https://reddit.com/{i}")
+            for i in range(1, n_articles + 1)
+        ),
+    )
+    connection.executemany(
+        "INSERT INTO reddit_comments (post_id, position, body) VALUES (?, 1, ?)",
+        ((i, "a headline take") for i in range(1, n_articles + 1)),
+    )
+    connection.commit()
+    connection.close()
+
+
+def run(n_articles, batch_size, in_flight, latency):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = os.path.join(tmp, "news.db")
+        make_database(db, n_articles)
+        client = FakeTextAnalyticsClient(latency=latency)
+
+        start = time.perf_counter()
+        summarizer = AzureSummarizer(client, batch_size=batch_size, in_flight=in_flight)
+        summarize_comments(summarizer, limit=n_articles, db=db)
+        elapsed = time.perf_counter() - start
+
+        connection = sqlite3.connect(db)
+        mismatched = connection.execute(
+            """
+            SELECT COUNT(*) FROM news n
+            LEFT JOIN article_summaries s ON s.article_id = n.article_id
+            WHERE s.summary IS NULL OR s.summary NOT LIKE 'Article ' || n.article_id || ' headline%'
+        """
+        ).fetchone()[0]
+        connection.close()
+    return elapsed, len(client.requests), mismatched
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--articles", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=MAX_DOCUMENTS_PER_REQUEST)
+    parser.add_argument("--in-flight", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.5)
+    args = parser.parse_args()
+
+    results = [
+        ("one article per request", run(args.articles, 1, 1, args.latency)),
+        (
+            f"batches of {args.batch_size}, {args.in_flight} in flight",
+            run(args.articles, args.batch_size, args.in_flight, args.latency),
+        ),
+    ]
+
+    print()
+    for label, (elapsed, requests, mismatched) in results:
+        print(
+            f"{label:>36}: {elapsed:6.2f}s  {args.articles / elapsed:7.1f} articles/s  "
+            f"{requests:4d} requests  {mismatched} misplaced summaries"
+        )
+    print(f"{'speedup':>36}: {results[0][1][0] / results[1][1][0]:6.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+bench_imports.py
+----------------
+Checks that the project's modules and command line start quickly. Each import and command runs
+in a fresh interpreter, and must fit its time budget and leave the heavy dependencies (spaCy,
+PRAW, the Azure SDK, matplotlib) unimported until a stage needs them. Exits with status 1 if
+anything is over budget, so it can guard against regressions in CI.
+
+Usage:
+- `python -m benchmarks.bench_imports`
+- On a slower machine, scale every budget: `python -m benchmarks.bench_imports --scale 2`
+- See what an import loads: `python -X importtime -c "import run"`
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY = ["spacy", "spacytextblob", "textblob", "praw", "azure", "matplotlib", "pyarrow"]
+
+# Module: (seconds, heavy modules it may import)
+IMPORT_BUDGETS = {
+    "utils": (0.05, []),
+    "db": (0.05, []),
+    "jobs": (0.05, []),
+    "relevance": (0.05, []),
+    "cache": (0.05, []),
+    "models": (0.05, []),
+    "dedup": (0.2, []),
+    "search_corpus": (0.05, []),
+    "keywords": (0.1, []),
+    "sentiment": (0.3, []),
+    "summarizers": (0.3, []),
+    "search_reddit": (0.4, []),
+    "get_articles": (0.4, []),
+    "get_summaries": (0.5, []),
+    "dump_to_csv": (0.5, []),
+    "plot_data": (0.3, []),
+    "pipeline": (0.6, []),
+    "run": (0.7, []),
+    "cli": (0.05, []),
+    "plot": (1.5, ["matplotlib"]),
+}
+
+# Command line: seconds
+COMMAND_BUDGETS = {
+    ("cli.py", "--help"): 0.2,
+    ("cli.py", "search", "--help"): 0.6,
+    ("cli.py", "summarize", "--help"): 0.7,
+    ("cli.py", "run", "--help"): 0.9,
+}
+
+# Prints the import's duration and every heavy top-level package it loaded
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+heavy = sorted({{name.split(".")[0] for name in sys.modules}} & set({heavy!r}))
+print(json.dumps([elapsed, heavy]))
+"""
+
+
+def time_import(module, repeat):
+    """Fastest of `repeat` imports of `module`, each in a new interpreter, and what it loaded."""
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY)],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        runs.append(json.loads(output.splitlines()[-1]))
+    return min(runs)
+
+
+def time_command(command, repeat):
+    """Fastest of `repeat` runs of `python <command>`, including interpreter startup."""
+    probe = (
+        "import subprocess, sys, time; start = time.perf_counter(); "
+        f"subprocess.run([sys.executable, *{list(command)!r}], stdout=subprocess.DEVNULL, check=True); "
+        "print(time.perf_counter() - start)"
+    )
+    runs = [
+        float(
+            subprocess.run(
+                [sys.executable, "-c", probe], cwd=ROOT, capture_output=True, text=True, check=True
+            ).stdout
+        )
+        for _ in range(repeat)
+    ]
+    return min(runs)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply every budget by this")
+    args = parser.parse_args()
+
+    failures = []
+    for module, (budget, allowed) in IMPORT_BUDGETS.items():
+        budget *= args.scale
+        elapsed, heavy = time_import(module, args.repeat)
+        unexpected = [name for name in heavy if name not in allowed]
+        status = "ok"
+        if elapsed > budget:
+            status = "over budget"
+        if unexpected:
+            status = f"imports {', '.join(unexpected)}"
+        if status != "ok":
+            failures.append(f"import {module}")
+        print(f"{'import ' + module:>32}: {elapsed:6.3f}s  budget {budget:6.3f}s  {status}")
+
+    for command, budget in COMMAND_BUDGETS.items():
+        budget *= args.scale
+        elapsed = time_command(command, args.repeat)
+        label = "python " + " ".join(command)
+        status = "ok" if elapsed <= budget else "over budget"
+        if status != "ok":
+            failures.append(label)
+        print(f"{label:>32}: {elapsed:6.3f}s  budget {budget:6.3f}s  {status}")
+
+    if failures:
+        print(f"\nOver budget: {', '.join(failures)}")
+        sys.exit(1)
+    print("\nEvery import and command is within its budget.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+bench_indexes.py
+----------------
+Shows query plans and timings for the pipeline's hot queries before and after the index
+migration, on a synthetic database with 100k Reddit posts.
+
+Usage:
+- `python -m benchmarks.bench_indexes --posts 100000 --lookups 1000`
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from setup import migrate
+
+POSTS_PER_ARTICLE = 5
+
+# Migration 2 adds the indexes; later migrations reshape the tables these queries read
+INDEX_MIGRATION = 2
+
+QUERIES = {
+    "posts for one article": (
+        "SELECT reddit_title, comment1, comment2, comment3, comment4, comment5 FROM reddit_posts WHERE article_id = ?",
+        True,
+    ),
+    "summary for one article": (
+        "SELECT summary FROM article_summaries WHERE article_id = ?",
+        True,
+    ),
+    "poll search queue": (
+        "SELECT article_id, title FROM news WHERE is_searched = 0 LIMIT 5",
+        False,
+    ),
+    "poll summary queue": (
+        "SELECT DISTINCT n.article_id, n.title FROM news n WHERE n.is_summarized = 0 LIMIT 25",
+        False,
+    ),
+    "count search queue": ("SELECT COUNT(*) FROM news WHERE is_searched = 0", False),
+}
+
+
+def populate(connection, n_posts):
+    """Fill the database like a long-running archive: nearly every article is processed."""
+    n_articles = n_posts // POSTS_PER_ARTICLE
+    queued = max(1, n_articles // 1000)
+    connection.executemany(
+        "INSERT INTO news (article_id, title, url, is_searched, is_summarized) VALUES (?, ?, ?, ?, ?)",
+        (
+            (
+                i,
+                f"Headline number {i}",
+                f"https://example.com/{i}",
+                int(i <= n_articles - queued),
+                int(i <= n_articles - queued),
+            )
+            for i in range(1, n_articles + 1)
+        ),
+    )
+    connection.executemany(
+        """
+        INSERT INTO reddit_posts (article_id, reddit_title, reddit_url, comment1, comment2, comment3, comment4, comment5)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+        (
+            (i % n_articles + 1, f"Thread {i}", f"https://reddit.com/{i}", "one", "two", "three", "", "")
+            for i in range(n_posts)
+        ),
+    )
+    connection.executemany(
+        "INSERT INTO article_summaries (article_id, summary) VALUES (?, ?)",
+        ((i, f"Summary {i}") for i in range(1, n_articles - queued + 1)),
+    )
+    connection.commit()
+    return n_articles
+
+
+def measure(connection, n_articles, lookups):
+    results = {}
+    for label, (query, per_article) in QUERIES.items():
+        params = (1,) if per_article else ()
+        plan = "; ".join(
+            row[3] for row in connection.execute(f"EXPLAIN QUERY PLAN {query}", params)
+        )
+        start = time.perf_counter()
+        for _ in range(lookups):
+            if per_article:
+                params = (random.randint(1, n_articles),)
+            connection.execute(query, params).fetchall()
+        per_query = (time.perf_counter() - start) / lookups
+        results[label] = (plan, per_query)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--posts", type=int, default=100000)
+    parser.add_argument("--lookups", type=int, default=1000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        connection = sqlite3.connect(os.path.join(tmp, "news.db"))
+        migrate(connection, target=1)
+        n_articles = populate(connection, args.posts)
+
+        before = measure(connection, n_articles, args.lookups)
+        migrate(connection, target=INDEX_MIGRATION)
+        after = measure(connection, n_articles, args.lookups)
+        connection.close()
+
+    print(f"{args.posts} posts, {n_articles} articles, {args.lookups} runs per query\n")
+    for label in QUERIES:
+        plan_before, time_before = before[label]
+        plan_after, time_after = after[label]
+        print(label)
+        print(f"  before: {time_before * 1e6:10.1f} us  {plan_before}")
+        print(f"  after:  {time_after * 1e6:10.1f} us  {plan_after}")
+        print(f"  speedup: {time_before / time_after:.1f}x\n")
+
+
+if __name__ == "__main__":
+    main()
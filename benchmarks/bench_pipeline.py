@@ -0,0 +1,129 @@
+"""
+bench_pipeline.py
+-----------------
+Compares running the search, scoring and summary stages one after another, as run.py does, with
+the streaming pipeline in pipeline.py, against FakeReddit and FakeTextAnalyticsClient. Reports the
+total time and how long the first summary took to arrive.
+
+Usage:
+- `python -m benchmarks.bench_pipeline --articles 100 --search-workers 4 --latency 0.05`
+"""
+
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+from benchmarks.fakes import FakeReddit, FakeTextAnalyticsClient
+from get_summaries import summarize_comments
+from pipeline import stream
+from search_reddit import search_reddit_for_articles
+from sentiment import update_comment_sentiment
+from setup import setup_database
+from summarizers import AzureSummarizer
+from utils import RateLimiter
+
+
+class TimedSummarizer:
+    """Wraps a summarizer to record when its first summary arrives."""
+
+    def __init__(self, summarizer):
+        self.summarizer = summarizer
+        self.cache_source = summarizer.cache_source
+        self.first = None
+
+    def summarize(self, documents):
+        for result in self.summarizer.summarize(documents):
+            self.first = self.first or time.perf_counter()
+            yield result
+
+
+def make_database(path, n_articles):
+    setup_database(db=path)
+    connection = sqlite3.connect(path)
+    connection.executemany(
+        "INSERT INTO news (article_id, title, url) VALUES (?, ?, ?)",
+        (
+            (i, f"Senate passes budget bill number {i}", f"https://example.com/{i}")
+            for i in range(1, n_articles + 1)
+        ),
+    )
+    connection.commit()
+    connection.close()
+
+
+def count_summaries(db):
+    connection = sqlite3.connect(db)
+    count = connection.execute("SELECT COUNT(*) FROM article_summaries").fetchone()[0]
+    connection.close()
+    return count
+
+
+def run_batch(db, args, summarizer):
+    search_reddit_for_articles(
+        FakeReddit(latency=args.latency),
+        limit=args.articles,
+        workers=args.search_workers,
+        client_factory=lambda: FakeReddit(latency=args.latency),
+        rate_limiter=RateLimiter(60000, burst=args.search_workers),
+        db=db,
+    )
+    connection = sqlite3.connect(db)
+    update_comment_sentiment(connection, engine=args.sentiment)
+    connection.close()
+    summarize_comments(summarizer, limit=args.articles, db=db)
+
+
+def run_streaming(db, args, summarizer):
+    stream(
+        db=db,
+        fetch=False,
+        workers={"search": args.search_workers, "summarize": args.in_flight},
+        client_factory=lambda: FakeReddit(latency=args.latency),
+        reddit_rate_limiter=RateLimiter(60000, burst=args.search_workers),
+        summarizer=summarizer,
+        sentiment=args.sentiment,
+    )
+
+
+def run(mode, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = os.path.join(tmp, "news.db")
+        make_database(db, args.articles)
+        summarizer = TimedSummarizer(
+            AzureSummarizer(
+                FakeTextAnalyticsClient(latency=args.summary_latency), in_flight=args.in_flight
+            )
+        )
+        start = time.perf_counter()
+        mode(db, summarizer=summarizer, args=args)
+        elapsed = time.perf_counter() - start
+        return elapsed, (summarizer.first or start) - start, count_summaries(db)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--articles", type=int, default=100)
+    parser.add_argument("--search-workers", type=int, default=4)
+    parser.add_argument("--in-flight", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--summary-latency", type=float, default=0.5)
+    parser.add_argument("--sentiment", default="lexicon")
+    args = parser.parse_args()
+
+    results = [
+        ("stages one after another", run(run_batch, args)),
+        ("streaming pipeline", run(run_streaming, args)),
+    ]
+
+    print()
+    for label, (elapsed, first, summaries) in results:
+        print(
+            f"{label:>26}: {elapsed:6.2f}s total  first summary after {first:5.2f}s  "
+            f"{summaries} summaries"
+        )
+    print(f"{'speedup':>26}: {results[0][1][0] / results[1][1][0]:6.2f}x")
+
+
+if __name__ == "__main__":
+    main()
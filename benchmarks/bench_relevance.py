@@ -0,0 +1,117 @@
+"""
+bench_relevance.py
+------------------
+Compares the old per-keyword substring scan with the compiled matchers in relevance.py on posts
+with hundreds of comments, for several numbers of keywords per article, and counts the substring
+false positives ("war" in "software").
+
+Two kinds of comments are generated: "filler" comments that only now and then use a topic word,
+and "topical" comments (benchmarks.synthetic) most of which mention one of the article's keywords,
+as the comments found by a Reddit search for the article do.
+
+Usage:
+- `python -m benchmarks.bench_relevance --comments 500 --keywords 8 16 32 --articles 50`
+"""
+
+import argparse
+import random
+import time
+from benchmarks import synthetic
+from relevance import make_scorer, select_relevant
+
+TOPIC_WORDS = [
+    "budget", "senate", "vote", "election", "court", "climate", "policy", "market",
+    "inflation", "housing", "school", "health", "energy", "tariff", "border", "strike",
+    "congress", "president", "economy", "vaccine", "mandate", "ruling", "justice", "protest",
+    "military", "reform", "deficit", "taxes", "police", "wages", "union", "bank",
+    "rates", "oil", "refugees", "pandemic", "wildfire", "prices", "drought", "treaty",
+]  # fmt: skip
+# Everyday words, a few of which contain "war" without being about it
+FILLER_WORDS = [
+    "the", "a", "is", "on", "this", "that", "really", "people", "think", "about", "just",
+    "like", "would", "because", "what", "they", "have", "been", "more", "than", "when",
+    "there", "their", "only", "other", "some", "could", "time", "very", "much", "even",
+    "most", "still", "those", "every", "where", "which", "going", "right", "software",
+]  # fmt: skip
+TOPIC_SHARE = 0.03  # Share of comment words that are about some topic
+
+
+def substring_relevant(comments, keywords):
+    """The matching get_summaries.py used before relevance.py."""
+    keywords = [keyword.lower() for keyword in keywords]
+    return [
+        comment
+        for comment in comments
+        if comment and any(keyword in comment.lower() for keyword in keywords)
+    ]
+
+
+def make_comment():
+    return " ".join(
+        random.choice(TOPIC_WORDS)
+        if random.random() < TOPIC_SHARE
+        else random.choice(FILLER_WORDS)
+        for _ in range(random.randint(8, 60))
+    )
+
+
+def make_topical_comment(keywords):
+    # Reads the keywords as a title, so most comments mention one of them
+    return synthetic.make_comment(random, " ".join(keywords))
+
+
+def make_articles(n_articles, n_comments, n_keywords, topical=False):
+    articles = []
+    for _ in range(n_articles):
+        keywords = random.sample(TOPIC_WORDS, n_keywords - 1) + ["war"]
+        comments = [
+            make_topical_comment(keywords) if topical else make_comment()
+            for _ in range(n_comments)
+        ]
+        articles.append((keywords, comments))
+    return articles
+
+
+def run(label, articles, select):
+    start = time.perf_counter()
+    kept = sum(len(select(keywords, comments)) for keywords, comments in articles)
+    elapsed = time.perf_counter() - start
+    n_comments = sum(len(comments) for _, comments in articles)
+    print(f"{label:>22}: {elapsed * 1e3:8.1f} ms  {n_comments / elapsed:12.0f} comments/s  {kept} kept")
+    return elapsed, kept
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--articles", type=int, default=50)
+    parser.add_argument("--comments", type=int, default=500)
+    parser.add_argument("--keywords", type=int, nargs="+", default=[8, 16, 32])
+    args = parser.parse_args()
+
+    for n_keywords in args.keywords:
+        for topical in (False, True):
+            random.seed(0)
+            articles = make_articles(args.articles, args.comments, n_keywords, topical)
+            print(
+                f"\n{n_keywords} keywords, {args.comments} {'topical' if topical else 'filler'} "
+                f"comments per article:"
+            )
+            baseline, substring_kept = run(
+                "substring scan",
+                articles,
+                lambda keywords, comments: substring_relevant(comments, keywords),
+            )
+            for name in ("any", "overlap"):
+                elapsed, kept = run(
+                    f"compiled ({name})",
+                    articles,
+                    lambda keywords, comments: select_relevant(
+                        comments, make_scorer(name, keywords)
+                    ),
+                )
+                print(f"{'speedup':>22}: {baseline / elapsed:.2f}x")
+            print(f"{'substring false hits':>22}: {substring_kept - kept}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+bench_search_reddit.py
+----------------------
+Compares serial and concurrent `search_reddit_for_articles()` throughput against FakeReddit.
+
+Usage:
+- `python -m benchmarks.bench_search_reddit --articles 40 --workers 8 --latency 0.05`
+"""
+
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+from benchmarks.fakes import FakeReddit
+from search_reddit import search_reddit_for_articles
+from setup import setup_database
+from utils import RateLimiter
+
+
+def make_database(path, n_articles):
+    setup_database(db=path)
+    connection = sqlite3.connect(path)
+    connection.executemany(
+        "INSERT INTO news (article_id, title, url) VALUES (?, ?, ?)",
+        (
+            (i, f"Senate passes budget bill number {i}", f"https://example.com/{i}")
+            for i in range(1, n_articles + 1)
+        ),
+    )
+    connection.commit()
+    connection.close()
+
+
+def run(n_articles, workers, latency, requests_per_minute):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = os.path.join(tmp, "news.db")
+        make_database(db, n_articles)
+        start = time.perf_counter()
+        search_reddit_for_articles(
+            FakeReddit(latency=latency),
+            limit=n_articles,
+            workers=workers,
+            client_factory=lambda: FakeReddit(latency=latency),
+            rate_limiter=RateLimiter(requests_per_minute, burst=workers),
+            db=db,
+        )
+        elapsed = time.perf_counter() - start
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--articles", type=int, default=40)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--requests-per-minute", type=int, default=60000)
+    args = parser.parse_args()
+
+    results = {}
+    for workers in (1, args.workers):
+        elapsed = run(args.articles, workers, args.latency, args.requests_per_minute)
+        results[workers] = elapsed
+
+    print()
+    for workers, elapsed in results.items():
+        mode = "serial" if workers == 1 else f"concurrent ({workers} workers)"
+        print(f"{mode:>28}: {elapsed:6.2f}s  {args.articles / elapsed:7.1f} articles/s")
+    print(f"{'speedup':>28}: {results[1] / results[args.workers]:6.2f}x")
+
+
+if __name__ == "__main__":
+    main()
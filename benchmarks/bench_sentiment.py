@@ -0,0 +1,71 @@
+"""
+bench_sentiment.py
+------------------
+Scores the Reddit comments stored in news.db with every sentiment engine in sentiment.py, and
+reports each engine's throughput and how closely it agrees with the spaCy/TextBlob engine.
+
+Agreement is reported as the correlation of the scores, the share of comments scored identically,
+and the share put in the same negative/neutral/positive category, which is what the plots show.
+
+The database is copied to a temporary directory and migrated there, so news.db isn't modified.
+
+Usage:
+- `python -m benchmarks.bench_sentiment --db news.db --repeat 5`
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import numpy as np
+from sentiment import ENGINES, DEFAULT_ENGINE, get_engine
+from setup import setup_database
+
+
+def load_comments(db):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "news.db")
+        shutil.copyfile(db, path)
+        setup_database(db=path)
+        connection = sqlite3.connect(path)
+        comments = [
+            row[0] for row in connection.execute("SELECT body FROM reddit_comments WHERE body != ''")
+        ]
+        connection.close()
+    return comments
+
+
+def run(name, comments):
+    engine = get_engine(name)  # Loaded before timing, as it is once per process in the pipeline
+    start = time.perf_counter()
+    scores = np.fromiter(engine.score(comments), dtype=float, count=len(comments))
+    elapsed = time.perf_counter() - start
+    return scores, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default="news.db")
+    parser.add_argument("--repeat", type=int, default=1, help="score every comment this many times")
+    args = parser.parse_args()
+
+    comments = load_comments(args.db) * args.repeat
+    print(f"Scoring {len(comments)} comments...")
+    baseline, baseline_elapsed = run(DEFAULT_ENGINE, comments)
+
+    for name in ENGINES:
+        scores, elapsed = run(name, comments) if name != DEFAULT_ENGINE else (baseline, baseline_elapsed)
+        correlation = np.corrcoef(scores, baseline)[0, 1]
+        identical = np.mean(np.isclose(scores, baseline))
+        same_category = np.mean(np.sign(scores) == np.sign(baseline))
+        print(
+            f"{name:>14}: {len(comments) / elapsed:9.0f} comments/s  "
+            f"{baseline_elapsed / elapsed:7.1f}x  r={correlation:.3f}  "
+            f"{identical:6.1%} identical  {same_category:6.1%} same category"
+        )
+
+
+if __name__ == "__main__":
+    main()
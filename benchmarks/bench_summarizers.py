@@ -0,0 +1,78 @@
+"""
+bench_summarizers.py
+--------------------
+Compares the latency and throughput of the summarizer backends in summarizers.py: Azure, through
+FakeTextAnalyticsClient with simulated request latency, and the local TextRank summarizer.
+
+Usage:
+- `python -m benchmarks.bench_summarizers --articles 1000 --comments 25 --latency 0.5`
+"""
+
+import argparse
+import random
+import time
+import numpy as np
+from benchmarks.fakes import FakeTextAnalyticsClient
+from summarizers import AzureSummarizer, TextRankSummarizer
+
+WORDS = [
+    "senate", "budget", "vote", "people", "really", "think", "policy", "court", "market",
+    "this", "that", "about", "would", "because", "election", "climate", "prices", "just",
+]  # fmt: skip
+
+
+def make_sentence():
+    return " ".join(random.choices(WORDS, k=random.randint(6, 20))).capitalize() + "."
+
+
+def make_documents(n_articles, n_comments):
+    """Documents shaped like build_document's: a title, then comments of a few sentences each."""
+    return [
+        {
+            "id": str(i),
+            "text": " ".join(
+                [f"Article {i} headline."]
+                + [make_sentence() for _ in range(n_comments * random.randint(1, 3))]
+            ),
+        }
+        for i in range(n_articles)
+    ]
+
+
+def run(label, summarizer, documents):
+    start = time.perf_counter()
+    latencies, errors = [], 0
+    for _, summary, error in summarizer.summarize(documents):
+        latencies.append(time.perf_counter() - start)
+        errors += error is not None or not summary
+    elapsed = time.perf_counter() - start
+    print(
+        f"{label:>24}: {elapsed:7.2f}s  {len(documents) / elapsed * 60:9.0f} articles/min  "
+        f"latency p50 {np.percentile(latencies, 50):6.2f}s  p95 {np.percentile(latencies, 95):6.2f}s  "
+        f"{errors} errors"
+    )
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--articles", type=int, default=1000)
+    parser.add_argument("--comments", type=int, default=25)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--in-flight", type=int, default=4)
+    args = parser.parse_args()
+
+    random.seed(0)
+    documents = make_documents(args.articles, args.comments)
+
+    azure = run(
+        "azure (stub)",
+        AzureSummarizer(FakeTextAnalyticsClient(latency=args.latency), in_flight=args.in_flight),
+        documents,
+    )
+    local = run("textrank (local)", TextRankSummarizer(), documents)
+    print(f"{'speedup':>24}: {azure / local:7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
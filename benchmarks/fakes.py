@@ -0,0 +1,172 @@
+"""
+fakes.py
+--------
+Local stand-ins for the external APIs used by the pipeline. They mimic just enough of each
+client's interface for the pipeline code to run, and sleep to simulate network latency.
+
+Includes:
+- FakeReddit: Mimics `praw.Reddit` for `subreddit("all").search(...)` and comment trees.
+- FakeTextAnalyticsClient: Mimics the Azure `TextAnalyticsClient.begin_analyze_actions` long-running
+                           operation for extractive summaries, and records how it was called.
+- FakeNYT: Mimics the New York Times Archive API. Its `get` stands in for `requests.get` and
+           streams a JSON archive of generated articles, the way get_articles.py reads it.
+"""
+
+import io
+import json
+import random
+import time
+
+
+class FakeComment:
+    def __init__(self, id, body, score=1, depth=0):
+        self.id = id
+        self.body = body
+        self.score = score
+        self.depth = depth
+
+
+class FakeCommentForest:
+    def __init__(self, comments, latency):
+        self._comments = comments
+        self._latency = latency
+
+    def replace_more(self, limit=None):
+        time.sleep(self._latency)  # PRAW fetches the comment tree on first access
+        return []
+
+    def list(self):
+        return list(self._comments)
+
+
+class FakeSubmission:
+    def __init__(self, reddit, index, query, latency, n_comments):
+        self.id = f"t3_{index}"
+        self.title = f"Discussion {index} about {query}"
+        self.url = f"https://www.reddit.com/r/all/comments/{index}/"
+        self.subreddit = FakeSubreddit(reddit, f"sub{index % 7}")
+        self.comments = FakeCommentForest(
+            [
+                FakeComment(
+                    f"c{index}_{i}", f"Comment {i} on {query}: this is  a\nfine take.", score=10 - i
+                )
+                for i in range(n_comments)
+            ],
+            latency,
+        )
+
+
+class FakeSubreddit:
+    def __init__(self, reddit, display_name):
+        self._reddit = reddit
+        self.display_name = display_name
+
+    def search(self, query, limit=5):
+        time.sleep(self._reddit.latency)
+        reddit = self._reddit
+        for _ in range(limit):
+            reddit.submission_count += 1
+            yield FakeSubmission(
+                reddit,
+                reddit.submission_count,
+                query,
+                reddit.latency,
+                random.randint(0, reddit.max_comments),
+            )
+
+
+class FakeReddit:
+    def __init__(self, latency=0.05, max_comments=8):
+        self.latency = latency
+        self.max_comments = max_comments
+        self.submission_count = 0
+
+    def subreddit(self, name):
+        return FakeSubreddit(self, name)
+
+
+class FakeSentence:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeSummaryResult:
+    is_error = False
+
+    def __init__(self, document):
+        self.id = document["id"]
+        # Return the first sentence, so callers can check summaries reach the right article
+        self.sentences = [FakeSentence(document["text"].split(". ")[0])]
+
+
+class FakePoller:
+    def __init__(self, documents, ready_at):
+        self._documents = documents
+        self._ready_at = ready_at
+
+    def result(self):
+        # The operation runs "server side" from the moment it is started
+        time.sleep(max(0, self._ready_at - time.monotonic()))
+        return [[FakeSummaryResult(document)] for document in self._documents]
+
+
+class FakeTextAnalyticsClient:
+    max_documents = 25
+
+    def __init__(self, latency=0.5, per_document=0.01):
+        self.latency = latency
+        self.per_document = per_document
+        self.requests = []
+
+    def begin_analyze_actions(self, documents, actions, **kwargs):
+        if len(documents) > self.max_documents:
+            raise ValueError(
+                f"Batch request contains too many documents: {len(documents)} > {self.max_documents}"
+            )
+        self.requests.append(len(documents))
+        ready_at = time.monotonic() + self.latency + self.per_document * len(documents)
+        return FakePoller(list(documents), ready_at)
+
+
+class FakeArchiveResponse:
+    status_code = 200
+
+    def __init__(self, body):
+        self.raw = io.BytesIO(body)
+
+    def raise_for_status(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeNYT:
+    def __init__(self, latency=0.5, articles_per_month=4000):
+        self.latency = latency
+        self.articles_per_month = articles_per_month
+        self.requests = []
+
+    def archive(self, year, month):
+        return {
+            "response": {
+                "docs": [
+                    {
+                        "abstract": f"Story {i} of {year}-{month:02d} about the senate budget vote.",
+                        "web_url": f"https://www.nytimes.com/{year}/{month:02d}/story-{i}.html",
+                        "uri": f"nyt://article/{year}-{month:02d}-{i}",
+                        "pub_date": f"{year}-{month:02d}-{i % 28 + 1:02d}T00:00:00+0000",
+                        # Real archive documents carry many more fields the parser skips over
+                        "keywords": [{"name": "subject", "value": "Politics"}] * 5,
+                    }
+                    for i in range(self.articles_per_month)
+                ]
+            }
+        }
+
+    def get(self, url, params=None, stream=False, **kwargs):
+        year, month = url.rsplit("/", 2)[-2:]
+        year, month = int(year), int(month.split(".")[0])
+        self.requests.append((year, month))
+        time.sleep(self.latency)
+        return FakeArchiveResponse(json.dumps(self.archive(year, month)).encode("utf-8"))
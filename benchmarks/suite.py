@@ -0,0 +1,363 @@
+"""
+suite.py
+--------
+Times every stage of the pipeline on a synthetic news.db (synthetic.py), with the NYT, Reddit and
+Azure clients replaced by the stubs in fakes.py, and writes the results as a JSON report so
+regressions show up as numbers.
+
+Features:
+- Runs each stage function `--repeat` times, each time on a fresh copy of the same database, and
+  reports the fastest and median wall-clock and CPU times. Stages covered:
+  - fetch_titles_from_nyt
+  - search_reddit_for_articles
+  - summarize_comments, with the Azure stub and with TextRank
+  - update_comment_sentiment
+  - dump_to_csv
+  - the plot loaders, from the exported CSV file and from news.db
+- Runs each stage once more under cProfile. The report lists the functions with the most
+  cumulative time, and the full profile is saved as a `.prof` file for snakeviz or pstats.
+- Runs each stage once more under tracemalloc. The report records peak memory and the lines
+  holding the most memory when the stage returns.
+- With `--baseline`, compares the median times with an earlier report. Prints the ratio for each
+  stage, and exits with status 1 if any stage got slower than `--tolerance` allows.
+
+Usage:
+- `python -m benchmarks.suite --articles 2000 --output report.json`
+- Only some stages: `python -m benchmarks.suite --cases search_reddit_for_articles dump_to_csv`
+- Check for regressions: `python -m benchmarks.suite --baseline report.json --output new.json`
+
+Details:
+- The stubs have no latency, so the times are the pipeline's own work: parsing, spaCy or the
+  lexicon, SQLite and Python overhead.
+- Each stage runs once untimed first, so models loaded once per process (models.py) aren't
+  counted.
+- Profiling and memory tracing slow the code they watch, so the times come only from the
+  unprofiled runs.
+- Stage output (spinners and progress messages) is discarded. Loaders go quiet when output
+  isn't a terminal, so they cost nothing here.
+"""
+
+import argparse
+import cProfile
+import io
+import json
+import os
+import platform
+import pstats
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+from unittest import mock
+from benchmarks.fakes import FakeNYT, FakeReddit, FakeTextAnalyticsClient
+from benchmarks.synthetic import make_news_db
+from dump_to_csv import dump_to_csv
+from get_articles import fetch_titles_from_nyt
+from get_summaries import summarize_comments
+from plot_data import load_sentiment_data, load_year_stats, load_max_spreads
+from search_reddit import search_reddit_for_articles
+from sentiment import update_comment_sentiment, ENGINES, DEFAULT_ENGINE
+from summarizers import AzureSummarizer, TextRankSummarizer
+from db import connect
+from utils import RateLimiter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+REPORT_VERSION = 1
+TOP_FUNCTIONS = 15
+TOP_ALLOCATIONS = 10
+
+# No quota to respect when nothing leaves the machine
+UNLIMITED = 10**9
+
+
+class Case:
+    """One benchmarked stage. `run(db, workdir)` is timed; `setup(db, workdir)` isn't."""
+
+    def __init__(self, name, run, setup=None, source="base"):
+        self.name = name
+        self.run = run
+        self.setup = setup
+        self.source = source  # Template database the case starts from
+
+
+def count_jobs(db, queue):
+    connection = connect(db)
+    count = connection.execute(
+        "SELECT COUNT(*) FROM jobs WHERE queue = ? AND state = 'pending'", (queue,)
+    ).fetchone()[0]
+    connection.close()
+    return count
+
+
+def make_cases(args):
+    def fetch(db, workdir):
+        nyt = FakeNYT(latency=0, articles_per_month=args.nyt_articles)
+        with mock.patch("requests.get", nyt.get):
+            fetch_titles_from_nyt(num_articles=args.nyt_articles, db=db)
+
+    def search(db, workdir):
+        search_reddit_for_articles(
+            FakeReddit(latency=0),
+            limit=count_jobs(db, "search"),
+            rate_limiter=RateLimiter(UNLIMITED, burst=UNLIMITED),
+            db=db,
+        )
+
+    def summarize_with(make_summarizer):
+        def summarize(db, workdir):
+            summarize_comments(make_summarizer(), limit=count_jobs(db, "summarize"), db=db)
+
+        return summarize
+
+    def score(db, workdir):
+        connection = connect(db)
+        update_comment_sentiment(connection, engine=args.sentiment)
+        connection.close()
+
+    def export(db, workdir):
+        dump_to_csv(os.path.join(workdir, "output.csv"), db=db, sentiment=args.sentiment)
+
+    def csv_path(workdir):
+        return os.path.join(workdir, "exported.csv")
+
+    def warm_cache(db, workdir):
+        load_sentiment_data(csv_path(workdir))
+
+    return [
+        Case("fetch_titles_from_nyt", fetch),
+        Case("search_reddit_for_articles", search),
+        Case(
+            "summarize_comments[azure]",
+            summarize_with(lambda: AzureSummarizer(FakeTextAnalyticsClient(latency=0, per_document=0))),
+        ),
+        Case("summarize_comments[textrank]", summarize_with(TextRankSummarizer)),
+        Case("update_comment_sentiment", score),
+        Case("dump_to_csv", export),
+        Case(
+            "load_sentiment_data",
+            lambda db, workdir: load_sentiment_data(csv_path(workdir), use_cache=False),
+            source="exported",
+        ),
+        Case(
+            "load_sentiment_data[cached]",
+            lambda db, workdir: load_sentiment_data(csv_path(workdir)),
+            setup=warm_cache,
+            source="exported",
+        ),
+        Case("load_year_stats", lambda db, workdir: load_year_stats(db), source="exported"),
+        Case("load_max_spreads", lambda db, workdir: load_max_spreads(db), source="exported"),
+    ]
+
+
+def prepare_templates(workdir, args):
+    """Build the synthetic database, and an exported copy of it for the plot loaders."""
+    base = os.path.join(workdir, "base.db")
+    exported = os.path.join(workdir, "exported.db")
+    with redirect_stdout(io.StringIO()):
+        counts = make_news_db(
+            base,
+            articles=args.articles,
+            posts_per_article=args.posts,
+            comments_per_post=args.comments,
+            seed=args.seed,
+        )
+        shutil.copyfile(base, exported)
+        dump_to_csv(os.path.join(workdir, "exported.csv"), db=exported, sentiment=args.sentiment)
+    return {"base": base, "exported": exported}, counts
+
+
+def fresh_copy(template, workdir):
+    path = os.path.join(workdir, "news.db")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    shutil.copyfile(template, path)
+    return path
+
+
+def call(case, templates, workdir):
+    """Run the case's setup and then return `run` ready to be called on a fresh database."""
+    db = fresh_copy(templates[case.source], workdir)
+    with redirect_stdout(io.StringIO()):
+        if case.setup is not None:
+            case.setup(db, workdir)
+    return lambda: case.run(db, workdir)
+
+
+def quietly(run):
+    with redirect_stdout(io.StringIO()):
+        run()
+
+
+def time_case(case, templates, workdir, repeat):
+    quietly(call(case, templates, workdir))  # Warm-up, so models load before timing starts
+    wall, cpu = [], []
+    for _ in range(repeat):
+        run = call(case, templates, workdir)
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        quietly(run)
+        wall.append(time.perf_counter() - wall_start)
+        cpu.append(time.process_time() - cpu_start)
+    return {
+        "wall_seconds": {"min": min(wall), "median": statistics.median(wall), "runs": wall},
+        "cpu_seconds": {"min": min(cpu), "median": statistics.median(cpu), "runs": cpu},
+    }
+
+
+def profile_case(case, templates, workdir, profile_path):
+    """Top functions by cumulative time, from one run under cProfile."""
+    run = call(case, templates, workdir)
+    profiler = cProfile.Profile()
+    profiler.runcall(quietly, run)
+    if profile_path:
+        profiler.dump_stats(profile_path)
+
+    stats = pstats.Stats(profiler)
+    # The suite's own wrappers would top every list, so only the pipeline's code is kept
+    rows = sorted(
+        (item for item in stats.stats.items() if item[0][0] != __file__),
+        key=lambda item: item[1][3],
+        reverse=True,
+    )
+    return [
+        {
+            "function": f"{os.path.relpath(filename, ROOT) if os.path.isabs(filename) else filename}:{line}({name})",
+            "calls": calls,
+            "total_seconds": total,
+            "cumulative_seconds": cumulative,
+        }
+        for (filename, line, name), (_, calls, total, cumulative, _) in rows[:TOP_FUNCTIONS]
+    ]
+
+
+def trace_case(case, templates, workdir):
+    """Peak memory and the lines holding the most memory at the end, from one traced run."""
+    run = call(case, templates, workdir)
+    tracemalloc.start()
+    try:
+        quietly(run)
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "peak_bytes": peak,
+        "allocations": [
+            {"line": str(stat.traceback[0]), "bytes": stat.size, "blocks": stat.count}
+            for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]
+        ],
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline, tolerance):
+    """Print each case's median time against `baseline`. Returns the names of slower cases."""
+    if baseline["config"] != report["config"]:
+        print("\nThe baseline was run with different settings, so its times aren't comparable:")
+        print(f"  baseline {baseline['config']}\n  now      {report['config']}")
+    previous = {case["name"]: case for case in baseline["cases"]}
+    regressions = []
+    print(f"\n{'case':>30}  {'baseline':>9}  {'now':>9}  ratio")
+    for case in report["cases"]:
+        before = previous.get(case["name"])
+        if before is None:
+            continue
+        old = before["wall_seconds"]["median"]
+        new = case["wall_seconds"]["median"]
+        ratio = new / old if old > 0 else float("inf")
+        flag = ""
+        if ratio > tolerance:
+            regressions.append(case["name"])
+            flag = "  slower"
+        print(f"{case['name']:>30}  {old:8.3f}s  {new:8.3f}s  {ratio:5.2f}x{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--articles", type=int, default=1000)
+    parser.add_argument("--posts", type=int, default=5, help="posts per searched article")
+    parser.add_argument("--comments", type=int, default=5, help="comments per post")
+    parser.add_argument("--nyt-articles", type=int, default=2000, help="articles in the stub archive")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--sentiment", choices=sorted(ENGINES), default=DEFAULT_ENGINE)
+    parser.add_argument("--cases", nargs="+", help="names of the cases to run (default: all)")
+    parser.add_argument("--no-profile", action="store_true")
+    parser.add_argument("--no-memory", action="store_true")
+    parser.add_argument("--output", default="benchmark-report.json")
+    parser.add_argument("--profile-dir", help="save each case's cProfile stats here")
+    parser.add_argument("--baseline", help="earlier report to compare with")
+    parser.add_argument("--tolerance", type=float, default=1.2, help="slowdown ratio that fails --baseline")
+    args = parser.parse_args()
+
+    cases = make_cases(args)
+    if args.cases:
+        unknown = set(args.cases) - {case.name for case in cases}
+        if unknown:
+            parser.error(f"unknown cases: {', '.join(sorted(unknown))}")
+        cases = [case for case in cases if case.name in args.cases]
+    if args.profile_dir:
+        os.makedirs(args.profile_dir, exist_ok=True)
+
+    report = {
+        "version": REPORT_VERSION,
+        "created": datetime.now(timezone.utc).isoformat(),
+        "commit": git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "config": {
+            key: getattr(args, key)
+            for key in ("articles", "posts", "comments", "nyt_articles", "seed", "repeat", "sentiment")
+        },
+        "cases": [],
+    }
+
+    with tempfile.TemporaryDirectory() as workdir:
+        print(f"Building a synthetic database of {args.articles} articles...")
+        templates, report["database"] = prepare_templates(workdir, args)
+        for case in cases:
+            result = {"name": case.name, **time_case(case, templates, workdir, args.repeat)}
+            if not args.no_profile:
+                profile_path = (
+                    os.path.join(args.profile_dir, f"{case.name}.prof") if args.profile_dir else None
+                )
+                result["profile"] = profile_case(case, templates, workdir, profile_path)
+            if not args.no_memory:
+                result.update(trace_case(case, templates, workdir))
+            report["cases"].append(result)
+
+            peak = f"  peak {result['peak_bytes'] / 2**20:7.1f} MiB" if "peak_bytes" in result else ""
+            print(
+                f"{case.name:>30}: {result['wall_seconds']['median']:8.3f}s median  "
+                f"{result['cpu_seconds']['median']:8.3f}s CPU{peak}"
+            )
+
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    print(f"Report written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            regressions = compare(report, json.load(file), args.tolerance)
+        if regressions:
+            print(f"Slower than {args.tolerance:.2f}x the baseline: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+synthetic.py
+------------
+Builds a synthetic news.db of any size, with the schema setup.py creates, for benchmarks that need
+a realistic database without calling any API.
+
+Includes:
+- make_news_db: Creates the database and fills it like a pipeline that is part-way through a run.
+                Most articles are searched and summarized. A share of them has been searched and
+                is waiting in the `summarize` queue, and another share is waiting in the `search`
+                queue. Both queues are filled by the jobs triggers, as in a real run.
+
+Comments are made of common words and sentiment words, so both sentiment engines and the
+relevance scorers have real work to do. The same seed always builds the same database.
+
+Usage:
+- `python -m benchmarks.synthetic --articles 5000 --out synthetic.db`
+"""
+
+import argparse
+import os
+import random
+from db import connect
+from setup import setup_database
+
+SUBREDDITS = ["news", "politics", "worldnews", "economics", "science", "technology", "sports"]
+
+TOPICS = [
+    "senate", "budget", "election", "climate", "court", "market", "prices", "vaccine",
+    "border", "strike", "inflation", "wildfire", "tariffs", "housing", "schools", "energy",
+]  # fmt: skip
+
+FILLER = [
+    "the", "this", "that", "people", "really", "think", "about", "would", "because", "just",
+    "policy", "plan", "vote", "new", "state", "city", "year", "week", "government", "report",
+]  # fmt: skip
+
+OPINIONS = [
+    "good", "bad", "great", "terrible", "not", "very", "happy", "awful", "best", "worst",
+    "fair", "wrong", "!", "love", "hate", "interesting", "stupid", "nice", "sad", "amazing",
+]  # fmt: skip
+
+
+def make_title(rng):
+    words = rng.sample(TOPICS, 2) + rng.choices(FILLER, k=rng.randint(3, 8))
+    rng.shuffle(words)
+    return " ".join(words).capitalize()
+
+
+def make_comment(rng, title):
+    # Most comments mention a word of the title, as relevant comments do
+    words = rng.choices(FILLER + OPINIONS, k=rng.randint(5, 40))
+    if rng.random() < 0.7:
+        words.insert(rng.randrange(len(words) + 1), rng.choice(title.lower().split()))
+    return " ".join(words).capitalize() + "."
+
+
+def make_news_db(
+    path,
+    articles=1000,
+    posts_per_article=5,
+    comments_per_post=5,
+    pending_search=0.1,
+    pending_summary=0.1,
+    seed=0,
+):
+    """Create a synthetic database at `path`, replacing any file there. Returns its row counts."""
+    if os.path.exists(path):
+        os.remove(path)
+    setup_database(db=path)
+    rng = random.Random(seed)
+
+    searched_until = articles - int(articles * pending_search)
+    summarized_until = searched_until - int(articles * pending_summary)
+    connection = connect(path)
+    with connection:
+        for article_id in range(1, articles + 1):
+            title = make_title(rng)
+            searched = article_id <= searched_until
+            summarized = article_id <= summarized_until
+            # The jobs triggers queue the article from these flags
+            connection.execute(
+                """
+                INSERT INTO news (article_id, title, url, nyt_uri, pub_date, is_searched, is_summarized)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+                (
+                    article_id,
+                    title,
+                    f"https://www.nytimes.com/synthetic/{article_id}.html",
+                    f"nyt://article/synthetic-{article_id}",
+                    f"{2019 + article_id % 4}-{article_id % 12 + 1:02d}-01T00:00:00+0000",
+                    int(searched),
+                    int(summarized),
+                ),
+            )
+            if not searched:
+                continue
+            for post in range(posts_per_article):
+                cursor = connection.execute(
+                    """
+                    INSERT INTO reddit_posts (article_id, reddit_id, reddit_title, reddit_url, subreddit)
+                    VALUES (?, ?, ?, ?, ?)
+                """,
+                    (
+                        article_id,
+                        f"t3_{article_id}_{post}",
+                        f"Discussion about {title.lower()}",
+                        f"https://www.reddit.com/comments/{article_id}_{post}/",
+                        rng.choice(SUBREDDITS),
+                    ),
+                )
+                connection.executemany(
+                    """
+                    INSERT INTO reddit_comments (post_id, position, comment_id, body, score, depth)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                    [
+                        (
+                            cursor.lastrowid,
+                            position,
+                            f"c{article_id}_{post}_{position}",
+                            make_comment(rng, title),
+                            rng.randint(-20, 500),
+                            rng.randint(0, 3),
+                        )
+                        for position in range(1, comments_per_post + 1)
+                    ],
+                )
+            if summarized:
+                connection.execute(
+                    "INSERT INTO article_summaries (article_id, summary) VALUES (?, ?)",
+                    (article_id, f"People discussed {title.lower()}."),
+                )
+
+    counts = {
+        table: connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        for table in ("news", "reddit_posts", "reddit_comments", "article_summaries")
+    }
+    for queue, open_jobs in connection.execute(
+        "SELECT queue, COUNT(*) FROM jobs WHERE state = 'pending' GROUP BY queue"
+    ):
+        counts[f"{queue} jobs"] = open_jobs
+    connection.close()
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", default="synthetic.db")
+    parser.add_argument("--articles", type=int, default=1000)
+    parser.add_argument("--posts", type=int, default=5, help="posts per searched article")
+    parser.add_argument("--comments", type=int, default=5, help="comments per post")
+    parser.add_argument("--pending-search", type=float, default=0.1)
+    parser.add_argument("--pending-summary", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    counts = make_news_db(
+        args.out,
+        articles=args.articles,
+        posts_per_article=args.posts,
+        comments_per_post=args.comments,
+        pending_search=args.pending_search,
+        pending_summary=args.pending_summary,
+        seed=args.seed,
+    )
+    print(f"Wrote {args.out}: " + ", ".join(f"{count} {name}" for name, count in counts.items()))
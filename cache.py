@@ -0,0 +1,159 @@
+"""
+cache.py
+--------
+This file provides an on-disk cache for responses from the New York Times, Reddit and Azure APIs,
+so re-running a stage (for example after a crash) doesn't repeat identical requests.
+
+Includes:
+- ResponseCache: A SQLite-backed cache keyed on a fingerprint of each request. Entries expire after
+                 a per-source time to live, and the least recently used entries are evicted once
+                 the cache grows past its size cap. Safe to share between worker threads.
+- get_cache: Returns the cache shared by the whole process.
+
+Values must be JSON serializable. Tuples come back as lists.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from threading import Lock
+
+DEFAULT_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "cache.db")
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+DAY = 24 * 60 * 60
+
+# Seconds each source's responses stay fresh
+DEFAULT_TTLS = {
+    "nyt": 90 * DAY,  # Only past archive months are cached, and they never change
+    "reddit": 1 * DAY,  # Search results and comment rankings drift quickly
+    "azure": 30 * DAY,  # The same text and action always produce the same summary
+}
+
+
+def fingerprint(source, request):
+    """Stable key for a request, given as any JSON serializable description of it."""
+    payload = json.dumps([source, request], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttls=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                source TEXT,
+                value TEXT,
+                size INTEGER,
+                created_at REAL,
+                accessed_at REAL
+            )
+        """
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_responses_accessed_at ON responses (accessed_at)"
+        )
+        self._connection.commit()
+        self._size = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+
+    def get(self, source, request):
+        """Return the cached value for a request, or None if it is missing or expired."""
+        key = fingerprint(source, request)
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, size, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, size, created_at = row
+            if now - created_at > self.ttls.get(source, DAY):
+                self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._connection.commit()
+                self._size -= size
+                self.misses += 1
+                return None
+            self._connection.execute(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            self._connection.commit()
+            self.hits += 1
+        return json.loads(value)
+
+    def set(self, source, request, value):
+        key = fingerprint(source, request)
+        data = json.dumps(value)
+        now = time.time()
+        with self._lock:
+            previous = self._connection.execute(
+                "SELECT size FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, source, data, len(data), now, now),
+            )
+            self._size += len(data) - (previous[0] if previous else 0)
+            if self._size > self.max_bytes:
+                self._evict()
+            self._connection.commit()
+
+    def _evict(self):
+        """Drop least recently used entries until the cache is back under 90% of its cap."""
+        target = self.max_bytes * 0.9
+        rows = self._connection.execute(
+            "SELECT key, size FROM responses ORDER BY accessed_at"
+        )
+        evicted = []
+        for key, size in rows:
+            if self._size <= target:
+                break
+            evicted.append((key,))
+            self._size -= size
+        self._connection.executemany("DELETE FROM responses WHERE key = ?", evicted)
+
+    def fetch(self, source, request, compute):
+        """Return the cached value for a request, calling `compute()` and storing its result on a miss."""
+        value = self.get(source, request)
+        if value is None:
+            value = compute()
+            if value is not None:
+                self.set(source, request, value)
+        return value
+
+    def clear(self, source=None):
+        with self._lock:
+            if source is None:
+                self._connection.execute("DELETE FROM responses")
+            else:
+                self._connection.execute("DELETE FROM responses WHERE source = ?", (source,))
+            self._connection.commit()
+            self._size = self._connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()[0]
+
+    def close(self):
+        self._connection.close()
+
+
+_cache = None
+
+
+def get_cache():
+    """Return the process-wide response cache, opening it on first use."""
+    global _cache
+    if _cache is None:
+        _cache = ResponseCache()
+    return _cache
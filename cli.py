@@ -0,0 +1,61 @@
+"""
+cli.py
+------
+This script is a single entry point for every stage and tool in the project, as subcommands.
+
+Features:
+- Each subcommand runs one of the project's scripts exactly as `python <script>.py` would, with
+  the rest of the command line passed on to it, so every script keeps its own options.
+- Nothing but the standard library is imported until a subcommand is chosen, and then only that
+  script's imports are loaded, so `python cli.py --help` is instant. Models (spaCy) and API
+  clients (PRAW, Azure) are only loaded once a stage needs them.
+
+Usage:
+- List the subcommands: `python cli.py --help`
+- Show a subcommand's options: `python cli.py search --help`
+- Run the whole pipeline: `python cli.py run --streaming`
+- Run one stage: `python cli.py summarize --summarizer textrank --limit 50`
+"""
+
+import argparse
+import runpy
+import sys
+
+# Subcommand: (script module, description)
+COMMANDS = {
+    "setup": ("setup", "Create the database or apply new migrations"),
+    "articles": ("get_articles", "Fetch New York Times articles, or backfill a range of months"),
+    "keywords": ("keywords", "Extract the title keywords of every stored article"),
+    "search": ("search_reddit", "Search Reddit for the queued articles"),
+    "summarize": ("get_summaries", "Summarize the queued articles' Reddit discussions"),
+    "export": ("dump_to_csv", "Score comment sentiment and export every article to CSV or Parquet"),
+    "stats": ("aggregates", "Refresh the sentiment statistics"),
+    "jobs": ("jobs", "Show or manage the work queues"),
+    "find": ("search_corpus", "Full-text search of the collected articles, posts and comments"),
+    "dedup": ("dedup", "Show deduplicated submissions and comments, or index stored comments"),
+    "run": ("run", "Run every stage in order, resuming an interrupted run"),
+    "pipeline": ("pipeline", "Run every stage at once as a streaming pipeline"),
+    "plot": ("plot", "Plot the sentiment of every year"),
+    "plot-articles": ("plot_12_sentiments", "Plot the sentiment of 12 random articles"),
+    "plot-divided": ("highest_lowest", "Plot the most divided article of each year"),
+    "render": ("render", "Render every figure to image files"),
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="cli.py", description="Social opinion miner for current events."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True, metavar="command")
+    for name, (_, description) in COMMANDS.items():
+        # Each script parses its own options, including --help
+        subparsers.add_parser(name, help=description, add_help=False)
+    args, rest = parser.parse_known_args(argv)
+
+    module, _ = COMMANDS[args.command]
+    sys.argv[1:] = rest  # run_module points sys.argv[0] at the script itself
+    runpy.run_module(module, run_name="__main__", alter_sys=True)
+
+
+if __name__ == "__main__":
+    main()
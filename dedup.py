@@ -0,0 +1,286 @@
+"""
+dedup.py
+--------
+This file finds Reddit submissions and comments that have already been stored, so that
+search_reddit.py links repeats to the stored copy instead of storing, scoring and summarizing
+them again. Searches for articles with overlapping keywords often return the same submissions,
+crossposts of them, and comments copied from one thread to another.
+
+Includes:
+- post_fingerprint: Identifies a submission by its Reddit id. A crosspost is identified by the id
+                    of the submission it links to.
+- shingles / minhash_signatures: MinHash signatures of many comments at once, from the word
+                                 3-grams of each comment, computed in NumPy.
+- Deduplicator: Checks new submissions against the stored ones. Checks new comments against every
+                indexed comment through a locality-sensitive hashing (LSH) index kept in the
+                `comment_lsh` table, and against comments queued earlier in the same run.
+
+A repeated submission is stored as a row that points at the first copy (`duplicate_of`), and its
+comments are not stored again. Readers find them through the first copy, so the export, the
+statistics and the summaries of every article it was found for include them. A comment that
+nearly repeats a stored one is stored as a row with no text that points at the stored comment.
+It is left out of sentiment scoring and of summaries, so a pasted opinion is counted once, where
+it was first seen, rather than once per thread it was pasted into.
+
+Usage:
+- Show how much has been deduplicated: `python dedup.py`
+- Index comments stored before deduplication existed: `python dedup.py --index`
+
+Details:
+- Only comments of at least 8 words are compared. Short replies such as "This is terrible." are
+  separate opinions even when they match word for word.
+- Signatures have 64 hashes in 8 bands of 8. Comments whose shingles overlap by about 80% or more
+  share a band and are compared. Matches need an estimated similarity of 0.8.
+- Signatures depend on SEED and the sizes above. Changing any of them means emptying
+  `comment_minhash` and `comment_lsh` and running `python dedup.py --index`.
+"""
+
+import argparse
+import re
+import zlib
+from collections import defaultdict
+import numpy as np
+from db import open_db, BulkWriter, DEFAULT_DB
+
+SHINGLE_WORDS = 3
+MIN_WORDS = 8
+NUM_HASHES = 64
+BANDS = 8
+ROWS_PER_BAND = NUM_HASHES // BANDS
+THRESHOLD = 0.8
+
+# Hashes are (a * x + b) mod a Mersenne prime. With 31-bit multipliers and 32-bit shingle hashes
+# every product fits in 64 bits
+PRIME = (1 << 31) - 1
+SEED = 206
+_rng = np.random.default_rng(SEED)
+MULTIPLIERS = _rng.integers(1, PRIME, NUM_HASHES, dtype=np.uint64)
+OFFSETS = _rng.integers(0, PRIME, NUM_HASHES, dtype=np.uint64)
+
+WORD = re.compile(r"\w+")
+
+# A crosspost's URL is the permalink of the submission it shares
+CROSSPOST_URL = re.compile(r"reddit\.com/r/\w+/comments/(\w+)")
+
+INSERT_SIGNATURE = "INSERT OR IGNORE INTO comment_minhash (comment_id, signature) VALUES (?, ?)"
+INSERT_BAND = "INSERT OR IGNORE INTO comment_lsh (band_key, comment_id) VALUES (?, ?)"
+
+# Comments queued in this run have no row id until the writer flushes, so they are found by
+# their post and position instead
+COMMENT_ID = """
+    SELECT c.id FROM reddit_comments c JOIN reddit_posts p ON p.id = c.post_id
+    WHERE p.article_id = ? AND p.reddit_id = ? AND c.position = ?"""
+INSERT_QUEUED_SIGNATURE = f"""
+    INSERT OR IGNORE INTO comment_minhash (comment_id, signature) SELECT ({COMMENT_ID}), ?"""
+INSERT_QUEUED_BAND = f"""
+    INSERT OR IGNORE INTO comment_lsh (band_key, comment_id) SELECT ?, ({COMMENT_ID})"""
+
+
+def post_fingerprint(reddit_id, url):
+    match = CROSSPOST_URL.search(url or "")
+    return match.group(1) if match else reddit_id
+
+
+def shingles(text):
+    """The set of word 3-grams of `text`, or None if it is too short to compare."""
+    words = WORD.findall(text.lower())
+    if len(words) < MIN_WORDS:
+        return None
+    return {
+        " ".join(words[start : start + SHINGLE_WORDS])
+        for start in range(len(words) - SHINGLE_WORDS + 1)
+    }
+
+
+def minhash_signatures(shingle_sets):
+    """Return a (len(shingle_sets), NUM_HASHES) uint32 array of MinHash signatures."""
+    counts = [len(shingle_set) for shingle_set in shingle_sets]
+    hashes = np.fromiter(
+        (
+            zlib.crc32(shingle.encode("utf-8"))
+            for shingle_set in shingle_sets
+            for shingle in shingle_set
+        ),
+        dtype=np.uint64,
+        count=sum(counts),
+    )
+    # Every hash function over every shingle of every comment at once, then the minimum of each
+    # comment's run of columns
+    hashed = (MULTIPLIERS[:, None] * hashes[None, :] + OFFSETS[:, None]) % PRIME
+    starts = np.cumsum([0] + counts[:-1])
+    return np.minimum.reduceat(hashed, starts, axis=1).T.astype(np.uint32)
+
+
+def band_keys(signature):
+    """LSH bucket of each band of `signature`, with the band number in the high bits."""
+    return [
+        (band << 32) | zlib.crc32(rows.tobytes())
+        for band, rows in enumerate(signature.reshape(BANDS, ROWS_PER_BAND))
+    ]
+
+
+def similarity(signature, other):
+    """Estimated Jaccard similarity of two comments' shingles."""
+    return np.count_nonzero(signature == other) / NUM_HASHES
+
+
+class Deduplicator:
+    def __init__(self, connection, threshold=THRESHOLD):
+        self.connection = connection
+        self.threshold = threshold
+        self.linked_posts = 0
+        self.linked_comments = 0
+        self._posts = set()  # Fingerprints of submissions known to be stored
+        self._queued_posts = set()  # Fingerprints queued in this run and not flushed yet
+        self._bands = defaultdict(list)  # Band key -> [(reference, signature)] queued in this run
+
+    def is_duplicate_post(self, fingerprint):
+        """Whether a submission with this fingerprint is already stored."""
+        if fingerprint is None:
+            return False
+        if fingerprint not in self._posts:
+            stored = self.connection.execute(
+                "SELECT 1 FROM reddit_posts WHERE fingerprint = ? AND duplicate_of IS NULL LIMIT 1",
+                (fingerprint,),
+            ).fetchone()
+            if stored is None:
+                return False
+            self._posts.add(fingerprint)
+        self.linked_posts += 1
+        return True
+
+    def is_queued_post(self, fingerprint):
+        """Whether a submission with this fingerprint was queued on a writer that hasn't flushed."""
+        return fingerprint in self._queued_posts
+
+    def queue_post(self, writer, fingerprint):
+        """Remember a submission queued on `writer` until the writer flushes.
+
+        Only the database says whether it was stored: the writer may drop its rows, or the job's
+        lease may have run out, so it is looked up again afterwards.
+        """
+        if fingerprint is None:
+            return
+        self._queued_posts.add(fingerprint)
+        writer.after_flush(lambda: self._queued_posts.discard(fingerprint))
+
+    def _stored_candidates(self, keys):
+        placeholders = ", ".join("?" * len(keys))
+        rows = self.connection.execute(
+            f"""
+            SELECT DISTINCT m.comment_id, m.signature
+            FROM comment_lsh l JOIN comment_minhash m ON m.comment_id = l.comment_id
+            WHERE l.band_key IN ({placeholders})
+        """,
+            keys,
+        )
+        return [(comment_id, np.frombuffer(signature, dtype=np.uint32)) for comment_id, signature in rows]
+
+    def check_comments(self, article_id, reddit_id, bodies):
+        """Return (original, signature, band keys) for each comment body of one submission.
+
+        `original` is the row id of the stored comment it repeats, the (article_id, reddit_id,
+        position) of a comment queued earlier in this run, or None if the comment is new. New
+        comments long enough to compare are remembered for the rest of the run.
+        """
+        sets = [shingles(body) for body in bodies]
+        comparable = [index for index, shingle_set in enumerate(sets) if shingle_set]
+        results = [(None, None, None)] * len(bodies)
+        if not comparable:
+            return results
+
+        signatures = minhash_signatures([sets[index] for index in comparable])
+        keys = [band_keys(signature) for signature in signatures]
+        stored = self._stored_candidates(sorted(set().union(*keys)))
+        for index, signature, own_keys in zip(comparable, signatures, keys):
+            candidates = stored + [
+                candidate for key in own_keys for candidate in self._bands.get(key, ())
+            ]
+            original = next(
+                (
+                    reference
+                    for reference, other in candidates
+                    if similarity(signature, other) >= self.threshold
+                ),
+                None,
+            )
+            if original is not None:
+                self.linked_comments += 1
+                results[index] = (original, None, None)
+                continue
+            reference = (article_id, reddit_id, index + 1)
+            for key in own_keys:
+                self._bands[key].append((reference, signature))
+            results[index] = (None, signature, own_keys)
+        return results
+
+
+def queue_index(writer, article_id, reddit_id, position, signature, keys):
+    """Queue a new comment's signature and LSH buckets, to be written after the comment itself."""
+    writer.add(
+        INSERT_QUEUED_SIGNATURE, (article_id, reddit_id, position, signature.tobytes())
+    )
+    writer.add_many(
+        INSERT_QUEUED_BAND, ((key, article_id, reddit_id, position) for key in keys)
+    )
+
+
+def index_stored_comments(connection, batch_size=1000):
+    """Add every stored comment that isn't indexed yet to the LSH index. Returns how many were added."""
+    rows = connection.execute(
+        """
+        SELECT c.id, c.body FROM reddit_comments c
+        LEFT JOIN comment_minhash m ON m.comment_id = c.id
+        WHERE m.comment_id IS NULL AND c.duplicate_of IS NULL AND c.body != ''
+    """
+    ).fetchall()
+    indexed = 0
+    with BulkWriter(connection) as writer:
+        for start in range(0, len(rows), batch_size):
+            batch = [
+                (comment_id, shingle_set)
+                for comment_id, body in rows[start : start + batch_size]
+                if (shingle_set := shingles(body))
+            ]
+            if not batch:
+                continue
+            signatures = minhash_signatures([shingle_set for _, shingle_set in batch])
+            for (comment_id, _), signature in zip(batch, signatures):
+                writer.add(INSERT_SIGNATURE, (comment_id, signature.tobytes()))
+                writer.add_many(INSERT_BAND, ((key, comment_id) for key in band_keys(signature)))
+            indexed += len(batch)
+    return indexed
+
+
+def dedup_stats(connection):
+    """Return {description: count} of what deduplication has linked and indexed."""
+    return {
+        "linked submissions": connection.execute(
+            "SELECT COUNT(*) FROM reddit_posts WHERE duplicate_of IS NOT NULL"
+        ).fetchone()[0],
+        "linked comments": connection.execute(
+            "SELECT COUNT(*) FROM reddit_comments WHERE duplicate_of IS NOT NULL"
+        ).fetchone()[0],
+        "comment characters not stored again": connection.execute(
+            """
+            SELECT COALESCE(SUM(length(o.body)), 0) FROM reddit_comments c
+            JOIN reddit_comments o ON o.id = c.duplicate_of
+        """
+        ).fetchone()[0],
+        "indexed comments": connection.execute(
+            "SELECT COUNT(*) FROM comment_minhash"
+        ).fetchone()[0],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument("--index", action="store_true", help="index comments not indexed yet")
+    args = parser.parse_args()
+
+    with open_db(args.db) as connection:
+        if args.index:
+            print(f"Indexed {index_stored_comments(connection)} comments.")
+        for description, count in dedup_stats(connection).items():
+            print(f"{description:>36}: {count}")
@@ -3,45 +3,46 @@ dump_to_csv.py
 --------------
 This script compiles article data, including summaries and sentiment analysis, into a CSV file.
 
+Features:
+- Scores only Reddit comments that are new or changed since the last export, in one streamed
+  pass through the shared sentiment engine, and reads all other scores from `comment_sentiment`.
+  The spaCy/TextBlob engine is used by default; `--sentiment lexicon` scores with TextBlob's
+  lexicon directly, without spaCy, and is many times faster.
+- Joins articles, summaries and comment scores in a single ordered query and streams one row per
+  article, so memory use stays flat however large the database grows.
+- Refreshes the per-year, per-month and per-subreddit statistics in `sentiment_stats`
+  (aggregates.py) for the buckets whose scores changed, so plots can read them directly.
+- Optionally writes Apache Parquet instead of CSV, with the sentiment list stored as a native
+  list<double> column (requires `pyarrow`).
+
 Usage:
 - Run script to export data to CSV: `python dump_to_csv.py`
+- Tune sentiment batching: `python dump_to_csv.py --batch-size 512 --n-process 4`
+- Score comments with the lexicon engine: `python dump_to_csv.py --sentiment lexicon`
+- Export to Parquet: `python dump_to_csv.py --format parquet`
 """
 
+import argparse
 import csv
-import sqlite3
-import spacy
-from spacytextblob.spacytextblob import SpacyTextBlob
+from itertools import groupby
 from dotenv import load_dotenv
+from aggregates import refresh_stats
+from db import open_db, DEFAULT_DB
+from sentiment import (
+    update_comment_sentiment,
+    ENGINES,
+    DEFAULT_ENGINE,
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_N_PROCESS,
+)
 from utils import Loader
 
 load_dotenv()
 
-loader = Loader("Parsing tables...")
-
-
-def analyze_comment_sentiment(article_id):
-    nlp = spacy.load("en_core_web_sm")
-    nlp.add_pipe("spacytextblob")
-    connection = sqlite3.connect("news.db")
-    cursor = connection.cursor()
-    cursor.execute(
-        """
-        SELECT comment1, comment2, comment3 FROM reddit_posts WHERE article_id = ?
-    """,
-        (article_id,),
-    )
-    rows = cursor.fetchall()
-
-    sentiments = []
-    for row in rows:
-        for comment in row:
-            if comment:
-                doc = nlp(comment)
-                sentiment = doc._.blob.polarity
-                sentiments.append(sentiment)
+HEADER = ["Article ID", "Title", "Year", "Sentiment List", "URL", "Summary"]
 
-    connection.close()
-    return sentiments
+# Rows per Parquet record batch
+PARQUET_BATCH_SIZE = 10000
 
 
 def get_year(numRows):
@@ -57,39 +58,120 @@ def get_year(numRows):
         return 2022
 
 
-def dump_to_csv(filename="output.csv"):
-    loader.start()
-    connection = sqlite3.connect("news.db")
-    cursor = connection.cursor()
-
-    cursor.execute(
+def iter_export_rows(connection):
+    """Yield (article_id, title, year, sentiments, url, summary) for each article, in one pass."""
+    # A post linked to an earlier copy (dedup.py) shares that copy's comment scores
+    cursor = connection.execute(
         """
-        SELECT n.article_id, n.title, n.url, s.summary
+        SELECT n.article_id, n.title, n.url, substr(n.pub_date, 1, 4),
+               (SELECT s.summary FROM article_summaries s
+                WHERE s.article_id = n.article_id ORDER BY s.id DESC LIMIT 1),
+               cs.polarity
         FROM news n
-        LEFT JOIN article_summaries s ON n.article_id = s.article_id
+        LEFT JOIN reddit_posts r ON r.article_id = n.article_id
+        LEFT JOIN comment_sentiment cs ON cs.post_id = COALESCE(r.duplicate_of, r.id)
+        ORDER BY n.article_id, r.id, cs.slot
     """
     )
-    articles = cursor.fetchall()
-
+    # Rows arrive grouped by article, one per scored comment. Ordering by article_id lets
+    # SQLite walk its unique index, so only one article's comments are ever sorted at once
+    articles = groupby(cursor, key=lambda row: row[0])
+    for i, (_, rows) in enumerate(articles):
+        first = next(rows)
+        article_id, title, url, pub_year, summary, polarity = first
+        sentiments = [polarity] if polarity is not None else []
+        sentiments.extend(row[-1] for row in rows if row[-1] is not None)
+
+        # Articles fetched before publication dates were stored fall back to
+        # inferring the year from the row number
+        year = int(pub_year) if pub_year else get_year(i)
+        yield article_id, title, year, sentiments, url, summary
+
+
+def write_csv(rows, filename, loader):
     with open(filename, mode="w", newline="", encoding="utf-8") as file:
         writer = csv.writer(file)
-        writer.writerow(
-            ["Article ID", "Title", "Year", "Sentiment List", "URL", "Summary"]
-        )
-
-        for i, article in enumerate(articles):
-            article_id, title, url, summary = article
-            loader.desc = f"Preparing export data for article {article_id}..."
+        writer.writerow(HEADER)
+        for row in rows:
+            loader.desc = f"Preparing export data for article {row[0]}..."
+            writer.writerow(row)
+
+
+def write_parquet(rows, filename, loader, batch_size=PARQUET_BATCH_SIZE):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit("Parquet export needs pyarrow: pip install pyarrow")
+
+    schema = pa.schema(
+        [
+            ("Article ID", pa.int64()),
+            ("Title", pa.string()),
+            ("Year", pa.int32()),
+            ("Sentiment List", pa.list_(pa.float64())),
+            ("URL", pa.string()),
+            ("Summary", pa.string()),
+        ]
+    )
+    with pq.ParquetWriter(filename, schema) as writer:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == batch_size:
+                loader.desc = f"Preparing export data for article {row[0]}..."
+                writer.write_batch(pa.RecordBatch.from_arrays(list(zip(*batch)), schema=schema))
+                batch = []
+        if batch:
+            writer.write_batch(pa.RecordBatch.from_arrays(list(zip(*batch)), schema=schema))
+
+
+WRITERS = {"csv": write_csv, "parquet": write_parquet}
+
+
+def dump_to_csv(
+    filename="output.csv",
+    batch_size=DEFAULT_BATCH_SIZE,
+    n_process=DEFAULT_N_PROCESS,
+    db=DEFAULT_DB,
+    connection=None,
+    format="csv",
+    sentiment=DEFAULT_ENGINE,
+):
+    with open_db(db, connection) as connection:
+        _dump_to_csv(connection, filename, batch_size, n_process, format, sentiment)
+
+
+def _dump_to_csv(connection, filename, batch_size, n_process, format, sentiment):
+    loader = Loader("Parsing tables...", stage="export").start()
+
+    loader.desc = "Scoring comment sentiment..."
+    update_comment_sentiment(
+        connection, batch_size=batch_size, n_process=n_process, engine=sentiment
+    )
 
-            sentiments = analyze_comment_sentiment(article_id)
-            year = get_year(i)  # Determine the year based on row number
+    loader.desc = "Refreshing sentiment statistics..."
+    refresh_stats(connection)
 
-            writer.writerow([article_id, title, year, sentiments, url, summary])
+    WRITERS[format](iter_export_rows(connection), filename, loader)
 
-    connection.close()
     loader.desc = f"Data dump to {filename}..."
     loader.stop()
 
 
 if __name__ == "__main__":
-    dump_to_csv()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--n-process", type=int, default=DEFAULT_N_PROCESS)
+    parser.add_argument("--format", choices=sorted(WRITERS), default="csv")
+    parser.add_argument("--sentiment", choices=sorted(ENGINES), default=DEFAULT_ENGINE)
+    parser.add_argument("--output", help="defaults to output.csv or output.parquet")
+    args = parser.parse_args()
+
+    dump_to_csv(
+        filename=args.output or f"output.{args.format}",
+        batch_size=args.batch_size,
+        n_process=args.n_process,
+        format=args.format,
+        sentiment=args.sentiment,
+    )
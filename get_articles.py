@@ -5,77 +5,241 @@ This script fetches article titles from New York Times API and stores them in th
 
 Features:
 - Fetches articles from a particular year based on the existing number of articles in the database.
+- Backfill mode fetches every month archive in a date range concurrently, within the NYT rate limit.
+  Only a few months are downloaded ahead of the database writes, and a month that fails, or
+  whose archive is cut off, is reported and skipped without stopping the others.
+- Archive responses are stream-parsed, so a month with thousands of articles is never held in memory
+  as one JSON document.
+- Articles are deduplicated on their NYT uri and stored with their real publication date.
+- Past month archives are kept in the local response cache (cache.py), so reruns don't download
+  them again. The current month is always downloaded, as new articles keep being added to it, and
+  without the cache an archive is read only as far as the articles that are needed.
 
 Usage:
 - Run script directly to fetch and store articles: `python get_articles.py`
+- Backfill a date range: `python get_articles.py --start 2019-01 --end 2022-12 --workers 4`
+- Skip the response cache: `python get_articles.py --no-cache`
 """
 
+import argparse
 import os
-import sqlite3
-import time
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
+import ijson
 import requests
-from utils import Loader
+from cache import get_cache
+from db import open_db, BulkWriter, DEFAULT_DB
+from metrics import timed_iter, increment
+from utils import Loader, RateLimiter
 from dotenv import load_dotenv
 
 load_dotenv()
 
 nyt_key = os.getenv("NYT_API_KEY")
 
+ARCHIVE_URL = "https://api.nytimes.com/svc/archive/v1/{year}/{month}.json"
 
-def fetch_titles_from_nyt(num_articles=25, db="news.db"):
-    loader = Loader(f"Getting {num_articles} articles from New York Times...").start()
+# The NYT APIs allow 5 requests per minute
+NYT_REQUESTS_PER_MINUTE = 5
 
-    # Establish connection to the database
-    connection = sqlite3.connect(db)
-    cursor = connection.cursor()
+# A month that can't be downloaded, or whose archive is cut off or malformed
+FETCH_ERRORS = (requests.RequestException, ijson.JSONError)
 
-    # Get the current count of articles in the news table
-    cursor.execute("""SELECT COUNT(*) FROM news""")
-    numRows = cursor.fetchone()[0]
-
-    # Determine the year for the NYT API to fetch article from based on the number of
-    # existing articles (to avoid duplicate titles)
-    if 0 <= numRows < 25:
-        year = 2019
-    elif 25 <= numRows < 50:
-        year = 2020
-    elif 50 <= numRows < 75:
-        year = 2021
-    elif 75 <= numRows < 100:
-        year = 2022
-    else:
-        year = 2022
-
-    # Construct query
-    base_url = f"https://api.nytimes.com/svc/archive/v1/{year}/1.json"
-    query_params = {"api-key": nyt_key}
-    response = requests.get(base_url, params=query_params)
-
-    if response.status_code == 200:
-        # Get the current news table's last element
-        news_data = response.json()["response"]["docs"][:num_articles]
-        cursor.execute("SELECT MAX(article_id) FROM news")
-        max_id = cursor.fetchone()[0] or 0
-
-        # actually insert the elements pulled from the api into the news db
-        for story in news_data:
-            max_id += 1
-            cursor.execute(
-                "INSERT INTO news (article_id, title, url) VALUES (?, ?, ?)",
-                (max_id, story["abstract"], story["web_url"]),
+# article_id is assigned in SQL so each row sees the previous row's id, and rows whose
+# uri is already stored are skipped
+INSERT_ARTICLE = """
+    INSERT OR IGNORE INTO news (article_id, title, url, nyt_uri, pub_date)
+    SELECT COALESCE(MAX(article_id), 0) + 1, ?, ?, ?, ? FROM news
+"""
+
+
+def stream_archive(year, month):
+    """Yield (title, url, uri, pub_date) for each article in a month's archive as it is parsed."""
+    response = requests.get(
+        ARCHIVE_URL.format(year=year, month=month),
+        params={"api-key": nyt_key},
+        stream=True,
+    )
+    response.raise_for_status()
+    response.raw.decode_content = True  # Undo gzip before handing the stream to the parser
+    try:
+        for story in ijson.items(response.raw, "response.docs.item"):
+            yield (
+                story.get("abstract"),
+                story.get("web_url"),
+                story.get("uri") or story.get("_id"),
+                story.get("pub_date"),
             )
+    finally:
+        response.close()
 
-        loader.desc = (
-            f"Saving {len(news_data)} New York Times article titles to news table..."
-        )
-        connection.commit()
-        time.sleep(2)
-        loader.stop()
-    else:
+
+def is_current_month(year, month):
+    today = date.today()
+    return (year, month) >= (today.year, today.month)
+
+
+def fetch_archive(year, month, cache=None, rate_limiter=None):
+    """Iterate over every article in a month's archive.
+
+    Past months never change, so they are read from `cache` when it holds them. The current
+    month is still filling up, so it is never cached: it is streamed from the API, and a caller
+    that stops reading early stops the download too.
+    """
+
+    def download():
+        if rate_limiter is not None:
+            rate_limiter.acquire()  # Only requests that miss the cache use up the quota
+        return timed_iter(stream_archive(year, month), "call_seconds", call="nyt_fetch")
+
+    if cache is None or is_current_month(year, month):
+        return download()
+    stories = cache.fetch("nyt", {"archive": [year, month]}, lambda: list(download()))
+    return (tuple(story) for story in stories)
+
+
+def read_archive(year, month, cache=None, rate_limiter=None):
+    """Return every article in a month's archive, for workers that parse a whole month."""
+    return list(fetch_archive(year, month, cache, rate_limiter))
+
+
+def archive_year(article_count):
+    """Year to take new articles from, spreading the articles over several years by how many are stored."""
+    if 0 <= article_count < 25:
+        return 2019
+    elif 25 <= article_count < 50:
+        return 2020
+    elif 50 <= article_count < 75:
+        return 2021
+    return 2022
+
+
+def new_stories(connection, stories, num_articles):
+    """Return up to `num_articles` of `stories` whose uri isn't stored yet, reading no further."""
+    cursor = connection.cursor()
+
+    def is_new(story):
+        cursor.execute("SELECT 1 FROM news WHERE nyt_uri = ?", (story[2],))
+        return cursor.fetchone() is None
+
+    return list(islice(filter(is_new, stories), num_articles))
+
+
+def fetch_titles_from_nyt(num_articles=25, db=DEFAULT_DB, connection=None, cache=None):
+    with open_db(db, connection) as connection:
+        return _fetch_titles_from_nyt(connection, num_articles, cache)
+
+
+def _fetch_titles_from_nyt(connection, num_articles, cache):
+    loader = Loader(f"Getting {num_articles} articles from New York Times...", stage="fetch").start()
+
+    # Get the current count of articles in the news table
+    numRows = connection.execute("SELECT COUNT(*) FROM news").fetchone()[0]
+    year = archive_year(numRows)
+
+    # Skip articles that are already stored, and stop reading once we have enough
+    try:
+        news_data = new_stories(connection, fetch_archive(year, 1, cache), num_articles)
+    except FETCH_ERRORS:
+        increment("items_total", stage="fetch", outcome="failed")
         loader.stop()
         print("Failed to fetch data from New York Times API.")
-    connection.close()
+        return 0
+
+    loader.desc = (
+        f"Saving {len(news_data)} New York Times article titles to news table..."
+    )
+    # actually insert the elements pulled from the api into the news db
+    with BulkWriter(connection) as writer:
+        writer.add_many(INSERT_ARTICLE, news_data)
+    increment("items_total", len(news_data), stage="fetch", outcome="done")
+    loader.stop()
+    return len(news_data)
+
+
+def month_range(start, end):
+    """List (year, month) pairs from `start` to `end` inclusive, both given as "YYYY-MM"."""
+    year, month = map(int, start.split("-"))
+    end_year, end_month = map(int, end.split("-"))
+    months = []
+    while (year, month) <= (end_year, end_month):
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def backfill(
+    start,
+    end,
+    workers=4,
+    rate_limiter=None,
+    db=DEFAULT_DB,
+    connection=None,
+    cache=None,
+):
+    """Fetch every article published between `start` and `end` ("YYYY-MM"). Returns how many were new."""
+    with open_db(db, connection) as connection:
+        return _backfill(connection, month_range(start, end), workers, rate_limiter, cache)
+
+
+def _backfill(connection, months, workers, rate_limiter, cache):
+    loader = Loader(
+        f"Backfilling {len(months)} months of New York Times articles...", stage="fetch"
+    ).start()
+    rate_limiter = rate_limiter or RateLimiter(NYT_REQUESTS_PER_MINUTE)
+
+    # Counted from the table, as total_changes also counts the rows triggers write
+    count_before = connection.execute("SELECT COUNT(*) FROM news").fetchone()[0]
+    writer = BulkWriter(connection)
+    failed = []
+    done = 0
+    remaining = iter(months)
+    futures = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+
+        def submit(count):
+            for year, month in islice(remaining, count):
+                future = executor.submit(read_archive, year, month, cache, rate_limiter)
+                futures[future] = (year, month)
+
+        # Only a few months are downloaded ahead of the writer, so a backfill of many years
+        # holds no more than those in memory
+        submit(2 * workers)
+        while futures:
+            finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in finished:
+                year, month = futures.pop(future)
+                submit(1)
+                done += 1
+                try:
+                    stories = future.result()
+                except FETCH_ERRORS as error:
+                    failed.append((year, month))
+                    print(f"\nFailed to fetch {year}-{month:02d}: {error}")
+                    increment("items_total", stage="fetch", outcome="failed")
+                    continue
+                # Only this thread writes; workers just download and parse
+                writer.add_many(INSERT_ARTICLE, stories)
+                increment("items_total", len(stories), stage="fetch", outcome="done")
+                loader.desc = f"Fetched {done}/{len(months)} months (latest: {year}-{month:02d}, {len(stories)} articles)..."
+    writer.flush()
+
+    loader.desc = f"Backfilled {len(months) - len(failed)}/{len(months)} months of New York Times articles..."
+    loader.stop()
+    return connection.execute("SELECT COUNT(*) FROM news").fetchone()[0] - count_before
 
 
 if __name__ == "__main__":
-    fetch_titles_from_nyt()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--start", help="first month to backfill, as YYYY-MM")
+    parser.add_argument("--end", help="last month to backfill, as YYYY-MM")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--no-cache", action="store_true")
+    args = parser.parse_args()
+    cache = None if args.no_cache else get_cache()
+
+    if args.start:
+        backfill(args.start, args.end or args.start, workers=args.workers, cache=cache)
+    else:
+        fetch_titles_from_nyt(cache=cache)
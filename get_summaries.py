@@ -1,121 +1,226 @@
 """
 get_summaries.py
 ----------------
-This script generates summaries for articles based on their related Reddit discussions using Azure's Text Analytics API.
+This script generates summaries for articles based on their related Reddit discussions, using
+Azure's Text Analytics API or a local TextRank summarizer (summarizers.py).
 
 Features:
 - Summarizes discussions and the article content and updates `article_summaries` database.
+- Sends up to 25 articles per Azure request and keeps several requests in flight at once.
+  Each summary is matched back to its article by document id.
+- With `--summarizer textrank`, summarizes on the local CPU instead, with no Azure credentials.
+- Picks relevant comments with the title keywords stored by keywords.py, matched as whole words
+  by a scorer from relevance.py. The `overlap` scorer puts the comments that mention the most
+  keywords first, and the `index` scorer matches them in the full-text index of comments.
+- Summaries are kept in the local response cache (cache.py), so text that was already summarized is
+  never sent to Azure again.
+- Takes its articles from the `summarize` queue of the jobs table (jobs.py), so several instances
+  can run at once without summarizing the same article twice. Documents Azure rejects, and
+  requests that fail, are retried later with backoff.
 - Marks articles as summarized in the database (news table) once processed.
 
 Usage:
 - Run script directly to summarize content and update database: `python get_summaries.py`
+- Summarize more articles per run: `python get_summaries.py --limit 200 --in-flight 4`
+- Skip the response cache: `python get_summaries.py --no-cache`
+- Summarize locally, without Azure: `python get_summaries.py --summarizer textrank`
+- Rank comments by keyword overlap, also matching inflections: `python get_summaries.py --relevance overlap --inflections`
+- Match keywords in the full-text index: `python get_summaries.py --relevance index`
 """
 
-import os
-import sqlite3
-import spacy
-from azure.ai.textanalytics import TextAnalyticsClient, ExtractiveSummaryAction
-from azure.core.credentials import AzureKeyCredential
-from dotenv import load_dotenv
+import argparse
+from itertools import groupby
+from cache import get_cache
+from db import open_db, BulkWriter, DEFAULT_DB
+from jobs import claim, ack, fail, article_titles, OWNS_LEASE, SUMMARIZE
+from keywords import get_keywords
+from relevance import make_scorer, select_relevant, IndexScorer, SCORERS, DEFAULT_SCORER
+from search_corpus import matching_comment_ids
+from summarizers import (
+    make_summarizer,
+    SUMMARIZERS,
+    DEFAULT_SUMMARIZER,
+    MAX_DOCUMENTS_PER_REQUEST,
+    DEFAULT_IN_FLIGHT,
+)
+from metrics import increment
 from utils import Loader
 
-load_dotenv()
-
-def authenticate_azure():
-    ta_credential = AzureKeyCredential(os.getenv("AZURE_LANGUAGE_KEY"))
-    text_analytics_client = TextAnalyticsClient(
-        endpoint=os.getenv("AZURE_LANGUAGE_ENDPOINT"), credential=ta_credential
-    )
-    return text_analytics_client
-
-
-azure_client = authenticate_azure()
-
-
-def is_relevant(comment, keywords):
-    return any(keyword in comment.lower() for keyword in keywords)
 
+def build_document(
+    cursor, title_keywords, article_id, ny_times_title, relevance=DEFAULT_SCORER, inflections=False
+):
+    """Join the article title with its Reddit titles and relevant comments into one text."""
+    # A linked post's comments are read from its first copy, and repeated comments are left out
+    rows = cursor.execute(
+        """
+        SELECT r.id, r.reddit_title, c.id, c.body
+        FROM reddit_posts r
+        LEFT JOIN reddit_comments c
+            ON c.post_id = COALESCE(r.duplicate_of, r.id) AND c.duplicate_of IS NULL
+        WHERE r.article_id = ?
+        ORDER BY r.id, c.position
+    """,
+        (article_id,),
+    ).fetchall()
+
+    # Compiled once per article and reused for every comment
+    scorer = make_scorer(relevance, title_keywords.split(), inflections)
+    if isinstance(scorer, IndexScorer):
+        # One index lookup for all of the article's comments
+        ids = matching_comment_ids(cursor, scorer.query, [row[2] for row in rows if row[2]])
+        scorer.matched = {body for _, _, comment_id, body in rows if comment_id in ids}
+    text_components = [ny_times_title]
+
+    # One row per comment, so each post's rows are grouped back together
+    for (_, reddit_title), post_rows in groupby(rows, key=lambda row: row[:2]):
+        comments = [row[3] for row in post_rows]
+        relevant_texts = [reddit_title] + select_relevant(comments, scorer)
+        text_components.extend(relevant_texts)
+
+    return " ".join([str(text) for text in text_components])
+
+
+def summary_request(text):
+    """Cache key for summarizing `text` with the action this script uses."""
+    return {"action": "extractive_summary", "max_sentence_count": 1, "text": text}
+
+
+def save_summary(writer, job, summary):
+    with writer.atomic():
+        writer.add(
+            f"INSERT INTO article_summaries (article_id, summary) SELECT ?, ? WHERE {OWNS_LEASE}",
+            (job.article_id, summary, job.id, job.token),
+        )
+        writer.add(
+            "UPDATE news SET is_summarized = 1 WHERE article_id = ?",
+            (job.article_id,),
+        )
+        ack(writer, job)
+
+
+def summarize_comments(
+    summarizer,
+    limit=25,
+    db=DEFAULT_DB,
+    connection=None,
+    cache=None,
+    relevance=DEFAULT_SCORER,
+    inflections=False,
+):
+    """Summarize the next `limit` queued articles. Returns how many were attempted."""
+    with open_db(db, connection) as connection:
+        return _summarize_comments(
+            connection, summarizer, limit, cache, relevance, inflections
+        )
 
-def summarize_comments(client):
-    loader = Loader("Summarizing...").start()
-    connection = sqlite3.connect("news.db")
-    cursor = connection.cursor()
 
-    nlp = spacy.load("en_core_web_sm")
+def prepare_documents(
+    connection, writer, jobs, cache=None, source=None, relevance=DEFAULT_SCORER, inflections=False
+):
+    """Build the document to summarize for each job's article.
 
-    cursor.execute(
-        """
-        SELECT DISTINCT n.article_id, n.title
-        FROM news n
-        WHERE n.is_summarized = 0
-        LIMIT 25
+    Articles with nothing to summarize are failed, and those whose text is in the cache under
+    `source` are saved right away. Returns (documents, texts, jobs, cached, failed): the documents
+    left to summarize, their texts and jobs keyed by document id, and how many jobs were saved
+    from the cache or failed here.
     """
+    documents, texts, by_id = [], {}, {}
+    cached_count = failed_count = 0
+    if not jobs:
+        return documents, texts, by_id, cached_count, failed_count
+    cursor = connection.cursor()
+    titles = article_titles(connection, jobs)
+    # Usually stored by the search stage already, so spaCy isn't loaded here at all
+    keywords = get_keywords(connection, [job.article_id for job in jobs])
+
+    for job in jobs:
+        full_text = build_document(
+            cursor,
+            keywords[job.article_id],
+            job.article_id,
+            titles[job.article_id],
+            relevance,
+            inflections,
+        )
+        if not full_text:
+            fail(writer, job, "nothing to summarize")
+            increment("items_total", stage="summarize", outcome="failed")
+            failed_count += 1
+            continue
+        # Text that was summarized before is answered from the cache, without a request
+        cached = cache.get(source, summary_request(full_text)) if source else None
+        if cached is not None:
+            save_summary(writer, job, cached)
+            increment("items_total", stage="summarize", outcome="done")
+            cached_count += 1
+        else:
+            documents.append({"id": str(job.article_id), "text": full_text})
+            texts[str(job.article_id)] = full_text
+            by_id[str(job.article_id)] = job
+    return documents, texts, by_id, cached_count, failed_count
+
+
+def store_result(writer, job, summary, error, text, cache=None, source=None):
+    """Queue one summarizer result: the summary and the job's ack, or the job's failure."""
+    if error is not None:
+        fail(writer, job, error)
+        increment("items_total", stage="summarize", outcome="failed")
+    else:
+        save_summary(writer, job, summary)
+        increment("items_total", stage="summarize", outcome="done")
+        if source:
+            cache.set(source, summary_request(text), summary)
+
+
+def _summarize_comments(connection, summarizer, limit, cache, relevance, inflections):
+    loader = Loader("Summarizing...", stage="summarize").start()
+    # Only backends that call out to a service have their summaries cached
+    source = summarizer.cache_source if cache is not None else None
+
+    articles = claim(connection, SUMMARIZE, limit)
+    writer = BulkWriter(connection)
+    loader.desc = f"Collecting discussions for {len(articles)} articles..."
+    documents, texts, jobs, _, _ = prepare_documents(
+        connection, writer, articles, cache, source, relevance, inflections
     )
-    articles = cursor.fetchall()
-
-    for article_id, ny_times_title in articles:
-        loader.desc = f"Summarizing article {article_id}..."
-        cursor.execute(
-            """
-            SELECT r.reddit_title, r.comment1, r.comment2, r.comment3, r.comment4, r.comment5
-            FROM reddit_posts r
-            WHERE r.article_id = ?
-        """,
-            (article_id,),
+
+    for summarized, (document_id, summary, error) in enumerate(
+        summarizer.summarize(documents), start=1
+    ):
+        store_result(
+            writer, jobs[document_id], summary, error, texts[document_id], cache, source
         )
-        reddit_posts = cursor.fetchall()
-
-        doc = nlp(ny_times_title)
-        keywords = [
-            token.text.lower() for token in doc if token.pos_ in ["NOUN", "PROPN"]
-        ]
-        text_components = [ny_times_title]
-
-        for reddit_post in reddit_posts:
-            reddit_title = reddit_post[0]
-            comments = reddit_post[1:]
-            relevant_texts = [reddit_title] + [
-                comment
-                for comment in comments
-                if comment and is_relevant(comment, keywords)
-            ]
-            text_components.extend(relevant_texts)
-
-        full_text = " ".join([str(text) for text in text_components])
-
-        if full_text:
-            document = [full_text]
-            poller = client.begin_analyze_actions(
-                document, actions=[ExtractiveSummaryAction(max_sentence_count=1)]
-            )
-            document_results = poller.result()
-
-            for result in document_results:
-                for summary_result in result:
-                    if summary_result.is_error:
-                        print(
-                            f"Error: {summary_result.code} - {summary_result.message}"
-                        )
-                    else:
-                        summary = "".join(
-                            sentence.text for sentence in summary_result.sentences
-                        )
-                        cursor.execute(
-                            "INSERT INTO article_summaries (article_id, summary) VALUES (?, ?)",
-                            (article_id, summary),
-                        )
-                        cursor.execute(
-                            "UPDATE news SET is_summarized = 1 WHERE article_id = ?",
-                            (article_id,),
-                        )
+        loader.desc = f"Summarized {summarized}/{len(documents)} articles..."
+
     if not articles:
         print("\nNo unprocessed articles left.")
 
-    connection.commit()
-    connection.close()
-    loader.desc = "Summarizing next 25 un-summarized articles..."
+    writer.flush()
+    loader.desc = f"Summarizing next {len(articles)} un-summarized articles..."
     loader.stop()
+    return len(articles)
 
 
 if __name__ == "__main__":
-    summarize_comments(azure_client)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--summarizer", choices=sorted(SUMMARIZERS), default=DEFAULT_SUMMARIZER)
+    parser.add_argument("--limit", type=int, default=25)
+    parser.add_argument("--batch-size", type=int, default=MAX_DOCUMENTS_PER_REQUEST)
+    parser.add_argument("--in-flight", type=int, default=DEFAULT_IN_FLIGHT)
+    parser.add_argument("--relevance", choices=sorted(SCORERS), default=DEFAULT_SCORER)
+    parser.add_argument("--inflections", action="store_true")
+    parser.add_argument("--no-cache", action="store_true")
+    args = parser.parse_args()
+
+    options = {}
+    if args.summarizer == "azure":
+        options = {"batch_size": args.batch_size, "in_flight": args.in_flight}
+
+    summarize_comments(
+        make_summarizer(args.summarizer, **options),
+        limit=args.limit,
+        cache=None if args.no_cache else get_cache(),
+        relevance=args.relevance,
+        inflections=args.inflections,
+    )
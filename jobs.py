@@ -0,0 +1,190 @@
+"""
+jobs.py
+-------
+This file provides the durable work queue that the Reddit search and summarization stages take
+their articles from, stored in the `jobs` table of the news database.
+
+Includes:
+- claim: Atomically leases the next ready jobs of a queue to the caller. Jobs whose lease runs out
+         (because their worker crashed or hung) become claimable again.
+- ack / fail: Queue a job's completion or failure on a BulkWriter, so they commit in the same
+              transaction as the job's results. Failed jobs are retried with exponential backoff
+              and moved to the dead-letter state after too many attempts.
+- OWNS_LEASE: SQL condition that is only true while the caller's claim is the latest one on a
+              job. Stages guard their result inserts with it, so a worker whose lease ran out and
+              was taken over can't store duplicate rows.
+- count_open / count_by_state / retry_dead: Inspect and manage the queues.
+
+Jobs are created by triggers (migration 5 in setup.py): a `search` job for every new article,
+and a `summarize` job once its search job is done. Any number of worker processes on the same
+machine can claim from the same queue. Machines sharing the database file over a network drive
+can't: the database runs in WAL mode (db.py), which only works when every process is on one host.
+
+Usage:
+- Show how many jobs are in each state: `python jobs.py`
+- Give dead-lettered jobs a fresh set of attempts: `python jobs.py --retry-dead`
+"""
+
+import argparse
+import os
+import socket
+import time
+import uuid
+from collections import namedtuple
+from db import open_db, DEFAULT_DB
+
+SEARCH = "search"
+SUMMARIZE = "summarize"
+QUEUES = [SEARCH, SUMMARIZE]
+
+DEFAULT_LEASE_SECONDS = 600
+DEFAULT_MAX_ATTEMPTS = 5
+BACKOFF_SECONDS = 30  # Doubled after every failed attempt
+MAX_BACKOFF_SECONDS = 60 * 60
+
+# Identifies this process in the `lease_owner` column, for whoever is inspecting the queue
+WORKER = f"{socket.gethostname()}:{os.getpid()}"
+
+Job = namedtuple("Job", ["id", "article_id", "attempts", "token"])
+
+# Every claim gets a new token, and a job keeps its token when it is acked, so results queued in
+# the same transaction as the ack still pass this check
+OWNS_LEASE = "EXISTS (SELECT 1 FROM jobs WHERE id = ? AND lease_token = ?)"
+
+
+def claim(
+    connection,
+    queue,
+    limit,
+    lease_seconds=DEFAULT_LEASE_SECONDS,
+    max_attempts=DEFAULT_MAX_ATTEMPTS,
+):
+    """Lease up to `limit` ready jobs from `queue` and return them as Jobs."""
+    now = time.time()
+    token = uuid.uuid4().hex
+    # IMMEDIATE takes the write lock up front, so no other process can claim the same jobs
+    # between the SELECT and the UPDATE
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        # A worker that took its last attempt and never reported back used up the job. The
+        # state IN (...) term matches idx_jobs_open, so only open jobs are scanned
+        connection.execute(
+            """
+            UPDATE jobs SET state = 'dead', last_error = 'lease expired', updated_at = ?
+            WHERE queue = ? AND state IN ('pending', 'leased')
+              AND state = 'leased' AND lease_expires_at <= ? AND attempts >= ?
+        """,
+            (now, queue, now, max_attempts),
+        )
+        rows = connection.execute(
+            """
+            SELECT id, article_id, attempts FROM jobs
+            WHERE queue = ? AND state IN ('pending', 'leased')
+              AND (CASE state WHEN 'pending' THEN available_at ELSE lease_expires_at END) <= ?
+            ORDER BY id
+            LIMIT ?
+        """,
+            (queue, now, limit),
+        ).fetchall()
+        connection.executemany(
+            """
+            UPDATE jobs
+            SET state = 'leased', attempts = attempts + 1, lease_owner = ?, lease_token = ?,
+                lease_expires_at = ?, updated_at = ?
+            WHERE id = ?
+        """,
+            [(WORKER, token, now + lease_seconds, now, job_id) for job_id, _, _ in rows],
+        )
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    return [Job(job_id, article_id, attempts + 1, token) for job_id, article_id, attempts in rows]
+
+
+def ack(writer, job):
+    """Queue marking `job` done. Has no effect if the lease has since passed to another worker."""
+    writer.add(
+        """
+        UPDATE jobs SET state = 'done', last_error = NULL, updated_at = ?
+        WHERE id = ? AND lease_token = ? AND state = 'leased'
+    """,
+        (time.time(), job.id, job.token),
+    )
+
+
+def article_titles(connection, jobs):
+    """Return {article_id: title} for the articles of `jobs`."""
+    article_ids = [job.article_id for job in jobs]
+    placeholders = ", ".join("?" * len(article_ids))
+    return dict(
+        connection.execute(
+            f"SELECT article_id, title FROM news WHERE article_id IN ({placeholders})",
+            article_ids,
+        )
+    )
+
+
+def backoff(attempts):
+    """Seconds to wait before retrying a job that has failed `attempts` times."""
+    return min(BACKOFF_SECONDS * 2 ** (attempts - 1), MAX_BACKOFF_SECONDS)
+
+
+def fail(writer, job, error, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """Queue a retry of `job` after a backoff, or move it to the dead letters if it is out of attempts."""
+    now = time.time()
+    state = "dead" if job.attempts >= max_attempts else "pending"
+    writer.add(
+        """
+        UPDATE jobs
+        SET state = ?, available_at = ?, lease_token = NULL, last_error = ?, updated_at = ?
+        WHERE id = ? AND lease_token = ? AND state = 'leased'
+    """,
+        (state, now + backoff(job.attempts), str(error), now, job.id, job.token),
+    )
+
+
+def count_open(connection, queue):
+    """Number of jobs in `queue` that are waiting or being worked on."""
+    return connection.execute(
+        "SELECT COUNT(*) FROM jobs WHERE queue = ? AND state IN ('pending', 'leased')",
+        (queue,),
+    ).fetchone()[0]
+
+
+def count_by_state(connection):
+    """Return {(queue, state): count} for every queue."""
+    rows = connection.execute("SELECT queue, state, COUNT(*) FROM jobs GROUP BY queue, state")
+    return {(queue, state): count for queue, state, count in rows}
+
+
+def retry_dead(connection, queue=None):
+    """Make dead-lettered jobs claimable again with a fresh set of attempts. Returns how many."""
+    cursor = connection.execute(
+        """
+        UPDATE jobs SET state = 'pending', attempts = 0, available_at = 0, updated_at = ?
+        WHERE state = 'dead' AND (? IS NULL OR queue = ?)
+    """,
+        (time.time(), queue, queue),
+    )
+    connection.commit()
+    return cursor.rowcount
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument("--retry-dead", action="store_true")
+    parser.add_argument("--queue", choices=QUEUES)
+    args = parser.parse_args()
+
+    with open_db(args.db) as connection:
+        if args.retry_dead:
+            print(f"Requeued {retry_dead(connection, args.queue)} dead jobs.")
+        counts = count_by_state(connection)
+        for queue in QUEUES:
+            states = ", ".join(
+                f"{counts.get((queue, state), 0)} {state}"
+                for state in ("pending", "leased", "done", "dead")
+            )
+            print(f"{queue}: {states}")
@@ -0,0 +1,88 @@
+"""
+keywords.py
+-----------
+This file extracts the keywords of article titles, which search_reddit.py searches Reddit for and
+get_summaries.py uses to pick relevant comments.
+
+Includes:
+- extract_keywords: Tags titles in batches through `nlp.pipe()` with only the tagging components
+                    of the shared pipeline enabled, and keeps their nouns and proper nouns.
+- get_keywords: Returns the keywords of the given articles from the `news_keywords` table,
+                extracting and storing any that are missing, so each title goes through spaCy
+                once across all stages and reruns.
+
+Usage:
+- Extract keywords for every stored article ahead of time: `python keywords.py`
+
+Details:
+- Keywords are stored as one space-separated string per title, in their original case.
+- Stored keywords are recomputed when the spaCy model version changes.
+"""
+
+from importlib.metadata import version
+from db import open_db, DEFAULT_DB
+from metrics import timed_iter
+from models import load_nlp, pipes_except, TAGGER_PIPES
+from utils import Loader
+
+DEFAULT_BATCH_SIZE = 256
+
+KEYWORD_POS = ["NOUN", "PROPN"]
+
+
+def analyzer_version():
+    """Version string stored with the keywords, read without loading the model."""
+    return f"en_core_web_sm-{version('en_core_web_sm')}"
+
+
+def extract_keywords(titles, batch_size=DEFAULT_BATCH_SIZE):
+    """Yield the keywords of each title in the given iterable, in order."""
+    nlp = load_nlp()
+    docs = nlp.pipe(titles, batch_size=batch_size, disable=pipes_except(nlp, *TAGGER_PIPES))
+    for doc in timed_iter(docs, "call_seconds", call="spacy_keywords"):
+        yield " ".join(token.text for token in doc if token.pos_ in KEYWORD_POS)
+
+
+def get_keywords(connection, article_ids, batch_size=DEFAULT_BATCH_SIZE):
+    """Return {article_id: keywords} for the given articles, extracting any not stored yet."""
+    current = analyzer_version()
+    placeholders = ", ".join("?" * len(article_ids))
+    rows = connection.execute(
+        f"""
+        SELECT n.article_id, n.title, k.keywords, k.analyzer_version
+        FROM news n
+        LEFT JOIN news_keywords k ON k.article_id = n.article_id
+        WHERE n.article_id IN ({placeholders})
+    """,
+        list(article_ids),
+    ).fetchall()
+
+    keywords = {
+        article_id: stored
+        for article_id, _, stored, stored_version in rows
+        if stored_version == current
+    }
+    missing = [
+        (article_id, title) for article_id, title, _, _ in rows if article_id not in keywords
+    ]
+    if missing:
+        extracted = extract_keywords((title for _, title in missing), batch_size)
+        new = [(article_id, words) for (article_id, _), words in zip(missing, extracted)]
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO news_keywords (article_id, keywords, analyzer_version) VALUES (?, ?, ?)",
+                [(article_id, words, current) for article_id, words in new],
+            )
+        keywords.update(new)
+    return keywords
+
+
+if __name__ == "__main__":
+    with open_db(DEFAULT_DB) as connection:
+        loader = Loader("Extracting title keywords...", stage="keywords").start()
+        article_ids = [row[0] for row in connection.execute("SELECT article_id FROM news")]
+        # Chunked to stay under SQLite's limit on query parameters
+        for start in range(0, len(article_ids), 500):
+            get_keywords(connection, article_ids[start : start + 500])
+            loader.desc = f"Extracted keywords for {min(start + 500, len(article_ids))}/{len(article_ids)} articles..."
+        loader.stop()
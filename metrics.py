@@ -0,0 +1,233 @@
+"""
+metrics.py
+----------
+This file records how long each stage and each external call of the pipeline takes, how often
+calls fail, and how much work went through, and exports the results.
+
+Includes:
+- Metrics: Thread-safe timers and counters, each identified by a metric name and a few labels.
+           Every observation can also be appended to a JSON-lines log as it happens, and the
+           totals can be written out in the Prometheus text format.
+- get_metrics: Returns the metrics shared by the whole process.
+- timer / increment / observe / timed_iter: Shortcuts for recording to the shared metrics.
+
+Metrics:
+- `stage_seconds{stage}`: Duration of each stage run, recorded by the stage's Loader (utils.py).
+- `call_seconds{call}`: Duration of each external call: `nyt_fetch`, `reddit_search`,
+  `reddit_replace_more`, `spacy_pipe`, `spacy_keywords`, `lexicon_score`, `azure_submit`,
+  `azure_poll` and `db_write`.
+- `call_errors_total{call}`: Calls that raised an exception.
+- `items_total{stage, outcome}`: Articles or comments a stage finished or failed.
+- `rows_written_total`: Rows written to the database through BulkWriter (db.py).
+
+Usage:
+- Log every observation: `python run.py --metrics metrics.jsonl`
+- Write the totals for Prometheus' textfile collector: `python run.py --prometheus news.prom`
+- Scripts run on their own read the `METRICS_LOG` and `METRICS_PROMETHEUS` environment variables.
+
+Details:
+- Timers are exported as Prometheus summaries (`_count` and `_sum`) with a `_max` gauge.
+- The Prometheus file is written when the process exits, or when `write_prometheus` is called.
+"""
+
+import atexit
+import json
+import os
+import time
+from contextlib import contextmanager
+from threading import Lock
+
+PREFIX = "news_"
+
+HELP = {
+    "stage_seconds": "Time spent in each stage run.",
+    "call_seconds": "Time spent in each external call.",
+    "call_errors_total": "External calls that raised an exception.",
+    "stage_errors_total": "Stage runs that raised an exception.",
+    "items_total": "Items each stage finished or failed.",
+    "rows_written_total": "Rows written to the database by BulkWriter flushes.",
+}
+
+
+def label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def format_labels(key):
+    if not key:
+        return ""
+    pairs = ",".join(f'{name}="{value}"' for name, value in key)
+    return "{" + pairs + "}"
+
+
+class Metrics:
+    def __init__(self, log_path=None, prometheus_path=None):
+        self.prometheus_path = prometheus_path
+        self._timers = {}  # (name, labels) -> [count, total seconds, max seconds]
+        self._counters = {}  # (name, labels) -> value
+        self._log = None
+        self._lock = Lock()
+        if log_path:
+            self.open_log(log_path)
+
+    def open_log(self, path):
+        """Append every following observation to `path`, one JSON object per line."""
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+            self._log = open(path, "a", encoding="utf-8")
+
+    def _write(self, kind, name, labels, value):
+        # Called with the lock held
+        if self._log is not None:
+            event = {"time": time.time(), "type": kind, "name": name, "labels": labels, "value": value}
+            self._log.write(json.dumps(event) + "\n")
+
+    def observe(self, name, seconds, **labels):
+        key = (name, label_key(labels))
+        with self._lock:
+            timer = self._timers.get(key)
+            if timer is None:
+                self._timers[key] = [1, seconds, seconds]
+            else:
+                timer[0] += 1
+                timer[1] += seconds
+                timer[2] = max(timer[2], seconds)
+            self._write("timer", name, labels, seconds)
+
+    def increment(self, name, value=1, **labels):
+        key = (name, label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+            self._write("counter", name, labels, value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Time the block. A block that raises is still timed, and counted as an error."""
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.increment(name.replace("_seconds", "_errors_total"), **labels)
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed_iter(self, iterable, name, **labels):
+        """Yield from `iterable`, timing only the work done producing its items, and record the
+        total as one observation once it is exhausted or closed."""
+        iterator = iter(iterable)
+        elapsed = 0.0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    elapsed += time.perf_counter() - start
+                    break
+                elapsed += time.perf_counter() - start
+                yield item
+        finally:
+            # Also recorded when the caller stops early, or the iterable raises
+            self.observe(name, elapsed, **labels)
+
+    def snapshot(self):
+        """Return {"timers": ..., "counters": ...} with every metric's current totals."""
+        with self._lock:
+            return {
+                "timers": [
+                    {"name": name, "labels": dict(key), "count": count, "sum": total, "max": longest}
+                    for (name, key), (count, total, longest) in sorted(self._timers.items())
+                ],
+                "counters": [
+                    {"name": name, "labels": dict(key), "value": value}
+                    for (name, key), value in sorted(self._counters.items())
+                ],
+            }
+
+    def prometheus(self):
+        """Every metric's totals in the Prometheus text exposition format."""
+        with self._lock:
+            timers = sorted(self._timers.items())
+            counters = sorted(self._counters.items())
+
+        lines = []
+        described = set()
+        for (name, key), (count, total, longest) in timers:
+            metric = PREFIX + name
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {metric} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {metric} summary")
+            lines.append(f"{metric}_count{format_labels(key)} {count}")
+            lines.append(f"{metric}_sum{format_labels(key)} {total:.6f}")
+        for (name, key), (count, total, longest) in timers:
+            metric = f"{PREFIX}{name}_max"
+            if metric not in described:
+                described.add(metric)
+                lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric}{format_labels(key)} {longest:.6f}")
+        for (name, key), value in counters:
+            metric = PREFIX + name
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {metric} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{format_labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path=None):
+        """Write the totals to `path`, replacing it in one step so a collector never reads half a file."""
+        path = path or self.prometheus_path
+        if not path:
+            return
+        temporary = f"{path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            file.write(self.prometheus())
+        os.replace(temporary, path)
+
+    def close(self):
+        self.write_prometheus()
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+
+
+_metrics = None
+
+
+def get_metrics():
+    """Return the process-wide metrics, creating them on first use."""
+    global _metrics
+    if _metrics is None:
+        _metrics = Metrics(os.getenv("METRICS_LOG"), os.getenv("METRICS_PROMETHEUS"))
+        atexit.register(_metrics.close)
+    return _metrics
+
+
+def configure(log_path=None, prometheus_path=None):
+    """Point the shared metrics at a JSON-lines log and a Prometheus file, as from CLI flags."""
+    metrics = get_metrics()
+    if log_path:
+        metrics.open_log(log_path)
+    if prometheus_path:
+        metrics.prometheus_path = prometheus_path
+    return metrics
+
+
+def timer(name, **labels):
+    return get_metrics().timer(name, **labels)
+
+
+def observe(name, seconds, **labels):
+    get_metrics().observe(name, seconds, **labels)
+
+
+def increment(name, value=1, **labels):
+    get_metrics().increment(name, value, **labels)
+
+
+def timed_iter(iterable, name, **labels):
+    return get_metrics().timed_iter(iterable, name, **labels)
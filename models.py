@@ -0,0 +1,41 @@
+"""
+models.py
+---------
+This file loads the spaCy pipeline shared by every stage that needs NLP.
+
+Includes:
+- load_nlp: Returns the process-wide `en_core_web_sm` pipeline with the spaCyTextBlob component
+            added, loading it only on first use. Stages turn off the components they don't
+            need per call, so keyword extraction and sentiment scoring share one model.
+
+spaCy itself is only imported by load_nlp, as importing it takes about a second. Modules that
+import this one stay cheap to import until a stage actually needs the model.
+"""
+
+SENTIMENT_PIPE = "spacytextblob"
+
+# What part-of-speech tagging needs: the tagger reads the shared tok2vec layer, and
+# attribute_ruler maps its fine-grained tags to the coarse `pos_` tags
+TAGGER_PIPES = ("tok2vec", "tagger", "attribute_ruler")
+
+# No stage uses dependency parses or named entities, so these are never loaded
+EXCLUDED_COMPONENTS = ["parser", "ner"]
+
+_nlp = None
+
+
+def load_nlp():
+    """Return the shared spaCy pipeline, loading it once per process."""
+    global _nlp
+    if _nlp is None:
+        import spacy
+        from spacytextblob.spacytextblob import SpacyTextBlob  # Registers the "spacytextblob" pipe
+
+        _nlp = spacy.load("en_core_web_sm", exclude=EXCLUDED_COMPONENTS)
+        _nlp.add_pipe(SENTIMENT_PIPE)
+    return _nlp
+
+
+def pipes_except(nlp, *names):
+    """Names of every component in `nlp` other than `names`, for use as `disable=`."""
+    return [pipe for pipe in nlp.pipe_names if pipe not in names]
@@ -0,0 +1,425 @@
+"""
+pipeline.py
+-----------
+This script runs the data collection stages as one streaming pipeline, so each article moves on to
+the next stage as soon as it is ready, instead of waiting for every other article to get there.
+
+Features:
+- Fetches New York Times articles, searches Reddit, scores comment sentiment and summarizes at the
+  same time, in one asyncio event loop. Stages are connected by bounded queues: when a stage falls
+  behind, the stages feeding it wait rather than piling up work.
+- Each stage has its own number of workers. Requests and model inference run in worker threads;
+  every database read and write happens on the event loop's thread, through one connection.
+- Searches and summaries are still claimed from the jobs table (jobs.py), so the pipeline also
+  picks up jobs left by earlier runs, can run next to the batch scripts, and loses nothing if it is
+  interrupted. Each article's results are committed as soon as it finishes a stage.
+- Shows every stage's queue depth, finished articles and throughput while it runs, and prints them
+  for each stage at the end.
+
+Usage:
+- Run the streaming pipeline: `python pipeline.py`
+- Backfill a range of months: `python pipeline.py --start 2021-01 --end 2021-06 --search-workers 8`
+- Only work through the queued jobs, without fetching: `python pipeline.py --no-fetch`
+- Summarize locally and score with the lexicon: `python pipeline.py --summarizer textrank --sentiment lexicon`
+- Export stage and call timings (metrics.py): `python pipeline.py --metrics metrics.jsonl --prometheus news.prom`
+"""
+
+import argparse
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from cache import get_cache
+from db import open_db, BulkWriter, DEFAULT_DB
+from dedup import Deduplicator
+from get_articles import (
+    archive_year,
+    read_archive,
+    new_stories,
+    month_range,
+    INSERT_ARTICLE,
+    FETCH_ERRORS,
+    NYT_REQUESTS_PER_MINUTE,
+)
+from get_summaries import prepare_documents, store_result
+from jobs import claim, fail, SEARCH, SUMMARIZE
+from keywords import get_keywords
+from relevance import DEFAULT_SCORER
+from search_reddit import (
+    fetch_reddit_posts,
+    search_errors,
+    save_reddit_posts,
+    make_reddit_client,
+    REDDIT_REQUESTS_PER_MINUTE,
+    DEFAULT_COMMENTS_PER_POST,
+)
+from sentiment import (
+    get_engine,
+    pending_comments,
+    store_comment_scores,
+    ENGINES,
+    DEFAULT_ENGINE,
+)
+from summarizers import (
+    make_summarizer,
+    SUMMARIZERS,
+    DEFAULT_SUMMARIZER,
+    MAX_DOCUMENTS_PER_REQUEST,
+)
+from metrics import configure, increment, observe
+from utils import Loader, RateLimiter
+
+STAGES = ["fetch", "search", "score", "summarize"]
+DEFAULT_WORKERS = {"fetch": 2, "search": 4, "score": 1, "summarize": 2}
+DEFAULT_QUEUE_SIZE = 32
+
+# How long a stage waits to be told about new jobs before looking in the jobs table anyway
+POLL_SECONDS = 1.0
+SCORE_BATCH_SIZE = 64
+
+
+class Stage:
+    def __init__(self, name, workers, queue_size):
+        self.name = name
+        self.workers = workers
+        self.queue = asyncio.Queue(queue_size)
+        self.ready = asyncio.Event()  # Set when the stage before this one has made new jobs
+        self.finished = False  # Set once no more work will arrive
+        self.done = 0
+        self.failed = 0
+        self.peak = 0  # Deepest the queue has been
+        self.started = time.monotonic()
+        self.ended = None
+
+    def throughput(self):
+        """Articles (months, for the fetch stage) finished per second so far."""
+        elapsed = (self.ended or time.monotonic()) - self.started
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def describe(self):
+        self.peak = max(self.peak, self.queue.qsize())
+        return (
+            f"{self.name} {self.queue.qsize()}/{self.queue.maxsize} queued, "
+            f"{self.done} done ({self.throughput():.1f}/s)"
+        )
+
+    def finish(self, downstream=None):
+        self.finished = True
+        self.ended = time.monotonic()
+        if downstream is not None:
+            downstream.ready.set()
+
+
+async def take_batch(queue, size):
+    """Wait for one item, then take any others already queued, up to `size` in all.
+
+    Returns (items, ended), where `ended` says the queue's end marker (None) was reached.
+    """
+    items = []
+    item = await queue.get()
+    while item is not None:
+        items.append(item)
+        if len(items) == size or queue.empty():
+            return items, False
+        item = queue.get_nowait()
+    return items, True
+
+
+async def feed_jobs(connection, queue, stage, upstream, prepare=None):
+    """Claim `queue`'s jobs into `stage` as they become ready, until `upstream` is finished and
+    none are left, then put one end marker per worker."""
+    while True:
+        upstream_finished = upstream.finished
+        stage.ready.clear()
+        jobs = claim(connection, queue, max(stage.queue.maxsize - stage.queue.qsize(), 1))
+        if jobs and prepare is not None:
+            prepare(jobs)
+        for job in jobs:
+            await stage.queue.put(job)  # Waits while the stage is full
+        if jobs:
+            continue
+        # Checked before claiming, so jobs made just before the upstream stage finished are seen
+        if upstream_finished:
+            break
+        try:
+            await asyncio.wait_for(stage.ready.wait(), POLL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+    for _ in range(stage.workers):
+        await stage.queue.put(None)
+
+
+async def fetch_worker(connection, writer, stage, search, cache, rate_limiter):
+    while (item := await stage.queue.get()) is not None:
+        year, month, limit = item
+        try:
+            stories = await asyncio.to_thread(read_archive, year, month, cache, rate_limiter)
+        except FETCH_ERRORS as error:
+            print(f"\nFailed to fetch {year}-{month:02d}: {error}")
+            stage.failed += 1
+            increment("items_total", stage="fetch", outcome="failed")
+            continue
+        if limit is not None:
+            stories = new_stories(connection, stories, limit)
+        # Each new article gets a search job from a trigger as it is inserted
+        writer.add_many(INSERT_ARTICLE, stories)
+        writer.flush()
+        stage.done += 1
+        increment("items_total", len(stories), stage="fetch", outcome="done")
+        search.ready.set()
+
+
+async def search_worker(
+    writer,
+    deduplicator,
+    stage,
+    score,
+    summarize,
+    keywords,
+    client_factory,
+    rate_limiter,
+    cache,
+    comments,
+):
+    client = client_factory()  # PRAW clients are not thread-safe, so each worker has its own
+    errors = search_errors()
+    while (job := await stage.queue.get()) is not None:
+        try:
+            rows = await asyncio.to_thread(
+                fetch_reddit_posts,
+                client,
+                job.article_id,
+                keywords.pop(job.article_id),
+                rate_limiter,
+                cache,
+                comments,
+            )
+        except errors as error:
+            print(f"\nSearch for article {job.article_id} failed: {error}")
+            fail(writer, job, error)
+            writer.flush()
+            stage.failed += 1
+            increment("items_total", stage="search", outcome="failed")
+            continue
+        # Acking the search job makes the article's summary job, so commit it right away
+        save_reddit_posts(writer, job, rows, deduplicator)
+        writer.flush()
+        stage.done += 1
+        increment("items_total", stage="search", outcome="done")
+        summarize.ready.set()
+        await score.queue.put(job.article_id)  # Waits while scoring is behind
+
+
+async def score_worker(connection, stage, engine_name):
+    analyzer_version = ENGINES[engine_name].analyzer_version()
+    engine = None
+    ended = False
+    while not ended:
+        article_ids, ended = await take_batch(stage.queue, SCORE_BATCH_SIZE)
+        if not article_ids:
+            continue
+        pending = pending_comments(connection, engine_name, analyzer_version, article_ids)
+        if pending:
+            # Loaded on first use, off the event loop, and shared by every score worker
+            engine = engine or await asyncio.to_thread(get_engine, engine_name)
+            items = [(comment, (post_id, slot, comment)) for post_id, slot, comment in pending]
+            scored = await asyncio.to_thread(lambda: list(engine.score_with_context(items)))
+            store_comment_scores(connection, engine_name, analyzer_version, scored)
+        stage.done += len(article_ids)
+
+
+async def summarize_worker(
+    connection, writer, stage, summarizer, cache, relevance, inflections
+):
+    source = summarizer.cache_source if cache is not None else None
+    ended = False
+    while not ended:
+        jobs, ended = await take_batch(stage.queue, MAX_DOCUMENTS_PER_REQUEST)
+        if not jobs:
+            continue
+        documents, texts, by_id, cached, failed = prepare_documents(
+            connection, writer, jobs, cache, source, relevance, inflections
+        )
+        results = []
+        if documents:
+            results = await asyncio.to_thread(lambda: list(summarizer.summarize(documents)))
+        errors = 0
+        for document_id, summary, error in results:
+            store_result(
+                writer, by_id[document_id], summary, error, texts[document_id], cache, source
+            )
+            errors += error is not None
+        writer.flush()
+        # Articles answered from the cache and those with nothing to summarize were handled
+        # before the summarizer ran
+        stage.done += cached + len(results) - errors
+        stage.failed += failed + errors
+
+
+async def report(loader, stages, interval=0.5):
+    while True:
+        loader.desc = " | ".join(stage.describe() for stage in stages)
+        await asyncio.sleep(interval)
+
+
+async def run_streaming(
+    connection,
+    months=None,
+    num_articles=25,
+    fetch=True,
+    workers=None,
+    queue_size=DEFAULT_QUEUE_SIZE,
+    client_factory=make_reddit_client,
+    summarizer=None,
+    cache=None,
+    sentiment=DEFAULT_ENGINE,
+    comments_per_post=DEFAULT_COMMENTS_PER_POST,
+    relevance=DEFAULT_SCORER,
+    inflections=False,
+    nyt_rate_limiter=None,
+    reddit_rate_limiter=None,
+    dedup=True,
+):
+    """Run every stage at once until all of their work is done. Returns {stage name: Stage}."""
+    workers = {**DEFAULT_WORKERS, **(workers or {})}
+    # One thread for every worker of every stage, so no stage waits on another for a thread
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=sum(workers.values()))
+    )
+    summarizer = summarizer or make_summarizer(DEFAULT_SUMMARIZER)
+    nyt_rate_limiter = nyt_rate_limiter or RateLimiter(NYT_REQUESTS_PER_MINUTE)
+    reddit_rate_limiter = reddit_rate_limiter or RateLimiter(REDDIT_REQUESTS_PER_MINUTE)
+    stages = {name: Stage(name, workers[name], queue_size) for name in STAGES}
+    fetch_stage, search, score, summarize = stages.values()
+    writer = BulkWriter(connection)
+    deduplicator = Deduplicator(connection) if dedup else None
+
+    # Months to fetch, as (year, month, how many new articles to keep or None for all)
+    if not fetch:
+        items = []
+    elif months:
+        items = [(year, month, None) for year, month in months]
+    else:
+        count = connection.execute("SELECT COUNT(*) FROM news").fetchone()[0]
+        items = [(archive_year(count), 1, num_articles)]
+
+    async def run_fetch():
+        async def feed():
+            for item in items + [None] * fetch_stage.workers:
+                await fetch_stage.queue.put(item)
+
+        await asyncio.gather(
+            feed(),
+            *(
+                fetch_worker(connection, writer, fetch_stage, search, cache, nyt_rate_limiter)
+                for _ in range(fetch_stage.workers)
+            ),
+        )
+        fetch_stage.finish(search)
+
+    async def run_search():
+        keywords = {}
+
+        def prepare(jobs):
+            # One spaCy batch per claim, on this thread, so search workers only wait on Reddit
+            keywords.update(get_keywords(connection, [job.article_id for job in jobs]))
+
+        await asyncio.gather(
+            feed_jobs(connection, SEARCH, search, fetch_stage, prepare),
+            *(
+                search_worker(
+                    writer,
+                    deduplicator,
+                    search,
+                    score,
+                    summarize,
+                    keywords,
+                    client_factory,
+                    reddit_rate_limiter,
+                    cache,
+                    comments_per_post,
+                )
+                for _ in range(search.workers)
+            ),
+        )
+        search.finish(summarize)
+        for _ in range(score.workers):
+            await score.queue.put(None)
+
+    async def run_score():
+        await asyncio.gather(
+            *(score_worker(connection, score, sentiment) for _ in range(score.workers))
+        )
+        score.finish()
+
+    async def run_summarize():
+        await asyncio.gather(
+            feed_jobs(connection, SUMMARIZE, summarize, search),
+            *(
+                summarize_worker(
+                    connection, writer, summarize, summarizer, cache, relevance, inflections
+                )
+                for _ in range(summarize.workers)
+            ),
+        )
+        summarize.finish()
+
+    loader = Loader("Starting pipeline...", stage="streaming").start()
+    reporter = asyncio.create_task(report(loader, stages.values()))
+    try:
+        await asyncio.gather(run_fetch(), run_search(), run_score(), run_summarize())
+    finally:
+        reporter.cancel()
+        writer.flush()
+        loader.desc = "Streaming pipeline..."
+        loader.stop()
+
+    for stage in stages.values():
+        observe("stage_seconds", stage.ended - stage.started, stage=stage.name)
+        print(
+            f"{stage.name:>10}: {stage.done} done, {stage.failed} failed, "
+            f"{stage.throughput():.2f}/s, deepest queue {stage.peak}/{stage.queue.maxsize}"
+        )
+    return stages
+
+
+def stream(db=DEFAULT_DB, connection=None, **options):
+    """Run the streaming pipeline on `db`, or on `connection` if given. Returns {stage name: Stage}."""
+    with open_db(db, connection) as connection:
+        return asyncio.run(run_streaming(connection, **options))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument("--start", help="first month to backfill, as YYYY-MM")
+    parser.add_argument("--end", help="last month to backfill, as YYYY-MM")
+    parser.add_argument("--articles", type=int, default=25, help="new articles to fetch without --start")
+    parser.add_argument("--no-fetch", action="store_true")
+    for name in STAGES:
+        parser.add_argument(f"--{name}-workers", type=int, default=DEFAULT_WORKERS[name])
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE)
+    parser.add_argument("--comments", type=int, default=DEFAULT_COMMENTS_PER_POST)
+    parser.add_argument("--summarizer", choices=sorted(SUMMARIZERS), default=DEFAULT_SUMMARIZER)
+    parser.add_argument("--sentiment", choices=sorted(ENGINES), default=DEFAULT_ENGINE)
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument(
+        "--no-dedup", action="store_true", help="store near-duplicate comments again"
+    )
+    parser.add_argument("--metrics", help="append every timing and count to this JSON-lines file")
+    parser.add_argument("--prometheus", help="write metric totals to this file on exit")
+    args = parser.parse_args()
+    configure(args.metrics, args.prometheus)
+
+    stream(
+        db=args.db,
+        months=month_range(args.start, args.end or args.start) if args.start else None,
+        num_articles=args.articles,
+        fetch=not args.no_fetch,
+        workers={name: getattr(args, f"{name}_workers") for name in STAGES},
+        queue_size=args.queue_size,
+        summarizer=make_summarizer(args.summarizer),
+        cache=None if args.no_cache else get_cache(),
+        sentiment=args.sentiment,
+        comments_per_post=args.comments,
+        dedup=not args.no_dedup,
+    )
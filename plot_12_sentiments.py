@@ -11,17 +11,19 @@ Features:
 
 Usage:
 - Run script generate and display the sentiment plots: `python sentiment_plot.py`
+- To write the charts to image files instead, see render.py.
 
 Details:
 - Sentiment List should be a list of float values representing sentiment scores of comments.
+- Data is read through plot_data.py, which caches the parsed scores between runs.
 """
 
-import csv
 import math
 import random
 import textwrap
 import webbrowser
 import matplotlib.pyplot as plt
+from plot_data import load_sentiment_data, CATEGORIES
 
 def clip_summary(summary, max_chars=90):
     if len(summary) > max_chars:
@@ -29,62 +31,57 @@ def clip_summary(summary, max_chars=90):
     return summary
 
 
+def draw_article(ax, title, year, summary, category_counts):
+    wrapped_title = textwrap.fill(f"{clip_summary(title)} ({year})", width=50)
+    clipped_summary = clip_summary(summary)
+    wrapped_summary = textwrap.fill(f"Summary: {clipped_summary}", width=50)
+
+    ax.bar(CATEGORIES, category_counts, color=["red", "gray", "green"])
+    ax.set_title(wrapped_title, fontsize=8, color="blue", picker=True)
+    ax.text(
+        0.5,
+        -0.30,
+        wrapped_summary,
+        transform=ax.transAxes,
+        fontsize=8,
+        ha="center",
+        va="top",
+        wrap=True,
+    )
+    ax.set_xlabel("Sentiment Category", fontsize=8)
+    ax.set_ylabel("Number of Comments", fontsize=8)
+
+
 def plot_selected_news_opinions(filename, sample_size=12):
-    with open(filename, mode="r", encoding="utf-8") as file:
-        reader = csv.DictReader(file)
-        articles = list(reader)
+    data = load_sentiment_data(filename)
 
-    if not articles:
+    if not len(data):
         print("No news articles found in CSV.")
         return
 
-    if len(articles) > sample_size:
-        articles = random.sample(articles, sample_size)
+    indexes = range(len(data))
+    if len(data) > sample_size:
+        indexes = random.sample(indexes, sample_size)
+
+    # Negative/Neutral/Positive comment counts for every article at once
+    all_category_counts = data.category_counts()
 
-    n_articles = len(articles)
+    n_articles = len(indexes)
     cols = 4  # Fixed number of columns
     rows = math.ceil(n_articles / cols)  # Calculate number of rows needed
 
     fig, axs = plt.subplots(rows, cols, figsize=(12, 2 * rows))
     axs = axs.flatten() if n_articles > 1 else [axs]
 
-    for i, article in enumerate(articles):
-        ax = axs[i]
-        title = article["Title"]
-        year = article["Year"]
-        url = article["URL"]
-        sentiment_list = eval(article["Sentiment List"])
-        summary = article["Summary"]
-
-        wrapped_title = textwrap.fill(f"{clip_summary(title)} ({year})", width=50)
-        clipped_summary = clip_summary(summary)
-        wrapped_summary = textwrap.fill(f"Summary: {clipped_summary}", width=50)
-
-        sentiment_scores = [float(score) for score in sentiment_list]
-        categories = ["Negative", "Neutral", "Positive"]
-        category_counts = [0, 0, 0]
-        for score in sentiment_scores:
-            if score < 0:
-                category_counts[0] += 1
-            elif score == 0:
-                category_counts[1] += 1
-            else:
-                category_counts[2] += 1
-
-        ax.bar(categories, category_counts, color=["red", "gray", "green"])
-        ax.set_title(wrapped_title, fontsize=8, color="blue", picker=True)
-        ax.text(
-            0.5,
-            -0.30,
-            wrapped_summary,
-            transform=ax.transAxes,
-            fontsize=8,
-            ha="center",
-            va="top",
-            wrap=True,
+    for i, index in enumerate(indexes):
+        url = str(data.urls[index])
+        draw_article(
+            axs[i],
+            str(data.titles[index]),
+            data.years[index],
+            str(data.summaries[index]),
+            all_category_counts[index],
         )
-        ax.set_xlabel("Sentiment Category", fontsize=8)
-        ax.set_ylabel("Number of Comments", fontsize=8)
 
         def on_pick(event):
             artist = event.artist
@@ -107,4 +104,5 @@ def plot_selected_news_opinions(filename, sample_size=12):
     plt.show()
 
 
-plot_selected_news_opinions("output.csv")
+if __name__ == "__main__":
+    plot_selected_news_opinions("output.csv")
@@ -0,0 +1,232 @@
+"""
+plot_data.py
+------------
+This file loads the exported article data for the plotting scripts, so each of them doesn't
+re-parse output.csv and walk every score in Python.
+
+Includes:
+- SentimentData: Every article's fields, plus all comment scores in one flat NumPy array with
+                 per-article offsets. Category counts, means and spreads are computed as
+                 vectorized reductions over that array.
+- load_sentiment_data: Reads output.csv (or a Parquet export from dump_to_csv.py) into a
+                       SentimentData. The parsed arrays are cached next to the file and reused for
+                       as long as the file's modification time and size are unchanged.
+- load_year_stats / load_max_spreads: Per-year statistics for plot.py and highest_lowest.py. From
+                                      news.db they are a few rows of the `sentiment_stats` table
+                                      kept by aggregates.py; from an export they are computed from
+                                      a SentimentData.
+- default_source: news.db once it holds statistics, otherwise output.csv.
+
+Details:
+- "Sentiment List" is parsed as a list of numbers, never evaluated as Python code.
+"""
+
+import csv
+import os
+import sqlite3
+import numpy as np
+from aggregates import get_stats
+from db import DEFAULT_DB
+
+CATEGORIES = ["Negative", "Neutral", "Positive"]
+
+# Bumped whenever the cached arrays change shape, so stale caches are rebuilt
+CACHE_VERSION = 1
+
+# SentimentData's arrays, in constructor order
+FIELDS = ["article_ids", "titles", "years", "urls", "summaries", "scores", "offsets"]
+
+
+class SentimentData:
+    def __init__(self, article_ids, titles, years, urls, summaries, scores, offsets):
+        self.article_ids = article_ids
+        self.titles = titles
+        self.years = years
+        self.urls = urls
+        self.summaries = summaries
+        self.scores = scores  # Every comment score, article after article
+        self.offsets = offsets  # Article i's scores are scores[offsets[i]:offsets[i + 1]]
+
+    def __len__(self):
+        return len(self.article_ids)
+
+    @property
+    def counts(self):
+        """Number of scored comments per article."""
+        return np.diff(self.offsets)
+
+    def scores_for(self, i):
+        return self.scores[self.offsets[i] : self.offsets[i + 1]]
+
+    def _score_categories(self):
+        # np.sign maps negative/neutral/positive scores to -1/0/1, so +1 gives the category index
+        return np.sign(self.scores).astype(np.int64) + 1
+
+    def category_counts(self):
+        """(articles, 3) array of Negative/Neutral/Positive comment counts per article."""
+        article_index = np.repeat(np.arange(len(self)), self.counts)
+        flat = np.bincount(
+            article_index * 3 + self._score_categories(), minlength=len(self) * 3
+        )
+        return flat.reshape(len(self), 3)
+
+    def year_stats(self):
+        """Return (years, totals, counts, category_counts) over all comments, per year."""
+        years, year_index = np.unique(self.years, return_inverse=True)
+        score_year = np.repeat(year_index, self.counts)
+        totals = np.bincount(score_year, weights=self.scores, minlength=len(years))
+        counts = np.bincount(score_year, minlength=len(years))
+        category_counts = np.bincount(
+            score_year * 3 + self._score_categories(), minlength=len(years) * 3
+        ).reshape(len(years), 3)
+        return years, totals, counts, category_counts
+
+    def spreads(self):
+        """Max minus min score per article, NaN for articles without comments."""
+        spreads = np.full(len(self), np.nan)
+        has_scores = self.counts > 0
+        # With empty articles removed, each non-empty article's scores run up to the
+        # next non-empty article's start, which is what reduceat expects
+        starts = self.offsets[:-1][has_scores]
+        spreads[has_scores] = np.maximum.reduceat(self.scores, starts) - np.minimum.reduceat(
+            self.scores, starts
+        )
+        return spreads
+
+    def max_spread_by_year(self):
+        """Return (years, article indexes, spreads) for the most divided article of each year."""
+        spreads = self.spreads()
+        years, indexes, values = [], [], []
+        for year in np.unique(self.years):
+            candidates = np.flatnonzero((self.years == year) & ~np.isnan(spreads))
+            if len(candidates):
+                best = candidates[np.argmax(spreads[candidates])]
+                years.append(year)
+                indexes.append(best)
+                values.append(spreads[best])
+        return years, indexes, values
+
+
+def parse_sentiment_lists(fields):
+    """Parse "[0.1, -0.2]" strings into one flat float array plus offsets."""
+    bodies = [field.strip()[1:-1].strip() for field in fields]
+    counts = np.array(
+        [body.count(",") + 1 if body else 0 for body in bodies], dtype=np.int64
+    )
+    offsets = np.zeros(len(bodies) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    joined = ",".join(body for body in bodies if body)
+    # NumPy converts the strings to floats in C, which is much faster than float() per score
+    scores = np.array(joined.split(","), dtype=np.float64) if joined else np.zeros(0)
+    return scores, offsets
+
+
+def read_csv(filename):
+    with open(filename, mode="r", encoding="utf-8") as file:
+        reader = csv.DictReader(file)
+        articles = list(reader)
+
+    scores, offsets = parse_sentiment_lists(
+        [article["Sentiment List"] for article in articles]
+    )
+    return SentimentData(
+        np.array([int(article["Article ID"]) for article in articles], dtype=np.int64),
+        np.array([article["Title"] for article in articles], dtype=str),
+        np.array([int(article["Year"]) for article in articles], dtype=np.int64),
+        np.array([article["URL"] for article in articles], dtype=str),
+        np.array([article["Summary"] for article in articles], dtype=str),
+        scores,
+        offsets,
+    )
+
+
+def read_parquet(filename):
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(filename)
+    sentiments = table.column("Sentiment List").combine_chunks()
+    offsets = sentiments.offsets.to_numpy().astype(np.int64)
+    return SentimentData(
+        table.column("Article ID").to_numpy().astype(np.int64),
+        np.array(table.column("Title").to_pylist(), dtype=str),
+        table.column("Year").to_numpy().astype(np.int64),
+        np.array(table.column("URL").to_pylist(), dtype=str),
+        np.array(
+            [summary or "" for summary in table.column("Summary").to_pylist()], dtype=str
+        ),
+        sentiments.values.to_numpy(zero_copy_only=False)[offsets[0] : offsets[-1]],
+        offsets - offsets[0],
+    )
+
+
+def load_sentiment_data(filename="output.csv", use_cache=True):
+    """Load exported article data, reusing the cached arrays while the file is unchanged."""
+    stat = os.stat(filename)
+    cache_path = f"{filename}.npz"
+    key = np.array([CACHE_VERSION, stat.st_mtime_ns, stat.st_size], dtype=np.int64)
+
+    if use_cache and os.path.exists(cache_path):
+        with np.load(cache_path) as cached:
+            if np.array_equal(cached["key"], key):
+                return SentimentData(*(cached[field] for field in FIELDS))
+
+    reader = read_parquet if filename.endswith(".parquet") else read_csv
+    data = reader(filename)
+    if use_cache:
+        with open(cache_path, "wb") as file:
+            np.savez(file, key=key, **{field: getattr(data, field) for field in FIELDS})
+    return data
+
+
+def _read_stats(db, grain):
+    """Return the BucketStats of `grain` from `db`, or [] if it has none yet."""
+    connection = sqlite3.connect(f"file:{db}?mode=ro", uri=True)
+    try:
+        return get_stats(connection, grain)
+    except sqlite3.OperationalError:  # Not migrated yet, so there is no statistics table
+        return []
+    finally:
+        connection.close()
+
+
+def default_source():
+    if os.path.exists(DEFAULT_DB) and _read_stats(DEFAULT_DB, "year"):
+        return DEFAULT_DB
+    return "output.csv"
+
+
+def load_year_stats(source="output.csv"):
+    """Return (years, totals, counts, category_counts) over all comments, per year."""
+    if not source.endswith(".db"):
+        return load_sentiment_data(source).year_stats()
+
+    stats = _read_stats(source, "year")
+    return (
+        np.array([int(row.bucket) for row in stats], dtype=np.int64),
+        np.array([row.total for row in stats], dtype=np.float64),
+        np.array([row.count for row in stats], dtype=np.int64),
+        np.array(
+            [[row.negative, row.neutral, row.positive] for row in stats], dtype=np.int64
+        ).reshape(len(stats), 3),
+    )
+
+
+def load_max_spreads(source="output.csv"):
+    """Return (years, titles, spreads) for the most divided article of each year."""
+    if not source.endswith(".db"):
+        data = load_sentiment_data(source)
+        years, indexes, spreads = data.max_spread_by_year()
+        return years, [str(data.titles[index]) for index in indexes], spreads
+
+    stats = _read_stats(source, "year")
+    connection = sqlite3.connect(f"file:{source}?mode=ro", uri=True)
+    try:
+        titles = [
+            connection.execute(
+                "SELECT title FROM news WHERE article_id = ?", (row.max_spread_article_id,)
+            ).fetchone()[0]
+            for row in stats
+        ]
+    finally:
+        connection.close()
+    return [int(row.bucket) for row in stats], titles, [row.max_spread for row in stats]
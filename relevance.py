@@ -0,0 +1,144 @@
+"""
+relevance.py
+------------
+This file decides which Reddit comments are relevant to an article, for get_summaries.py.
+
+Includes:
+- KeywordMatcher: Compiles an article's keywords into a single regular expression
+                  that only matches whole words ("war" no longer matches "software"), so each
+                  comment is scanned once however many keywords there are.
+- AnyKeywordScorer: Scores a comment 1 if it mentions any keyword, otherwise 0.
+- OverlapScorer: Scores a comment by the share of the keywords it mentions, so comments can be
+                 ranked by how much of the article they talk about.
+- IndexScorer: Scores a comment 1 if it mentions any keyword, like AnyKeywordScorer, but the
+               matching is done by the full-text index of comments (search_corpus.py), so no
+               comment text is scanned in Python.
+- SCORERS / make_scorer: Registry of scorers by name.
+- select_relevant: Keeps the comments a scorer rates above zero, best first.
+
+Details:
+- With `inflections=True`, keywords also match their common English inflections ("vote" matches
+  "votes", "voted" and "voting"), as a cheap stand-in for lemma matching that doesn't run spaCy
+  over every comment. A final silent "e" is dropped before "ing"; irregular forms such as "dying"
+  are not matched.
+- The cost of the expression barely grows with the number of keywords, while the substring scan
+  it replaced ran once per keyword. The substring scan is still faster for articles with few
+  keywords: about 1.5x at 8 keywords, and up to 1.15x at 16. From about 32 keywords the compiled
+  matcher is faster. OverlapScorer finds every keyword in a comment rather than the first one, so
+  it is slower again. `python -m benchmarks.bench_relevance` measures all of them. The compiled
+  matcher is used anyway, as the substring scan also matched words that merely contain a keyword
+  ("war" in "software").
+"""
+
+import re
+
+# Suffixes accepted after a keyword when matching inflections
+SUFFIXES = ["s", "es", "d", "ed", "ing"]
+INFLECTIONS = rf"(?:{'|'.join(SUFFIXES)})?"
+
+
+def e_drop_stem(keyword):
+    """The stem `keyword` takes before "ing" if it drops its final "e" ("vote" -> "vot"), or None.
+    Words ending in "ee", "oe" or "ye" keep it ("agreeing", "canoeing")."""
+    if len(keyword) > 2 and keyword.endswith("e") and not keyword.endswith(("ee", "oe", "ye")):
+        return keyword[:-1]
+    return None
+
+
+class KeywordMatcher:
+    def __init__(self, keywords, inflections=False):
+        self.keywords = sorted({keyword.lower() for keyword in keywords if keyword})
+        # Stems of the keywords that drop their "e" before "ing", mapped back to the keyword
+        self.stems = {}
+        if inflections:
+            self.stems = {
+                stem: keyword for keyword in self.keywords if (stem := e_drop_stem(keyword))
+            }
+        self.pattern = None
+        if self.keywords:
+            # Longest first, so a keyword that starts with another one is tried before it
+            alternatives = "|".join(
+                re.escape(keyword) for keyword in sorted(self.keywords, key=len, reverse=True)
+            )
+            suffix = INFLECTIONS if inflections else ""
+            # Lookarounds rather than \b, which never matches next to punctuation as in "U.S.".
+            # The suffix sits in the lookahead so each match is exactly the keyword it found
+            expression = rf"(?:{alternatives})(?={suffix}(?!\w))"
+            if self.stems:
+                stems = "|".join(
+                    re.escape(stem) for stem in sorted(self.stems, key=len, reverse=True)
+                )
+                expression += rf"|(?:{stems})(?=ing(?!\w))"
+            self.pattern = re.compile(rf"(?<!\w)(?:{expression})")
+
+    def search(self, text):
+        """True if `text` mentions any keyword."""
+        # Lowercasing once is cheaper than matching with re.IGNORECASE
+        return self.pattern is not None and self.pattern.search(text.lower()) is not None
+
+    def matches(self, text):
+        """The set of keywords mentioned in `text`."""
+        if self.pattern is None:
+            return set()
+        found = set(self.pattern.findall(text.lower()))
+        return {self.stems.get(match, match) for match in found} if self.stems else found
+
+
+class AnyKeywordScorer:
+    def __init__(self, keywords, inflections=False):
+        self.matcher = KeywordMatcher(keywords, inflections)
+
+    def score(self, comment):
+        return 1.0 if self.matcher.search(comment) else 0.0
+
+
+class OverlapScorer:
+    def __init__(self, keywords, inflections=False):
+        self.matcher = KeywordMatcher(keywords, inflections)
+
+    def score(self, comment):
+        if not self.matcher.keywords:
+            return 0.0
+        return len(self.matcher.matches(comment)) / len(self.matcher.keywords)
+
+
+def match_expression(keywords, inflections=False):
+    """FTS5 query matching any of `keywords` as whole words, or None if there are none."""
+    suffixes = [""] + (SUFFIXES if inflections else [])
+    terms = sorted({keyword.lower() for keyword in keywords if keyword})
+    words = [term + suffix for term in terms for suffix in suffixes]
+    if inflections:
+        words += [stem + "ing" for term in terms if (stem := e_drop_stem(term))]
+    return " OR ".join('"' + word.replace('"', '""') + '"' for word in words) or None
+
+
+class IndexScorer:
+    """Scores a comment 1 if the full-text index found a keyword in it, otherwise 0.
+
+    Matching happens in SQLite: build_document looks the article's comments up with `query` and
+    fills `matched` before any comment is scored.
+    """
+
+    def __init__(self, keywords, inflections=False):
+        self.query = match_expression(keywords, inflections)
+        self.matched = set()
+
+    def score(self, comment):
+        return 1.0 if comment in self.matched else 0.0
+
+
+SCORERS = {"any": AnyKeywordScorer, "overlap": OverlapScorer, "index": IndexScorer}
+DEFAULT_SCORER = "any"
+
+
+def make_scorer(name, keywords, inflections=False):
+    return SCORERS[name](keywords, inflections)
+
+
+def select_relevant(comments, scorer):
+    """Return the comments `scorer` rates above zero, highest first; ties keep their order."""
+    scored = [(scorer.score(comment), comment) for comment in comments if comment]
+    ranked = sorted(
+        (pair for pair in scored if pair[0] > 0), key=lambda pair: pair[0], reverse=True
+    )
+    return [comment for _, comment in ranked]
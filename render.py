@@ -0,0 +1,186 @@
+"""
+render.py
+---------
+This script writes every chart to image files without opening a window, so reports can be
+built on headless servers.
+
+Features:
+- Draws with matplotlib's Agg backend; no display is needed.
+- Writes one chart per article, one per year, and the most controversial article chart, as PNG
+  and/or SVG, using the same drawing code as the interactive plotting scripts.
+- Spreads figure drawing over a pool of worker processes.
+- Keeps a manifest of each figure's input data in the output directory, and skips figures whose
+  data hasn't changed since they were last written.
+
+Usage:
+- Render all charts from output.csv into figures/: `python render.py`
+- Choose the input, formats, output directory and workers:
+  `python render.py --source output.parquet --format png svg --out-dir report --workers 8`
+- Redraw every figure: `python render.py --force`
+"""
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+import matplotlib.pyplot as plt
+from highest_lowest import draw_controversy
+from plot import draw_year
+from plot_12_sentiments import draw_article
+from plot_data import load_sentiment_data
+from utils import Loader
+
+# Bumped whenever the drawing code changes, so every figure is redrawn once
+RENDER_VERSION = 1
+
+MANIFEST = "manifest.json"
+FORMATS = ["png", "svg"]
+
+
+def article_figures(data):
+    """Yield (kind, name, inputs) for the chart of every article."""
+    category_counts = data.category_counts()
+    for i in range(len(data)):
+        yield "article", f"articles/{data.article_ids[i]}", {
+            "title": str(data.titles[i]),
+            "year": int(data.years[i]),
+            "summary": str(data.summaries[i]),
+            "category_counts": category_counts[i].tolist(),
+        }
+
+
+def year_figures(data):
+    years, totals, counts, category_counts = data.year_stats()
+    for i, year in enumerate(years):
+        yield "year", f"years/{year}", {
+            "year": int(year),
+            "category_counts": category_counts[i].tolist(),
+            "avg_sentiment": float(totals[i] / counts[i]),
+        }
+
+
+def controversy_figures(data):
+    years, indexes, spreads = data.max_spread_by_year()
+    if years:
+        yield "controversy", "controversy", {
+            "max_years": [int(year) for year in years],
+            "titles": [str(data.titles[index]) for index in indexes],
+            "differences": [float(spread) for spread in spreads],
+        }
+
+
+def input_key(kind, inputs):
+    """Fingerprint of everything a figure is drawn from."""
+    payload = json.dumps([RENDER_VERSION, kind, inputs], sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def draw_article_figure(inputs):
+    fig, ax = plt.subplots(figsize=(4, 3))
+    draw_article(ax, **inputs)
+    return fig
+
+
+def draw_year_figure(inputs):
+    fig, ax = plt.subplots(figsize=(6, 4.5))
+    draw_year(ax, **inputs)
+    return fig
+
+
+DRAWERS = {
+    "article": draw_article_figure,
+    "year": draw_year_figure,
+    "controversy": lambda inputs: draw_controversy(**inputs),
+}
+
+
+def render_figure(figure):
+    """Draw one figure and save it in every requested format. Runs in a worker process."""
+    kind, name, inputs, paths = figure
+    fig = DRAWERS[kind](inputs)
+    for path in paths:
+        # The text under each chart sits outside the axes, so fit the image to everything drawn
+        fig.savefig(path, bbox_inches="tight")
+    plt.close(fig)
+    return name
+
+
+def load_manifest(out_dir):
+    path = os.path.join(out_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def save_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, MANIFEST)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=0, sort_keys=True)
+    os.replace(f"{path}.tmp", path)  # A crash never leaves a half-written manifest behind
+
+
+def render_all(
+    source="output.csv", out_dir="figures", formats=("png",), workers=None, force=False
+):
+    """Write every chart for `source` into `out_dir`. Returns (rendered, skipped) figure counts."""
+    loader = Loader(f"Loading {source}...").start()
+    data = load_sentiment_data(source)
+    manifest = {} if force else load_manifest(out_dir)
+
+    pending, keys, skipped = [], {}, 0
+    figures = chain(article_figures(data), year_figures(data), controversy_figures(data))
+    for kind, name, inputs in figures:
+        key = input_key(kind, inputs)
+        paths = [os.path.join(out_dir, f"{name}.{format}") for format in formats]
+        if manifest.get(name) == key and all(os.path.exists(path) for path in paths):
+            skipped += 1
+            continue
+        pending.append((kind, name, inputs, paths))
+        keys[name] = key
+
+    for directory in {os.path.dirname(path) for *_, paths in pending for path in paths}:
+        os.makedirs(directory, exist_ok=True)
+
+    workers = workers or os.cpu_count() or 1
+    # Hand figures to the workers in chunks; one at a time, pickling would cost more than drawing
+    chunksize = max(1, len(pending) // (workers * 4))
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for done, name in enumerate(
+                executor.map(render_figure, pending, chunksize=chunksize), start=1
+            ):
+                manifest[name] = keys[name]
+                loader.desc = f"Rendered {done}/{len(pending)} figures ({skipped} unchanged)..."
+    finally:
+        # Figures finished before an error are still recorded, so a rerun skips them
+        os.makedirs(out_dir, exist_ok=True)
+        save_manifest(out_dir, manifest)
+
+    loader.desc = f"Rendered {len(pending)} figures to {out_dir} ({skipped} unchanged)..."
+    loader.stop()
+    return len(pending), skipped
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--source", default="output.csv")
+    parser.add_argument("--out-dir", default="figures")
+    parser.add_argument("--format", nargs="+", choices=FORMATS, default=["png"])
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--force", action="store_true")
+    args = parser.parse_args()
+
+    render_all(
+        source=args.source,
+        out_dir=args.out_dir,
+        formats=args.format,
+        workers=args.workers,
+        force=args.force,
+    )
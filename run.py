@@ -6,38 +6,183 @@ This script coordinates the execution of our data collection pipeline.
 Workflow:
 - Sets up database.
 - Fetches articles from the New York Times.
-- Searches for related Reddit discussions.
-- Summarizes the articles and discussions.
+- Searches for related Reddit discussions until the search queue (jobs.py) is empty.
+- Summarizes the articles and discussions until the summary queue is empty.
 - Dumps all data into a CSV file for further analysis.
 
+Every stage runs inside this process, so the spaCy model is loaded once and a single database
+connection is shared by all stages. A checkpoint is saved to the database as each stage
+finishes, and an interrupted run resumes at the stage where it stopped.
+
+With `--streaming`, fetching, searching, scoring and summarizing run at once through the
+streaming pipeline in pipeline.py, and each article is summarized as soon as its Reddit search is
+done, before the export.
+
 Usage:
 - Run script directly to execute pipeline: `python run.py`
+- Ignore a saved checkpoint and start over: `python run.py --restart`
+- Don't reuse API responses from the local cache: `python run.py --no-cache`
+- Summarize on the local CPU instead of with Azure: `python run.py --summarizer textrank`
+- Score sentiment without spaCy: `python run.py --sentiment lexicon`
+- Run the stages at once, article by article: `python run.py --streaming --workers 4`
+- Record stage and API call timings (metrics.py): `python run.py --metrics metrics.jsonl --prometheus news.prom`
 """
 
-import subprocess
+import argparse
+from cache import get_cache
+from db import connect, DEFAULT_DB
+from setup import setup_database
+from get_articles import fetch_titles_from_nyt
+from search_reddit import search_reddit_for_articles, make_reddit_client
+from get_summaries import summarize_comments
+from dump_to_csv import dump_to_csv
+from jobs import count_open, SEARCH, SUMMARIZE
+from metrics import configure
+from pipeline import stream
+from sentiment import ENGINES, DEFAULT_ENGINE
+from summarizers import make_summarizer, SUMMARIZERS, DEFAULT_SUMMARIZER
+
+
+def drain(connection, queue, run_batch):
+    """Call `run_batch` until `queue` has no open jobs, or until a batch makes no progress."""
+    pending = count_open(connection, queue)
+    batch = 0
+    while pending:
+        batch += 1
+        print(f"Initiating batch {batch} ({pending} articles left)...")
+        run_batch()
+        remaining = count_open(connection, queue)
+        if remaining >= pending:
+            print(f"Last batch made no progress, leaving {remaining} articles for the next run.")
+            break
+        pending = remaining
+
+
+def articles_stage(connection, args):
+    fetch_titles_from_nyt(connection=connection, cache=args.cache)
+
+
+def search_stage(connection, args):
+    reddit_client = make_reddit_client()
+    drain(
+        connection,
+        SEARCH,
+        lambda: search_reddit_for_articles(
+            reddit_client,
+            workers=args.workers,
+            client_factory=make_reddit_client,
+            connection=connection,
+            cache=args.cache,
+        ),
+    )
+
+
+def summaries_stage(connection, args):
+    summarizer = make_summarizer(args.summarizer)
+    drain(
+        connection,
+        SUMMARIZE,
+        lambda: summarize_comments(
+            summarizer, connection=connection, cache=args.cache
+        ),
+    )
+
+
+def export_stage(connection, args):
+    dump_to_csv(connection=connection, sentiment=args.sentiment)
+
+
+def streaming_stage(connection, args):
+    stream(
+        connection=connection,
+        workers={"search": args.workers},
+        summarizer=make_summarizer(args.summarizer),
+        cache=args.cache,
+        sentiment=args.sentiment,
+    )
+
+
+# (checkpoint name, message, stage function), in the order they run
+STAGES = [
+    ("articles", "Fetching New York Times articles...", articles_stage),
+    (
+        "search",
+        "Searching for Reddit discussions related to fetched articles...",
+        search_stage,
+    ),
+    ("summaries", "Summarizing articles and Reddit discussions...", summaries_stage),
+    ("export", "Compiling all data into a single CSV file...", export_stage),
+]
+
+STREAMING_STAGES = [
+    (
+        "streaming",
+        "Fetching, searching, scoring and summarizing articles as they become ready...",
+        streaming_stage,
+    ),
+    ("export", "Compiling all data into a single CSV file...", export_stage),
+]
+
+
+def load_checkpoint(connection):
+    row = connection.execute(
+        "SELECT stage FROM pipeline_checkpoint WHERE id = 1"
+    ).fetchone()
+    return row[0] if row else None
+
+
+def save_checkpoint(connection, stage):
+    connection.execute(
+        "INSERT OR REPLACE INTO pipeline_checkpoint (id, stage, updated_at) VALUES (1, ?, CURRENT_TIMESTAMP)",
+        (stage,),
+    )
+    connection.commit()
+
+
+def clear_checkpoint(connection):
+    connection.execute("DELETE FROM pipeline_checkpoint")
+    connection.commit()
+
+
+def run_pipeline(args):
+    connection = connect(args.db)
 
-def main():
     print("Starting the setup process...")
-    subprocess.call(
-        "python3 setup.py", shell=True
-    )  # Use flag --clear to drop all tables
-
-    print("Fetching New York Times articles...")
-    subprocess.call("python3 get_articles.py", shell=True)
-
-    print("Searching for Reddit discussions related to fetched articles...")
-    for i in range(5):
-        print(f"Initiating search for batch {i + 1}/5...")
-        subprocess.call("python3 search_reddit.py", shell=True)
-    print("Reddit searches completed and data stored.")
-
-    print("Summarizing articles and Reddit discussions...")
-    subprocess.call("python3 get_summaries.py", shell=True)
-    print("Summaries generated and stored.")
-
-    print("Compiling all data into a single CSV file...")
-    subprocess.call("python3 dump_to_csv.py", shell=True)
-    print("Data compilation complete. CSV file ready.")
+    setup_database(connection=connection)
+
+    stages = STREAMING_STAGES if args.streaming else STAGES
+    names = [name for name, _, _ in stages]
+    completed = None if args.restart else load_checkpoint(connection)
+    start = names.index(completed) + 1 if completed in names else 0
+    if start:
+        print(f"Resuming interrupted run after the '{completed}' stage...")
+
+    for name, message, stage in stages[start:]:
+        print(message)
+        stage(connection, args)
+        save_checkpoint(connection, name)
+
+    clear_checkpoint(connection)
+    connection.close()
+    print("Pipeline complete. CSV file ready.")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument("--restart", action="store_true")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--summarizer", choices=sorted(SUMMARIZERS), default=DEFAULT_SUMMARIZER)
+    parser.add_argument("--sentiment", choices=sorted(ENGINES), default=DEFAULT_ENGINE)
+    parser.add_argument("--streaming", action="store_true")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--metrics", help="append every timing and count to this JSON-lines file")
+    parser.add_argument("--prometheus", help="write metric totals to this file on exit")
+    args = parser.parse_args()
+    configure(args.metrics, args.prometheus)
+    args.cache = None if args.no_cache else get_cache()
+
+    run_pipeline(args)
 
 
 if __name__ == "__main__":
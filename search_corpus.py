@@ -0,0 +1,155 @@
+"""
+search_corpus.py
+----------------
+This script searches everything collected so far: article titles, Reddit post titles and
+comments, through the FTS5 full-text indexes setup.py keeps in sync with them.
+
+Features:
+- Finds the articles, posts and comments that mention a query, best match first (bm25), with a
+  snippet of each match.
+- Narrows a search to the articles of one year.
+- Takes plain words by default, all of which must appear. With `--syntax`, takes FTS5 query
+  syntax: `OR`, `NOT`, "quoted phrases", `NEAR(...)` and `prefix*`.
+- `matching_comment_ids` lets get_summaries.py pick relevant comments in the index rather than in
+  Python (`--relevance index`).
+
+Usage:
+- What did Reddit say about something: `python search_corpus.py vaccine mandate`
+- Only comments, from one year: `python search_corpus.py "supreme court" --in comments --year 2021`
+- FTS5 syntax: `python search_corpus.py --syntax 'tariff* NOT steel' --limit 20`
+"""
+
+import argparse
+import re
+import sqlite3
+from db import open_db, DEFAULT_DB
+
+SNIPPET_WORDS = 16
+
+WORD = re.compile(r"\w+")
+
+
+def plain_query(text):
+    """FTS5 query matching every word of `text`, so punctuation is never read as syntax."""
+    return " ".join(f'"{word}"' for word in WORD.findall(text)) or None
+
+
+def _year_filter(year):
+    return ("AND substr(n.pub_date, 1, 4) = ?", (str(year),)) if year else ("", ())
+
+
+def search_articles(connection, query, limit=10, year=None):
+    """Return [(article_id, year, title with the matches marked)] for the articles matching `query`."""
+    where, params = _year_filter(year)
+    return connection.execute(
+        f"""
+        SELECT n.article_id, substr(n.pub_date, 1, 4), highlight(news_fts, 0, '[', ']')
+        FROM news_fts JOIN news n ON n.id = news_fts.rowid
+        WHERE news_fts MATCH ? {where}
+        ORDER BY rank LIMIT ?
+    """,
+        (query, *params, limit),
+    ).fetchall()
+
+
+def search_posts(connection, query, limit=10, year=None):
+    """Return [(article_id, year, article title, subreddit, post title with the matches marked)]."""
+    where, params = _year_filter(year)
+    return connection.execute(
+        f"""
+        SELECT n.article_id, substr(n.pub_date, 1, 4), n.title, p.subreddit,
+               highlight(reddit_posts_fts, 0, '[', ']')
+        FROM reddit_posts_fts
+        JOIN reddit_posts p ON p.id = reddit_posts_fts.rowid
+        JOIN news n ON n.article_id = p.article_id
+        WHERE reddit_posts_fts MATCH ? {where}
+        ORDER BY rank LIMIT ?
+    """,
+        (query, *params, limit),
+    ).fetchall()
+
+
+def search_comments(connection, query, limit=10, year=None):
+    """Return [(article_id, year, article title, subreddit, comment score, snippet)]."""
+    where, params = _year_filter(year)
+    return connection.execute(
+        f"""
+        SELECT n.article_id, substr(n.pub_date, 1, 4), n.title, p.subreddit, c.score,
+               snippet(reddit_comments_fts, 0, '[', ']', '...', {SNIPPET_WORDS})
+        FROM reddit_comments_fts
+        JOIN reddit_comments c ON c.id = reddit_comments_fts.rowid
+        JOIN reddit_posts p ON p.id = c.post_id
+        JOIN news n ON n.article_id = p.article_id
+        WHERE reddit_comments_fts MATCH ? {where}
+        ORDER BY rank LIMIT ?
+    """,
+        (query, *params, limit),
+    ).fetchall()
+
+
+SEARCHES = {
+    "articles": search_articles,
+    "posts": search_posts,
+    "comments": search_comments,
+}
+
+
+def matching_comment_ids(cursor, query, comment_ids):
+    """Return the subset of `comment_ids` whose comments match `query`.
+
+    The index is searched between the lowest and highest of the ids only, which are close
+    together when they belong to one article, so the lookup stays cheap however large the corpus
+    is. Results are not ranked, as bm25 would read every match in the corpus.
+    """
+    if not query or not comment_ids:
+        return set()
+    wanted = set(comment_ids)
+    cursor.execute(
+        """
+        SELECT rowid FROM reddit_comments_fts
+        WHERE reddit_comments_fts MATCH ? AND rowid BETWEEN ? AND ?
+    """,
+        (query, min(wanted), max(wanted)),
+    )
+    return {comment_id for (comment_id,) in cursor if comment_id in wanted}
+
+
+def print_results(kind, rows):
+    print(f"\n{kind.capitalize()} ({len(rows)}):")
+    for article_id, year, *fields in rows:
+        if kind == "comments":
+            title, subreddit, score, snippet = fields
+            print(f"  [{year or '----'}] article {article_id}: {title}")
+            print(f"      r/{subreddit}, {score} points: {snippet}")
+        elif kind == "posts":
+            title, subreddit, post_title = fields
+            print(f"  [{year or '----'}] article {article_id}: {title}")
+            print(f"      r/{subreddit}: {post_title}")
+        else:
+            print(f"  [{year or '----'}] article {article_id}: {fields[0]}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("query", nargs="+")
+    parser.add_argument("--db", default=DEFAULT_DB)
+    parser.add_argument("--in", dest="kinds", nargs="+", choices=list(SEARCHES), default=list(SEARCHES))
+    parser.add_argument("--year", type=int, help="only articles published in this year")
+    parser.add_argument("--limit", type=int, default=10, help="results of each kind")
+    parser.add_argument("--syntax", action="store_true", help="read the query as FTS5 syntax")
+    args = parser.parse_args()
+
+    text = " ".join(args.query)
+    query = text if args.syntax else plain_query(text)
+    if not query:
+        parser.error("the query has no words to search for")
+
+    with open_db(args.db) as connection:
+        for kind in args.kinds:
+            try:
+                rows = SEARCHES[kind](connection, query, args.limit, args.year)
+            except sqlite3.OperationalError as error:
+                if "no such table" in str(error):
+                    parser.error("the full-text indexes are missing, run `python setup.py` first")
+                parser.error(f"invalid query {text!r}: {error}")
+            print_results(kind, rows)
@@ -4,37 +4,78 @@ search_reddit.py
 This program searches Reddit for discussions related to articles fetched from the New York Times.
 
 Features:
-- Searches for the top relevant 5 Reddit posts and their 5 most relevant comments for each article.
-- Updates the database with Reddit titles, URLs, and top comments.
+- Searches for the top relevant 5 Reddit posts and their most relevant comments (5 by default)
+  for each article.
+- Updates the database with Reddit titles and URLs in `reddit_posts`, and each top comment with
+  its Reddit id, score and depth in `reddit_comments`.
+- Takes its articles from the `search` queue of the jobs table (jobs.py), so several searches can
+  run in parallel, in separate processes, without picking up the same article. An article's posts
+  are stored in the same transaction that completes its job, and searches that fail are retried
+  later with backoff.
 - Mark articles as `searched` in the database (news table) once they are processed.
+- Optionally searches for several articles at once with a pool of worker threads. All workers
+  share one rate limit budget, and only the main thread writes to the database.
+- Searches for each article's title keywords (keywords.py), which are extracted once per title
+  and stored in the database.
+- Search results are kept in the local response cache (cache.py) and reused for identical keywords.
+- Submissions already stored for another article, directly or as a crosspost, are linked to the
+  stored copy instead of being stored again, and comments that nearly repeat a stored comment are
+  linked to it (dedup.py).
 
 Usage:
 - Running script directly: `python search_reddit.py`
+- Concurrent search: `python search_reddit.py --workers 8 --limit 40`
+- Keep more comments per post: `python search_reddit.py --comments 10`
+- Skip the response cache: `python search_reddit.py --no-cache`
+- Store near-duplicate comments again: `python search_reddit.py --no-dedup`
 """
 
-import sqlite3
+import argparse
 import os
-import praw
-import spacy
-from utils import Loader
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from db import open_db, BulkWriter, DEFAULT_DB
+from dedup import Deduplicator, post_fingerprint, queue_index, COMMENT_ID
+from cache import get_cache
+from jobs import claim, ack, fail, article_titles, OWNS_LEASE, SEARCH
+from keywords import get_keywords
+from metrics import timer, increment
+from utils import Loader, RateLimiter
 from dotenv import load_dotenv
 
 load_dotenv()
 
-nlp = spacy.load("en_core_web_sm")
+# Reddit allows 100 queries per minute for each OAuth client
+REDDIT_REQUESTS_PER_MINUTE = 100
+
+DEFAULT_COMMENTS_PER_POST = 5
+
+
+def make_reddit_client():
+    import praw  # Only needed once a search actually starts
+
+    return praw.Reddit(
+        client_id=os.getenv("REDDIT_CLIENT_ID"),
+        client_secret=os.getenv("REDDIT_CLIENT_SECRET"),
+        user_agent="script by /u/si206",
+    )
+
+
+def search_errors():
+    """Errors a Reddit search fails with when Reddit or the network does, so it is retried later.
+    Anything else is a bug, and is raised."""
+    import praw.exceptions  # Imported here so that importing this module doesn't load PRAW
+    import prawcore
+    import requests
+
+    return (requests.RequestException, prawcore.PrawcoreException, praw.exceptions.PRAWException)
+
 
 def clean_comment(text):
     """Remove newlines and excessive whitespace from comments."""
     return " ".join(text.strip().split())
 
 
-def extract_keywords(title):
-    """Extracts keywords from the given title using SpaCy."""
-    doc = nlp(title)
-    keywords = [token.text for token in doc if token.pos_ in ["NOUN", "PROPN"]]
-    return " ".join(keywords)
-
-
 def truncate_description(title, max_length=100):
     """Truncate the title if it exceeds the maximum length allowed in the description"""
     if len(title) > max_length:
@@ -42,55 +83,293 @@ def truncate_description(title, max_length=100):
     return title
 
 
-def search_reddit_for_articles(reddit_client):
-    loader = Loader("Searching Reddit...").start()
-
-    connection = sqlite3.connect("news.db")
-    cursor = connection.cursor()
-
-    # Select the next 5 unprocessed articles
-    cursor.execute("SELECT article_id, title FROM news WHERE is_searched = 0 LIMIT 5")
-    articles = cursor.fetchall()
-
-    if articles:
-        for article in articles:
-            article_id, title = article
-            truncated_title = truncate_description(title)
-            keywords = extract_keywords(title)
-            loader.desc = f"Searching for Reddit posts and opinions related to article {article_id}: '{truncated_title}'"
-            search_results = reddit_client.subreddit("all").search(keywords, limit=5)
-
-            for submission in search_results:
-                submission.comments.replace_more(limit=0)
-                top_comments = submission.comments.list()[:5]
-                comments_text = [
-                    clean_comment(comment.body) for comment in top_comments
-                ] + [""] * (5 - len(top_comments))
-
-                cursor.execute(
-                    """
-                    INSERT INTO reddit_posts (article_id, reddit_title, reddit_url, comment1, comment2, comment3, comment4, comment5)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-                    (article_id, submission.title, submission.url, *comments_text),
-                )
+def search_posts(
+    reddit_client, keywords, rate_limiter, comments_per_post=DEFAULT_COMMENTS_PER_POST
+):
+    """Search Reddit for keywords and return [id, title, url, subreddit, comments] per post.
+
+    Each comment is [comment id, text, score, depth], most relevant first.
+    """
+    rate_limiter.acquire()
+    # PRAW listings are lazy, so the request is made while they are read
+    with timer("call_seconds", call="reddit_search"):
+        search_results = list(reddit_client.subreddit("all").search(keywords, limit=5))
+
+    posts = []
+    for submission in search_results:
+        rate_limiter.acquire()  # Fetching the comment tree is another request
+        with timer("call_seconds", call="reddit_replace_more"):
+            submission.comments.replace_more(limit=0)
+        top_comments = submission.comments.list()[:comments_per_post]
+        comments = [
+            [comment.id, clean_comment(comment.body), comment.score, comment.depth]
+            for comment in top_comments
+        ]
+        posts.append(
+            [
+                submission.id,
+                submission.title,
+                submission.url,
+                submission.subreddit.display_name,
+                comments,
+            ]
+        )
+    return posts
+
+
+def fetch_reddit_posts(
+    reddit_client,
+    article_id,
+    keywords,
+    rate_limiter,
+    cache=None,
+    comments_per_post=DEFAULT_COMMENTS_PER_POST,
+):
+    """Search Reddit for one article and return (article_id, id, title, url, subreddit, comments) per post."""
+    if cache is None:
+        posts = search_posts(reddit_client, keywords, rate_limiter, comments_per_post)
+    else:
+        posts = cache.fetch(
+            "reddit",
+            # "format" changes whenever the shape of a cached post does
+            {"search": keywords, "limit": 5, "comments": comments_per_post, "format": 3},
+            lambda: search_posts(reddit_client, keywords, rate_limiter, comments_per_post),
+        )
+    return [(article_id, *post) for post in posts]
+
+
+# Posts are only stored while the search job is still ours. A submission seen before, directly or
+# as a crosspost, points at the first copy through `duplicate_of`, and isn't stored twice for the
+# same article
+INSERT_POST = f"""
+    INSERT OR IGNORE INTO reddit_posts
+        (article_id, reddit_id, reddit_title, reddit_url, subreddit, fingerprint, duplicate_of)
+    SELECT ?, ?, ?, ?, ?, ?, (
+        SELECT id FROM reddit_posts WHERE fingerprint = ? AND duplicate_of IS NULL ORDER BY id LIMIT 1
+    )
+    WHERE {OWNS_LEASE}
+    AND NOT EXISTS (SELECT 1 FROM reddit_posts WHERE article_id = ? AND fingerprint = ?)"""
+
+# Comments find their post by its Reddit id, as post row ids aren't known until the flush. A
+# linked post's comments are read from the first copy, so they aren't stored
+INSERT_COMMENT = """
+    INSERT OR IGNORE INTO reddit_comments (post_id, position, comment_id, body, score, depth)
+    SELECT id, ?, ?, ?, ?, ? FROM reddit_posts
+    WHERE article_id = ? AND reddit_id = ? AND duplicate_of IS NULL"""
+
+# A near-duplicate comment keeps its place, score and depth, but not its text. Its original is
+# either a stored comment's row id or, if it was queued in this run, found by post and position.
+# Should the original not have been stored after all, the comment is stored with its text instead
+INSERT_DUPLICATE_COMMENT = f"""
+    INSERT OR IGNORE INTO reddit_comments
+        (post_id, position, comment_id, body, score, depth, duplicate_of)
+    SELECT p.id, ?, ?, CASE WHEN o.id IS NULL THEN ? ELSE '' END, ?, ?, o.id
+    FROM reddit_posts p, (SELECT COALESCE(?, ({COMMENT_ID})) AS id) o
+    WHERE p.article_id = ? AND p.reddit_id = ? AND p.duplicate_of IS NULL"""
 
-            cursor.execute(
-                "UPDATE news SET is_searched = 1 WHERE article_id = ?", (article_id,)
+
+def save_reddit_posts(writer, job, rows, deduplicator=None):
+    """Queue an article's posts, its `searched` flag and its job's ack, so all land in the same transaction.
+
+    With a `deduplicator` (dedup.py), comments that nearly repeat one already stored are linked to
+    it rather than stored again.
+    """
+    with writer.atomic():
+        for article_id, reddit_id, title, url, subreddit, comments in rows:
+            fingerprint = post_fingerprint(reddit_id, url)
+            writer.add(
+                INSERT_POST,
+                (
+                    article_id, reddit_id, title, url, subreddit, fingerprint, fingerprint,
+                    job.id, job.token, article_id, fingerprint,
+                ),  # fmt: skip
+            )
+            if deduplicator is not None and deduplicator.is_duplicate_post(fingerprint):
+                increment("items_total", stage="dedup", outcome="post")
+                continue
+            # A copy queued but not written yet may never be: the post is then stored as a first
+            # copy, and keeps its comments. Otherwise INSERT_COMMENT skips them
+            if deduplicator is None or deduplicator.is_queued_post(fingerprint):
+                writer.add_many(
+                    INSERT_COMMENT,
+                    (
+                        (position, *comment, article_id, reddit_id)
+                        for position, comment in enumerate(comments, start=1)
+                    ),
+                )
+                if deduplicator is not None:
+                    deduplicator.queue_post(writer, fingerprint)
+                continue
+            deduplicator.queue_post(writer, fingerprint)
+            checked = deduplicator.check_comments(
+                article_id, reddit_id, [body for _, body, _, _ in comments]
             )
+            for position, (comment, (original, signature, keys)) in enumerate(
+                zip(comments, checked), start=1
+            ):
+                comment_id, body, score, depth = comment
+                if original is None:
+                    writer.add(INSERT_COMMENT, (position, *comment, article_id, reddit_id))
+                    if signature is not None:
+                        queue_index(writer, article_id, reddit_id, position, signature, keys)
+                    continue
+                if isinstance(original, tuple):  # Queued earlier in this run
+                    stored_id, queued = None, original
+                else:
+                    stored_id, queued = original, (None, None, None)
+                writer.add(
+                    INSERT_DUPLICATE_COMMENT,
+                    (
+                        position, comment_id, body, score, depth, stored_id, *queued,
+                        article_id, reddit_id,
+                    ),  # fmt: skip
+                )
+                increment("items_total", stage="dedup", outcome="comment")
+        writer.add(
+            "UPDATE news SET is_searched = 1 WHERE article_id = ?", (job.article_id,)
+        )
+        ack(writer, job)
+
+
+def search_reddit_for_articles(
+    reddit_client,
+    limit=5,
+    workers=1,
+    client_factory=None,
+    rate_limiter=None,
+    db=DEFAULT_DB,
+    connection=None,
+    cache=None,
+    comments_per_post=DEFAULT_COMMENTS_PER_POST,
+    dedup=True,
+):
+    """Search Reddit for the next `limit` unsearched articles. Returns how many were searched.
+
+    `workers` searches run at once only with a `client_factory`, so each worker has its own client.
+    """
+    with open_db(db, connection) as connection:
+        return _search_reddit_for_articles(
+            connection,
+            reddit_client,
+            limit,
+            workers,
+            client_factory,
+            rate_limiter,
+            cache,
+            comments_per_post,
+            dedup,
+        )
+
+
+def _search_reddit_for_articles(
+    connection,
+    reddit_client,
+    limit,
+    workers,
+    client_factory,
+    rate_limiter,
+    cache,
+    comments_per_post,
+    dedup,
+):
+    loader = Loader("Searching Reddit...", stage="search").start()
+    rate_limiter = rate_limiter or RateLimiter(REDDIT_REQUESTS_PER_MINUTE)
+
+    # Lease the next batch of unprocessed articles
+    jobs = claim(connection, SEARCH, limit)
+
+    if jobs:
+        titles = article_titles(connection, jobs)
+        writer = BulkWriter(connection)
+        deduplicator = Deduplicator(connection) if dedup else None
+        # spaCy runs on the main thread only, in one batch, so workers just wait on Reddit
+        keywords = get_keywords(connection, [job.article_id for job in jobs])
+
+        errors = search_errors()
+
+        def save(job, fetch_rows):
+            try:
+                rows = fetch_rows()
+            except errors as error:
+                print(f"\nSearch for article {job.article_id} failed: {error}")
+                fail(writer, job, error)
+                increment("items_total", stage="search", outcome="failed")
+            else:
+                save_reddit_posts(writer, job, rows, deduplicator)
+                increment("items_total", stage="search", outcome="done")
+
+        # PRAW clients are not thread-safe, so without a factory to give each worker its own,
+        # searches run one at a time on the one client
+        if workers <= 1 or client_factory is None:
+            for job in jobs:
+                truncated_title = truncate_description(titles[job.article_id])
+                loader.desc = f"Searching for Reddit posts and opinions related to article {job.article_id}: '{truncated_title}'"
+                save(
+                    job,
+                    lambda: fetch_reddit_posts(
+                        reddit_client,
+                        job.article_id,
+                        keywords[job.article_id],
+                        rate_limiter,
+                        cache,
+                        comments_per_post,
+                    ),
+                )
+        else:
+            local = threading.local()
+
+            def fetch(article_id):
+                if not hasattr(local, "client"):
+                    local.client = client_factory()
+                return fetch_reddit_posts(
+                    local.client,
+                    article_id,
+                    keywords[article_id],
+                    rate_limiter,
+                    cache,
+                    comments_per_post,
+                )
+
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {
+                    executor.submit(fetch, job.article_id): job for job in jobs
+                }
+                for done, future in enumerate(as_completed(futures), start=1):
+                    job = futures[future]
+                    loader.desc = f"Searched Reddit for {done}/{len(jobs)} articles (latest: article {job.article_id})"
+                    # Single writer: results are stored here as each worker finishes
+                    save(job, future.result)
+        writer.flush()
 
     else:
         print("\nNo unsearched articles left.")
 
-    connection.commit()
-    connection.close()
-    loader.desc = f"Search for 5 New York Times articles on Reddit and getting 5 relevant comments (storing 25 elements in reddit_posts table)..."
+    loader.desc = f"Search for {len(jobs)} New York Times articles on Reddit and getting {comments_per_post} relevant comments (storing up to {len(jobs) * 5} posts in reddit_posts table)..."
     loader.stop()
+    return len(jobs)
 
 
 if __name__ == "__main__":
-    reddit_client = praw.Reddit(
-        client_id=os.getenv("REDDIT_CLIENT_ID"),
-        client_secret=os.getenv("REDDIT_CLIENT_SECRET"),
-        user_agent="script by /u/si206",
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--limit", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument(
+        "--requests-per-minute", type=int, default=REDDIT_REQUESTS_PER_MINUTE
+    )
+    parser.add_argument("--comments", type=int, default=DEFAULT_COMMENTS_PER_POST)
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument(
+        "--no-dedup", action="store_true", help="store near-duplicate comments again"
+    )
+    args = parser.parse_args()
+
+    search_reddit_for_articles(
+        make_reddit_client(),
+        limit=args.limit,
+        workers=args.workers,
+        client_factory=make_reddit_client,
+        rate_limiter=RateLimiter(args.requests_per_minute),
+        cache=None if args.no_cache else get_cache(),
+        comments_per_post=args.comments,
+        dedup=not args.no_dedup,
     )
-    search_reddit_for_articles(reddit_client)
@@ -0,0 +1,315 @@
+"""
+sentiment.py
+------------
+This file provides the sentiment engine used to score Reddit comments.
+
+Includes:
+- SentimentEngine: Scores comments in batches through `nlp.pipe()` on the shared spaCy/TextBlob
+                   pipeline from models.py.
+- LexiconEngine: Scores comments with TextBlob's word lexicon directly, without spaCy. A batch of
+                 comments is tokenized in one pass into a flat array of word ids, and scored with
+                 array lookups and per-comment sums in NumPy.
+- ENGINES / get_engine: Registry of engines by name, and the engine of each name shared by the
+                        whole process, loaded on first use.
+- update_comment_sentiment: Scores only comments that are new or changed since the last run
+                            (optionally only those on some articles) and stores them in the
+                            `comment_sentiment` table. Scores of comments that have since been
+                            emptied are deleted.
+
+Details:
+- LexiconEngine follows TextBlob's main rules: a comment's polarity is the mean over the words
+  found in the lexicon, an adverb before a word scales it by its intensity ("very good"), a
+  negation flips it to half strength ("not good"), "!" strengthens the word before it, and
+  emoticons set off by whitespace (":)", ":-(") count as words of their own. It skips negations
+  carried across short words ("not a good"), so scores agree closely but not exactly;
+  `python -m benchmarks.bench_sentiment` measures by how much.
+- Each score is stored with the name of the engine that produced it, so switching engines
+  rescores every comment once.
+- Comments linked to a near-duplicate (dedup.py) have no text and are not scored; their opinion
+  is counted once, at the comment they repeat. Linked submissions have no comments of their own
+  and share the scores of the first copy.
+"""
+
+import hashlib
+import re
+from importlib.metadata import version
+from itertools import chain, islice
+import numpy as np
+from metrics import timer, timed_iter, increment
+from models import load_nlp, pipes_except, SENTIMENT_PIPE
+
+DEFAULT_BATCH_SIZE = 256
+DEFAULT_N_PROCESS = 1
+
+# Only each post's first comments take part in the sentiment analysis
+SCORED_COMMENTS = 3
+
+
+class SentimentEngine:
+    name = "spacytextblob"
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, n_process=DEFAULT_N_PROCESS):
+        self.batch_size = batch_size
+        self.n_process = n_process
+        self.nlp = load_nlp()
+        # Polarity comes from TextBlob running over the raw text, so every trained
+        # component is switched off while scoring
+        self.disabled = pipes_except(self.nlp, SENTIMENT_PIPE)
+
+    @staticmethod
+    def analyzer_version():
+        """Version string stored with each score, read without loading the model."""
+        return "+".join(
+            f"{package}-{version(package)}"
+            for package in ("en_core_web_sm", "spacytextblob", "textblob")
+        )
+
+    def score(self, comments):
+        """Yield the polarity of each comment in the given iterable, in order."""
+        docs = self.nlp.pipe(
+            comments,
+            batch_size=self.batch_size,
+            n_process=self.n_process,
+            disable=self.disabled,
+        )
+        for doc in timed_iter(docs, "call_seconds", call="spacy_pipe"):
+            yield doc._.blob.polarity
+
+    def score_with_context(self, items):
+        """Yield (polarity, context) for each (comment, context) pair in the given iterable."""
+        docs = self.nlp.pipe(
+            items,
+            as_tuples=True,
+            batch_size=self.batch_size,
+            n_process=self.n_process,
+            disable=self.disabled,
+        )
+        for doc, context in timed_iter(docs, "call_seconds", call="spacy_pipe"):
+            yield doc._.blob.polarity, context
+
+
+# Words, with hyphenated words kept whole. Contractions are split apart the way TextBlob splits
+# them ("don't" -> "do", "n't") before tokenizing, which is cheaper than a lookahead
+WORD_TOKENS = r"[a-z]+(?:-[a-z]+)*|n't|!"
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class LexiconEngine:
+    name = "lexicon"
+    RULES_VERSION = 1  # Bumped whenever the scoring rules change, so every comment is rescored
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, n_process=DEFAULT_N_PROCESS):
+        from textblob._text import EMOTICONS
+        from textblob.en import sentiment as lexicon
+
+        self.batch_size = batch_size
+        self.n_process = n_process  # Unused; scoring a batch is cheaper than handing it off
+
+        # Id 0 stands for every word outside the lexicon
+        words = [None] + [word for word in lexicon.keys() if word]
+        self.ids = {word: i for i, word in enumerate(words)}
+        for word in (*lexicon.negations, "!"):
+            self.ids.setdefault(word, len(self.ids))
+        # Emoticons count as words of their own, when set off by whitespace. Like TextBlob, an
+        # all-letter token such as "xD" is never read as one
+        emoticons = {
+            emoticon.lower(): polarity
+            for (_, polarity), group in EMOTICONS.items()
+            for emoticon in group
+            if not emoticon.isalpha()
+        }
+        for emoticon in emoticons:
+            self.ids.setdefault(emoticon, len(self.ids))
+        alternatives = "|".join(
+            re.escape(emoticon) for emoticon in sorted(emoticons, key=len, reverse=True)
+        )
+        self.token = re.compile(rf"{WORD_TOKENS}|(?<!\S)(?:{alternatives})(?!\S)")
+        size = len(self.ids)
+
+        self.polarity = np.zeros(size)
+        self.intensity = np.ones(size)
+        self.known = np.zeros(size, dtype=bool)
+        self.modifier = np.zeros(size, dtype=bool)
+        for word, i in self.ids.items():
+            if word in lexicon:
+                self.polarity[i], _, self.intensity[i] = lexicon[word][None]
+                self.known[i] = True
+                self.modifier[i] = any(pos in lexicon[word] for pos in lexicon.modifiers)
+        for emoticon, polarity in emoticons.items():
+            self.polarity[self.ids[emoticon]] = polarity
+            self.known[self.ids[emoticon]] = True
+        self.negation = np.zeros(size, dtype=bool)
+        self.negation[[self.ids[word] for word in lexicon.negations]] = True
+        self.exclamation = np.zeros(size, dtype=bool)
+        self.exclamation[self.ids["!"]] = True
+
+    @classmethod
+    def analyzer_version(cls):
+        return f"textblob-{version('textblob')}+rules-{cls.RULES_VERSION}"
+
+    def score_batch(self, comments):
+        """Return the polarity of each comment in the list as an array."""
+        tokens = [
+            self.token.findall(comment.lower().replace("n't", " n't")) for comment in comments
+        ]
+        ids = np.fromiter(
+            (self.ids.get(token, 0) for token in chain.from_iterable(tokens)), dtype=np.intp
+        )
+        owner = np.repeat(np.arange(len(tokens)), [len(words) for words in tokens])
+        # follows[i]: token i comes right after token i - 1 in the same comment
+        follows = np.zeros(len(ids), dtype=bool)
+        follows[1:] = owner[1:] == owner[:-1]
+        previous = np.roll(ids, 1)
+
+        known = self.known[ids]
+        scores = self.polarity[ids]
+        negated = follows & self.negation[previous]
+        # "very good": a known adverb and the known word after it make one assessment
+        modified = follows & known & self.known[previous] & self.modifier[previous]
+        # "not very good": a negated adverb weakens the word instead of strengthening it
+        intensity = self.intensity[previous]
+        intensity = np.where(np.roll(negated, 1), 1 / intensity, intensity)
+        scores[modified] = np.clip(scores[modified] * intensity[modified], -1, 1)
+        assessed = known & ~np.roll(modified, -1)
+
+        # "not good" and "not very good" are slightly bad
+        scores[negated | (modified & np.roll(negated, 1))] *= -0.5
+
+        # "good!" is better
+        exclaimed = np.roll(follows & self.exclamation[ids], -1)
+        scores[exclaimed] = np.clip(scores[exclaimed] * 1.25, -1, 1)
+
+        totals = np.bincount(owner[assessed], weights=scores[assessed], minlength=len(tokens))
+        counts = np.bincount(owner[assessed], minlength=len(tokens))
+        return np.divide(totals, counts, out=np.zeros(len(tokens)), where=counts > 0)
+
+    def score(self, comments):
+        """Yield the polarity of each comment in the given iterable, in order."""
+        for batch in batches(comments, self.batch_size):
+            with timer("call_seconds", call="lexicon_score"):
+                scores = self.score_batch(batch)
+            yield from scores.tolist()
+
+    def score_with_context(self, items):
+        """Yield (polarity, context) for each (comment, context) pair in the given iterable."""
+        for batch in batches(items, self.batch_size):
+            with timer("call_seconds", call="lexicon_score"):
+                scores = self.score_batch([comment for comment, _ in batch])
+            yield from zip(scores.tolist(), (context for _, context in batch))
+
+
+ENGINES = {"spacytextblob": SentimentEngine, "lexicon": LexiconEngine}
+DEFAULT_ENGINE = "spacytextblob"
+
+_engines = {}
+
+
+def get_engine(
+    name=DEFAULT_ENGINE, batch_size=DEFAULT_BATCH_SIZE, n_process=DEFAULT_N_PROCESS
+):
+    """Return the process-wide sentiment engine called `name`, loading it only once."""
+    engine = _engines.get(name)
+    if engine is None:
+        engine = _engines[name] = ENGINES[name](batch_size=batch_size, n_process=n_process)
+    else:
+        engine.batch_size = batch_size
+        engine.n_process = n_process
+    return engine
+
+
+def comment_hash(text):
+    """Fingerprint of a comment's text, used to notice edits between runs."""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def pending_comments(connection, analyzer, analyzer_version, article_ids=None):
+    """Return (post_id, slot, comment) for every comment without an up-to-date score.
+
+    With `article_ids`, only the comments on those articles' posts are considered.
+    """
+    connection.create_function("comment_hash", 1, comment_hash, deterministic=True)
+    articles = ""
+    if article_ids is not None:
+        placeholders = ", ".join("?" * len(article_ids))
+        articles = f"AND c.post_id IN (SELECT id FROM reddit_posts WHERE article_id IN ({placeholders}))"
+    # A comment's slot in comment_sentiment is its position among its post's comments
+    cursor = connection.execute(
+        f"""
+        SELECT c.post_id, c.position, c.body
+        FROM reddit_comments c
+        LEFT JOIN comment_sentiment s ON s.post_id = c.post_id AND s.slot = c.position
+        WHERE c.position <= ? AND c.body != '' {articles}
+          AND (s.post_id IS NULL
+               OR s.analyzer != ?
+               OR s.analyzer_version != ?
+               OR s.comment_hash != comment_hash(c.body))
+        ORDER BY c.post_id, c.position
+    """,
+        (SCORED_COMMENTS, *(article_ids or ()), analyzer, analyzer_version),
+    )
+    return cursor.fetchall()
+
+
+def store_comment_scores(connection, analyzer, analyzer_version, scored):
+    """Store (polarity, (post_id, slot, comment)) pairs in comment_sentiment and commit."""
+    changes_before = connection.total_changes
+    connection.executemany(
+        """
+        INSERT OR REPLACE INTO comment_sentiment
+            (post_id, slot, analyzer, analyzer_version, comment_hash, polarity)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """,
+        (
+            (post_id, slot, analyzer, analyzer_version, comment_hash(comment), polarity)
+            for polarity, (post_id, slot, comment) in scored
+        ),
+    )
+    connection.commit()
+    increment("items_total", connection.total_changes - changes_before, stage="score", outcome="done")
+
+
+def delete_emptied_scores(connection, article_ids=None):
+    """Delete the scores of comments whose text is now empty, so they stop counting. Returns how many."""
+    articles = ""
+    if article_ids is not None:
+        placeholders = ", ".join("?" * len(article_ids))
+        articles = f"AND c.post_id IN (SELECT id FROM reddit_posts WHERE article_id IN ({placeholders}))"
+    cursor = connection.execute(
+        f"""
+        DELETE FROM comment_sentiment
+        WHERE (post_id, slot) IN (
+            SELECT c.post_id, c.position FROM reddit_comments c
+            WHERE COALESCE(c.body, '') = '' {articles}
+        )
+    """,
+        tuple(article_ids or ()),
+    )
+    connection.commit()
+    return cursor.rowcount
+
+
+def update_comment_sentiment(
+    connection,
+    batch_size=DEFAULT_BATCH_SIZE,
+    n_process=DEFAULT_N_PROCESS,
+    engine=DEFAULT_ENGINE,
+    article_ids=None,
+):
+    """Score new or changed comments and store them. Returns the number of comments scored."""
+    analyzer_version = ENGINES[engine].analyzer_version()
+    delete_emptied_scores(connection, article_ids)
+    pending = pending_comments(connection, engine, analyzer_version, article_ids)
+    if not pending:
+        return 0  # Nothing to do, so don't pay for loading the model
+
+    engine = get_engine(engine, batch_size=batch_size, n_process=n_process)
+    items = ((comment, (post_id, slot, comment)) for post_id, slot, comment in pending)
+    store_comment_scores(
+        connection, engine.name, analyzer_version, engine.score_with_context(items)
+    )
+    return len(pending)
@@ -1,29 +1,96 @@
 """
 setup.py
 --------
-This file initializes and/or resets the database for storing article and Reddit post data.
+This file initializes, upgrades and/or resets the database for storing article and Reddit post data.
 
 Includes:
-- Creates `news`, `reddit_posts`, and `article_summaries` tables in a SQLite database.
+- Creates `news`, `news_keywords`, `reddit_posts`, `reddit_comments`, `article_summaries`,
+  `comment_sentiment`, `pipeline_checkpoint` and `sentiment_stats` tables in a SQLite database.
+- Versioned migrations: the schema version is kept in SQLite's `user_version` pragma, and any
+  migrations newer than it are applied in order, so existing `news.db` files upgrade in place.
+- Indexes the foreign keys and the `is_searched` / `is_summarized` work queues.
+- Creates the `jobs` work queue table (see jobs.py) and the triggers that fill it.
+- Creates the `comment_minhash` and `comment_lsh` tables that dedup.py uses to find repeated
+  comments, and the `duplicate_of` links of repeated submissions and comments.
+- Creates FTS5 full-text indexes of article titles, Reddit post titles and comments, kept in sync
+  by triggers, for search_corpus.py and get_summaries.py.
 - Allows user to clear all existing data with the `--clear` flag when running the script.
 
 Usage:
-- To set up the database: `python setup.py`
+- To set up or upgrade the database: `python setup.py`
 - To clear all existing tables: `python setup.py --clear`
 """
 
 import sqlite3
 import argparse
+from db import open_db, DEFAULT_DB
 from utils import Loader
 
 
-def setup_database():
-    connection = sqlite3.connect("news.db")
-    cursor = connection.cursor()
-    loader = Loader("Setting up database...").start()
+def full_text_index(table, column):
+    """Statements that create `<table>_fts`, an FTS5 index of `column`, and keep it in sync.
 
-    cursor.execute(
-        """
+    The index stores no copy of the text (external content). Its triggers only fire when
+    `column` itself changes, so flag and counter updates don't touch it.
+    """
+    index = f"{table}_fts"
+    return [
+        f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {index} USING fts5(
+            {column}, content='{table}', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        );
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {index}_insert AFTER INSERT ON {table} BEGIN
+            INSERT INTO {index} (rowid, {column}) VALUES (NEW.id, NEW.{column});
+        END;
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {index}_delete AFTER DELETE ON {table} BEGIN
+            INSERT INTO {index} ({index}, rowid, {column}) VALUES ('delete', OLD.id, OLD.{column});
+        END;
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {index}_update AFTER UPDATE OF {column} ON {table} BEGIN
+            INSERT INTO {index} ({index}, rowid, {column}) VALUES ('delete', OLD.id, OLD.{column});
+            INSERT INTO {index} (rowid, {column}) VALUES (NEW.id, NEW.{column});
+        END;
+        """,
+        # Index the rows stored before the migration
+        f"INSERT INTO {index} ({index}) VALUES ('rebuild');",
+    ]
+
+
+def record_stats_buckets(posts):
+    """Statement that marks the year, month and subreddit buckets of some posts for refreshing.
+
+    `posts` is a query for the `article_id`, `pub_date` and `subreddit` of the posts involved.
+    The buckets are worked out while the rows still exist, as aggregates.py can't find them once
+    they are gone.
+    """
+    return f"""
+        INSERT OR IGNORE INTO sentiment_stats_dirty_buckets (grain, bucket)
+        SELECT grain, bucket FROM (
+            SELECT 'year' AS grain, CAST(COALESCE(
+                CAST(substr(p.pub_date, 1, 4) AS INTEGER), y.year
+            ) AS TEXT) AS bucket
+            FROM ({posts}) p LEFT JOIN sentiment_stats_years y ON y.article_id = p.article_id
+            UNION ALL SELECT 'month', substr(pub_date, 1, 7) FROM ({posts})
+            UNION ALL SELECT 'subreddit', subreddit FROM ({posts})
+        )
+        WHERE bucket IS NOT NULL;
+    """
+
+
+# Each migration is (version, description, statements). Append new migrations to the end;
+# never edit one that has already shipped.
+MIGRATIONS = [
+    (
+        1,
+        "Create base tables",
+        [
+            """
             CREATE TABLE IF NOT EXISTS news (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 article_id INTEGER UNIQUE,
@@ -32,10 +99,8 @@ def setup_database():
                 is_searched INTEGER DEFAULT 0,
                 is_summarized INTEGER DEFAULT 0
             );
-        """
-    )
-    cursor.execute(
-        """
+            """,
+            """
             CREATE TABLE IF NOT EXISTS reddit_posts (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 article_id INTEGER,
@@ -48,22 +113,437 @@ def setup_database():
                 comment5 TEXT,
                 FOREIGN KEY (article_id) REFERENCES news(article_id)
             );
-        """
-    )
-    cursor.execute(
-        """
+            """,
+            """
             CREATE TABLE IF NOT EXISTS article_summaries (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 article_id INTEGER,
                 summary TEXT,
                 FOREIGN KEY (article_id) REFERENCES news(article_id)
             );
-        """
-    )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS comment_sentiment (
+                post_id INTEGER,
+                slot INTEGER,
+                analyzer TEXT,
+                analyzer_version TEXT,
+                comment_hash TEXT,
+                polarity REAL,
+                PRIMARY KEY (post_id, slot),
+                FOREIGN KEY (post_id) REFERENCES reddit_posts(id)
+            );
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS pipeline_checkpoint (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                stage TEXT,
+                updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+            );
+            """,
+        ],
+    ),
+    (
+        2,
+        "Index foreign keys and work queues",
+        [
+            # Per-article lookups in get_summaries.py and sentiment.py
+            "CREATE INDEX IF NOT EXISTS idx_reddit_posts_article_id ON reddit_posts (article_id);",
+            "CREATE INDEX IF NOT EXISTS idx_article_summaries_article_id ON article_summaries (article_id);",
+            # Partial covering indexes that only hold queued articles, so polling the queue
+            # stays cheap however many articles have already been processed
+            """
+            CREATE INDEX IF NOT EXISTS idx_news_unsearched
+            ON news (article_id, title) WHERE is_searched = 0;
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS idx_news_unsummarized
+            ON news (article_id, title) WHERE is_summarized = 0;
+            """,
+            "ANALYZE;",
+        ],
+    ),
+    (
+        3,
+        "Store NYT document ids and publication dates",
+        [
+            "ALTER TABLE news ADD COLUMN nyt_uri TEXT;",
+            "ALTER TABLE news ADD COLUMN pub_date TEXT;",
+            # Articles fetched before this migration have no uri; NULLs never collide
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_news_nyt_uri ON news (nyt_uri);",
+        ],
+    ),
+    (
+        4,
+        "Materialize sentiment statistics per year, month and subreddit",
+        [
+            "ALTER TABLE reddit_posts ADD COLUMN subreddit TEXT;",
+            """
+            CREATE TABLE IF NOT EXISTS sentiment_stats (
+                grain TEXT,
+                bucket TEXT,
+                total REAL,
+                count INTEGER,
+                negative INTEGER,
+                neutral INTEGER,
+                positive INTEGER,
+                min_polarity REAL,
+                max_polarity REAL,
+                max_spread REAL,
+                max_spread_article_id INTEGER,
+                PRIMARY KEY (grain, bucket)
+            );
+            """,
+            # Posts whose comment scores changed since the statistics were last refreshed
+            """
+            CREATE TABLE IF NOT EXISTS sentiment_stats_dirty (
+                post_id INTEGER PRIMARY KEY
+            );
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS comment_sentiment_stats_insert
+            AFTER INSERT ON comment_sentiment BEGIN
+                INSERT OR IGNORE INTO sentiment_stats_dirty VALUES (NEW.post_id);
+            END;
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS comment_sentiment_stats_update
+            AFTER UPDATE ON comment_sentiment BEGIN
+                INSERT OR IGNORE INTO sentiment_stats_dirty VALUES (NEW.post_id);
+            END;
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS comment_sentiment_stats_delete
+            AFTER DELETE ON comment_sentiment BEGIN
+                INSERT OR IGNORE INTO sentiment_stats_dirty VALUES (OLD.post_id);
+            END;
+            """,
+            # Scores stored before this migration are picked up by the first refresh
+            "INSERT OR IGNORE INTO sentiment_stats_dirty SELECT DISTINCT post_id FROM comment_sentiment;",
+        ],
+    ),
+    (
+        5,
+        "Move the search and summary work queues into a jobs table",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                queue TEXT NOT NULL,
+                article_id INTEGER NOT NULL,
+                state TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                available_at REAL NOT NULL DEFAULT 0,
+                lease_owner TEXT,
+                lease_token TEXT,
+                lease_expires_at REAL,
+                last_error TEXT,
+                updated_at REAL,
+                UNIQUE (queue, article_id),
+                FOREIGN KEY (article_id) REFERENCES news(article_id)
+            );
+            """,
+            # Only open jobs are indexed, so claiming stays cheap as finished jobs pile up
+            """
+            CREATE INDEX IF NOT EXISTS idx_jobs_open
+            ON jobs (queue, id) WHERE state IN ('pending', 'leased');
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS news_enqueue_jobs
+            AFTER INSERT ON news BEGIN
+                INSERT OR IGNORE INTO jobs (queue, article_id)
+                SELECT 'search', NEW.article_id WHERE NEW.is_searched = 0;
+                INSERT OR IGNORE INTO jobs (queue, article_id)
+                SELECT 'summarize', NEW.article_id
+                WHERE NEW.is_searched = 1 AND NEW.is_summarized = 0;
+            END;
+            """,
+            # An article is summarized from its Reddit posts, so it waits for its search
+            """
+            CREATE TRIGGER IF NOT EXISTS jobs_enqueue_summary
+            AFTER UPDATE OF state ON jobs
+            WHEN NEW.queue = 'search' AND NEW.state = 'done' BEGIN
+                INSERT OR IGNORE INTO jobs (queue, article_id) VALUES ('summarize', NEW.article_id);
+            END;
+            """,
+            "INSERT OR IGNORE INTO jobs (queue, article_id) SELECT 'search', article_id FROM news WHERE is_searched = 0;",
+            """
+            INSERT OR IGNORE INTO jobs (queue, article_id)
+            SELECT 'summarize', article_id FROM news WHERE is_searched = 1 AND is_summarized = 0;
+            """,
+        ],
+    ),
+    (
+        6,
+        "Move Reddit comments into their own table",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS reddit_comments (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                post_id INTEGER NOT NULL,
+                position INTEGER NOT NULL,
+                comment_id TEXT,
+                body TEXT NOT NULL,
+                score INTEGER,
+                depth INTEGER,
+                UNIQUE (post_id, position),
+                FOREIGN KEY (post_id) REFERENCES reddit_posts(id)
+            );
+            """,
+            # Comments copied from the wide columns keep their slot as their position, which
+            # is also their key in comment_sentiment; empty padding slots are dropped
+            """
+            INSERT INTO reddit_comments (post_id, position, body)
+                SELECT id, 1, comment1 FROM reddit_posts WHERE comment1 IS NOT NULL AND comment1 != ''
+                UNION ALL
+                SELECT id, 2, comment2 FROM reddit_posts WHERE comment2 IS NOT NULL AND comment2 != ''
+                UNION ALL
+                SELECT id, 3, comment3 FROM reddit_posts WHERE comment3 IS NOT NULL AND comment3 != ''
+                UNION ALL
+                SELECT id, 4, comment4 FROM reddit_posts WHERE comment4 IS NOT NULL AND comment4 != ''
+                UNION ALL
+                SELECT id, 5, comment5 FROM reddit_posts WHERE comment5 IS NOT NULL AND comment5 != '';
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_reddit_comments_comment_id ON reddit_comments (comment_id);",
+            # SQLite can't drop columns before 3.35, so the table is rebuilt without them
+            """
+            CREATE TABLE reddit_posts_new (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                article_id INTEGER,
+                reddit_id TEXT,
+                reddit_title TEXT,
+                reddit_url TEXT,
+                subreddit TEXT,
+                FOREIGN KEY (article_id) REFERENCES news(article_id)
+            );
+            """,
+            """
+            INSERT INTO reddit_posts_new (id, article_id, reddit_title, reddit_url, subreddit)
+            SELECT id, article_id, reddit_title, reddit_url, subreddit FROM reddit_posts;
+            """,
+            "DROP TABLE reddit_posts;",
+            "ALTER TABLE reddit_posts_new RENAME TO reddit_posts;",
+            "CREATE INDEX IF NOT EXISTS idx_reddit_posts_article_id ON reddit_posts (article_id);",
+            # Lets comments find the post they belong to, and keeps a post from being stored
+            # twice for the same article. Posts migrated from the wide table have no Reddit id
+            """
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_reddit_posts_reddit_id
+            ON reddit_posts (article_id, reddit_id);
+            """,
+        ],
+    ),
+    (
+        7,
+        "Store title keywords",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS news_keywords (
+                article_id INTEGER PRIMARY KEY,
+                keywords TEXT,
+                analyzer_version TEXT,
+                FOREIGN KEY (article_id) REFERENCES news(article_id)
+            );
+            """,
+        ],
+    ),
+    (
+        8,
+        "Link duplicate submissions and comments",
+        [
+            "ALTER TABLE reddit_posts ADD COLUMN fingerprint TEXT",
+            "ALTER TABLE reddit_posts ADD COLUMN duplicate_of INTEGER REFERENCES reddit_posts(id)",
+            "ALTER TABLE reddit_comments ADD COLUMN duplicate_of INTEGER REFERENCES reddit_comments(id)",
+            "UPDATE reddit_posts SET fingerprint = reddit_id",
+            """
+            CREATE INDEX IF NOT EXISTS idx_reddit_posts_fingerprint
+            ON reddit_posts (fingerprint) WHERE duplicate_of IS NULL;
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS comment_minhash (
+                comment_id INTEGER PRIMARY KEY,
+                signature BLOB NOT NULL,
+                FOREIGN KEY (comment_id) REFERENCES reddit_comments(id)
+            );
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS comment_lsh (
+                band_key INTEGER NOT NULL,
+                comment_id INTEGER NOT NULL,
+                PRIMARY KEY (band_key, comment_id)
+            ) WITHOUT ROWID;
+            """,
+        ],
+    ),
+    (
+        9,
+        "Index article titles, post titles and comments for full-text search",
+        full_text_index("news", "title")
+        + full_text_index("reddit_posts", "reddit_title")
+        + full_text_index("reddit_comments", "body"),
+    ),
+    (
+        10,
+        "Keep sentiment statistics buckets of deleted scores, posts and articles",
+        [
+            # Buckets to refresh whose rows are gone, so they can't be found from a post id
+            """
+            CREATE TABLE IF NOT EXISTS sentiment_stats_dirty_buckets (
+                grain TEXT,
+                bucket TEXT,
+                PRIMARY KEY (grain, bucket)
+            ) WITHOUT ROWID;
+            """,
+            # The year each article without a publication date was counted in at the last
+            # refresh. It comes from the article's position, which inserts and deletes can move
+            """
+            CREATE TABLE IF NOT EXISTS sentiment_stats_years (
+                article_id INTEGER PRIMARY KEY,
+                year INTEGER NOT NULL
+            );
+            """,
+            "DROP TRIGGER IF EXISTS comment_sentiment_stats_delete;",
+            f"""
+            CREATE TRIGGER IF NOT EXISTS comment_sentiment_stats_delete
+            AFTER DELETE ON comment_sentiment BEGIN
+                {record_stats_buckets(
+                    "SELECT r.article_id, n.pub_date, r.subreddit FROM reddit_posts r "
+                    "LEFT JOIN news n ON n.article_id = r.article_id WHERE r.id = OLD.post_id"
+                )}
+            END;
+            """,
+            f"""
+            CREATE TRIGGER IF NOT EXISTS reddit_posts_stats_delete
+            AFTER DELETE ON reddit_posts BEGIN
+                {record_stats_buckets(
+                    "SELECT OLD.article_id AS article_id, OLD.subreddit AS subreddit, "
+                    "(SELECT pub_date FROM news WHERE article_id = OLD.article_id) AS pub_date"
+                )}
+            END;
+            """,
+            f"""
+            CREATE TRIGGER IF NOT EXISTS news_stats_delete
+            AFTER DELETE ON news BEGIN
+                {record_stats_buckets(
+                    "SELECT article_id, OLD.pub_date AS pub_date, subreddit FROM reddit_posts "
+                    "WHERE article_id = OLD.article_id"
+                )}
+            END;
+            """,
+        ],
+    ),
+    (
+        11,
+        "Count the comments of linked submissions for every article they were found for",
+        [
+            """
+            CREATE INDEX IF NOT EXISTS idx_reddit_posts_duplicate_of
+            ON reddit_posts (duplicate_of) WHERE duplicate_of IS NOT NULL;
+            """,
+            # A new link adds the first copy's scores to another article's buckets
+            """
+            CREATE TRIGGER IF NOT EXISTS reddit_posts_stats_link
+            AFTER INSERT ON reddit_posts WHEN NEW.duplicate_of IS NOT NULL BEGIN
+                INSERT OR IGNORE INTO sentiment_stats_dirty VALUES (NEW.duplicate_of);
+            END;
+            """,
+            # Scores of a first copy also count for the posts linked to it
+            "DROP TRIGGER IF EXISTS comment_sentiment_stats_delete;",
+            f"""
+            CREATE TRIGGER IF NOT EXISTS comment_sentiment_stats_delete
+            AFTER DELETE ON comment_sentiment BEGIN
+                {record_stats_buckets(
+                    "SELECT r.article_id, n.pub_date, r.subreddit FROM reddit_posts r "
+                    "LEFT JOIN news n ON n.article_id = r.article_id "
+                    "WHERE r.id = OLD.post_id OR r.duplicate_of = OLD.post_id"
+                )}
+            END;
+            """,
+            "DROP TRIGGER IF EXISTS reddit_posts_stats_delete;",
+            f"""
+            CREATE TRIGGER IF NOT EXISTS reddit_posts_stats_delete
+            AFTER DELETE ON reddit_posts BEGIN
+                {record_stats_buckets(
+                    "SELECT OLD.article_id AS article_id, OLD.subreddit AS subreddit, "
+                    "(SELECT pub_date FROM news WHERE article_id = OLD.article_id) AS pub_date "
+                    "UNION ALL "
+                    "SELECT r.article_id, r.subreddit, n.pub_date FROM reddit_posts r "
+                    "LEFT JOIN news n ON n.article_id = r.article_id WHERE r.duplicate_of = OLD.id"
+                )}
+            END;
+            """,
+            # Links stored before this migration are picked up by the first refresh
+            """
+            INSERT OR IGNORE INTO sentiment_stats_dirty
+            SELECT DISTINCT duplicate_of FROM reddit_posts WHERE duplicate_of IS NOT NULL;
+            """,
+        ],
+    ),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+TABLES = [
+    "sentiment_stats_years",
+    "sentiment_stats_dirty_buckets",
+    "news_fts",
+    "reddit_posts_fts",
+    "reddit_comments_fts",
+    "comment_lsh",
+    "comment_minhash",
+    "news_keywords",
+    "jobs",
+    "reddit_comments",
+    "sentiment_stats_dirty",
+    "sentiment_stats",
+    "comment_sentiment",
+    "article_summaries",
+    "reddit_posts",
+    "news",
+    "pipeline_checkpoint",
+]
+
+
+def get_schema_version(connection):
+    return connection.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(connection, target=SCHEMA_VERSION):
+    """Apply every migration newer than the database's schema version, up to `target`."""
+    applied = []
+    current = get_schema_version(connection)
+    for version, description, statements in MIGRATIONS:
+        if version <= current or version > target:
+            continue
+        # Each migration and its version bump commit together, or not at all. Work the caller
+        # left uncommitted is committed first, as BEGIN can't nest
+        if connection.in_transaction:
+            connection.commit()
+        connection.execute("BEGIN")
+        try:
+            for statement in statements:
+                connection.execute(statement)
+            connection.execute(f"PRAGMA user_version = {version}")
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        applied.append((version, description))
+    return applied
+
+
+def setup_database(db=DEFAULT_DB, connection=None):
+    with open_db(db, connection) as connection:
+        loader = Loader("Setting up database...", stage="setup").start()
+        for version, description in migrate(connection):
+            loader.desc = f"Applied migration {version}: {description}..."
+        loader.stop()
+
 
+def clear_database(connection):
+    for table in TABLES:
+        connection.execute(f"DROP TABLE IF EXISTS {table}")
+    connection.execute("PRAGMA user_version = 0")
     connection.commit()
-    connection.close()
-    loader.stop()
 
 
 if __name__ == "__main__":
@@ -72,11 +552,9 @@ if __name__ == "__main__":
     args = parser.parse_args()
 
     if args.clear:
-        connection = sqlite3.connect("news.db")
-        cursor = connection.cursor()
-        cursor.execute("DROP TABLE IF EXISTS reddit_posts")
-        cursor.execute("DROP TABLE IF EXISTS news")
-        cursor.execute("DROP TABLE IF EXISTS article_summaries")
+        connection = sqlite3.connect(DEFAULT_DB)
+        clear_database(connection)
+        connection.close()
         print("Cleared existing tables.")
     else:
         setup_database()
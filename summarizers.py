@@ -0,0 +1,206 @@
+"""
+summarizers.py
+--------------
+This file provides the backends get_summaries.py can summarize articles with.
+
+Includes:
+- AzureSummarizer: Sends documents to Azure's extractive summarization in batches of up to 25, and
+                   keeps several long-running requests in flight at once. The Azure client is only
+                   created when the first batch is sent, so no credentials are needed until then.
+- TextRankSummarizer: Summarizes on the local CPU with no network access or credentials. Sentences
+                      are compared by the cosine similarity of their TF-IDF vectors, and ranked by
+                      TextRank (PageRank over the similarity graph), computed with NumPy. The
+                      TF-IDF vectors are SciPy sparse matrices, as each sentence only uses a
+                      few of the document's words.
+- SUMMARIZERS / make_summarizer: Registry of backends by name.
+
+Every backend has a `summarize(documents)` method that takes `{"id": ..., "text": ...}` dicts and
+yields `(id, summary, error)` for each document as it finishes, with `error` set to None on
+success. `cache_source` names the response cache namespace for backends whose summaries are
+worth caching, and is None for the rest.
+
+The Azure SDK is only imported once an Azure client is made or a batch is sent, so the TextRank
+backend and the command line help never pay for it.
+"""
+
+import os
+import re
+from collections import deque
+from itertools import chain
+import numpy as np
+from dotenv import load_dotenv
+from metrics import timer
+
+load_dotenv()
+
+# The Language service accepts at most 25 documents per extractive summarization request
+MAX_DOCUMENTS_PER_REQUEST = 25
+DEFAULT_IN_FLIGHT = 4
+DEFAULT_SENTENCES = 1
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+WORD = re.compile(r"\w+")
+
+
+def make_azure_client():
+    from azure.ai.textanalytics import TextAnalyticsClient
+    from azure.core.credentials import AzureKeyCredential
+
+    return TextAnalyticsClient(
+        endpoint=os.getenv("AZURE_LANGUAGE_ENDPOINT"),
+        credential=AzureKeyCredential(os.getenv("AZURE_LANGUAGE_KEY")),
+    )
+
+
+class AzureSummarizer:
+    cache_source = "azure"
+
+    def __init__(
+        self,
+        client=None,
+        batch_size=MAX_DOCUMENTS_PER_REQUEST,
+        in_flight=DEFAULT_IN_FLIGHT,
+        sentences=DEFAULT_SENTENCES,
+    ):
+        self._client = client
+        self.batch_size = min(batch_size, MAX_DOCUMENTS_PER_REQUEST)
+        self.in_flight = in_flight
+        self.sentences = sentences
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = make_azure_client()
+        return self._client
+
+    def summarize(self, documents):
+        from azure.ai.textanalytics import ExtractiveSummaryAction
+        from azure.core.exceptions import AzureError
+
+        batches = [
+            documents[start : start + self.batch_size]
+            for start in range(0, len(documents), self.batch_size)
+        ]
+
+        # Start each batch as a long-running operation and only block on the oldest one once
+        # `in_flight` operations are outstanding, or once every batch has been started
+        pollers = deque()
+        for index, batch in enumerate(batches):
+            try:
+                with timer("call_seconds", call="azure_submit"):
+                    poller = self.client.begin_analyze_actions(
+                        batch, actions=[ExtractiveSummaryAction(max_sentence_count=self.sentences)]
+                    )
+            except AzureError as error:
+                yield from self._fail_batch(batch, error)
+            else:
+                pollers.append((batch, poller))
+            while pollers and (len(pollers) >= self.in_flight or index == len(batches) - 1):
+                batch, poller = pollers.popleft()
+                try:
+                    with timer("call_seconds", call="azure_poll"):
+                        results = poller.result()
+                except AzureError as error:
+                    yield from self._fail_batch(batch, error)
+                else:
+                    yield from self._read_results(results)
+
+    def _fail_batch(self, batch, error):
+        print(f"\nSummary request failed: {error}")
+        for document in batch:
+            yield document["id"], None, str(error)
+
+    def _read_results(self, results):
+        # One result list per action; each summary is matched back to its article by document id
+        for result in results:
+            for summary_result in result:
+                if summary_result.is_error:
+                    error = f"{summary_result.code} - {summary_result.message}"
+                    print(f"Error: {error}")
+                    yield summary_result.id, None, error
+                else:
+                    summary = "".join(sentence.text for sentence in summary_result.sentences)
+                    yield summary_result.id, summary, None
+
+
+def split_sentences(text):
+    return [sentence for sentence in SENTENCE_END.split(text.strip()) if sentence]
+
+
+def tfidf_vectors(sentences):
+    """Unit-length TF-IDF vectors of `sentences`, one row each, as a sparse matrix."""
+    from scipy.sparse import csr_matrix  # Only needed once TextRank summarizes something
+
+    tokens = [WORD.findall(sentence.lower()) for sentence in sentences]
+    vocabulary = {}
+    term_ids = np.fromiter(
+        (vocabulary.setdefault(word, len(vocabulary)) for word in chain.from_iterable(tokens)),
+        dtype=np.intp,
+    )
+    rows = np.repeat(np.arange(len(tokens)), [len(words) for words in tokens])
+    # Term counts of every sentence at once. Each sentence only holds a few of the document's
+    # words, so only those are stored; repeated (sentence, term) pairs are summed
+    counts = csr_matrix(
+        (np.ones(len(term_ids)), (rows, term_ids)), shape=(len(tokens), len(vocabulary))
+    )
+    counts.sum_duplicates()
+
+    document_frequency = np.bincount(counts.indices, minlength=len(vocabulary))
+    idf = np.log((1 + len(sentences)) / (1 + document_frequency)) + 1
+    counts.data *= idf[counts.indices]
+    norms = np.sqrt(np.asarray(counts.multiply(counts).sum(axis=1)).ravel())
+    counts.data /= np.repeat(norms, np.diff(counts.indptr))
+    return counts
+
+
+def textrank(similarity, damping=0.85, iterations=100, tolerance=1e-6):
+    """PageRank scores of the graph with edge weights `similarity`, by power iteration."""
+    n = len(similarity)
+    np.fill_diagonal(similarity, 0)
+    weights = similarity.sum(axis=1)
+    transition = np.divide(
+        similarity, weights[:, None], out=np.zeros_like(similarity), where=weights[:, None] > 0
+    )
+    dangling = weights == 0  # Sentences sharing no words with any other spread their rank evenly
+    scores = np.full(n, 1 / n)
+    for _ in range(iterations):
+        updated = (1 - damping) / n + damping * (
+            scores @ transition + scores[dangling].sum() / n
+        )
+        if np.abs(updated - scores).sum() < tolerance:
+            return updated
+        scores = updated
+    return scores
+
+
+class TextRankSummarizer:
+    cache_source = None  # Cheaper to recompute than to look up
+
+    def __init__(self, sentences=DEFAULT_SENTENCES):
+        self.sentences = sentences
+
+    def summarize_text(self, text):
+        sentences = split_sentences(text)
+        if len(sentences) <= self.sentences:
+            return " ".join(sentences)
+        vectors = tfidf_vectors(sentences)
+        scores = textrank((vectors @ vectors.T).toarray())
+        # Best sentences first, earlier ones winning ties, then put back in their original order
+        best = sorted(np.argsort(-scores, kind="stable")[: self.sentences])
+        return " ".join(sentences[index] for index in best)
+
+    def summarize(self, documents):
+        for document in documents:
+            summary = self.summarize_text(document["text"])
+            if summary:
+                yield document["id"], summary, None
+            else:
+                yield document["id"], None, "nothing to summarize"
+
+
+SUMMARIZERS = {"azure": AzureSummarizer, "textrank": TextRankSummarizer}
+DEFAULT_SUMMARIZER = "azure"
+
+
+def make_summarizer(name, **options):
+    return SUMMARIZERS[name](**options)
@@ -6,20 +6,32 @@ This file includes utility functions and classes used elsewhere in the project.
 Includes:
 - Loader: A class to display a spinner in the command line interface during operations.
           Uses threading to manage the spinner without blocking main program execution.
+          When output isn't a terminal (batch jobs, redirected logs) it runs quietly: no spinner
+          thread and no redraws, just the end message. Given a `stage` name, it also records
+          how long the stage ran in the shared metrics (metrics.py).
+- RateLimiter: A thread-safe token bucket that keeps API calls within a provider's quota, even
+               when several worker threads share it.
 - color: A class providing terminal color codes because I'm lazy and don't want to type them.
 """
 
+import sys
+import time
 from itertools import cycle
 from shutil import get_terminal_size
-from threading import Thread, Event
+from threading import Thread, Event, Lock
+from metrics import observe
 
 class Loader:
-    def __init__(self, desc="Loading...", end="{task} complete.", timeout=0.1):
+    def __init__(self, desc="Loading...", end="{task} complete.", timeout=0.1, quiet=None, stage=None):
         self._desc = desc
         self.end = end
         self.timeout = timeout
+        # Spinning only makes sense on a terminal; elsewhere it would fill logs with redraws
+        self.quiet = not sys.stdout.isatty() if quiet is None else quiet
+        self.stage = stage
 
-        self._thread = Thread(target=self._animate, daemon=True)
+        self._thread = None
+        self._started = None
         self.steps = cycle(["⢿", "⣻", "⣽", "⣾", "⣷", "⣯", "⣟", "⡿"])
         self.done = False
         self.paused = Event()
@@ -35,9 +47,13 @@ class Loader:
         self.update_desc_event.set()  # Signal that description has been updated
 
     def start(self):
+        self._started = time.perf_counter()
+        if self.quiet:
+            return self
         cols = get_terminal_size((80, 20)).columns  # Get width of the terminal
         print("\r" + " " * cols, end="", flush=True)  # Clear line
         self.paused.clear()
+        self._thread = Thread(target=self._animate, daemon=True)
         self._thread.start()
         return self
 
@@ -61,19 +77,47 @@ class Loader:
 
     def stop(self):
         self.done = True
+        if self.stage is not None and self._started is not None:
+            observe("stage_seconds", time.perf_counter() - self._started, stage=self.stage)
+        end_message = self.end.format(task=self.desc)
+        if self.quiet:
+            print(end_message, flush=True)
+            return
         self.resume()  # Resume to allow the thread to complete
         cols = get_terminal_size((80, 20)).columns  # Get the width of the terminal
         print("\r" + " " * cols, end="", flush=True)  # Clear the line
-        end_message = self.end.format(task=self.desc)
         print(f"\r{end_message}", flush=True)
 
     def __enter__(self):
-        self.start()
+        return self.start()
 
     def __exit__(self, exc_type, exc_value, tb):
         self.stop()
 
 
+class RateLimiter:
+    def __init__(self, rate, period=60.0, burst=1):
+        self.rate = rate / period  # Tokens added per second
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = Lock()
+
+    def acquire(self):
+        """Block until the caller may make one more call."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            # A negative balance reserves a future slot, so waiting callers queue up fairly
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+
 # For fancy CLI formatting.
 # Access with color.<attribute> + "string" + color.END
 class color: